@@ -0,0 +1,275 @@
+"""
+Offline benchmark of the enrollment and verification endpoints.
+
+Usage:
+    python -m app.benchmark --output bench.json
+    python -m app.benchmark --iterations 20 --concurrency 4 --baseline bench-baseline.json
+
+The FastAPI app is called in-process through httpx's ASGI transport (no server or network), with the
+images in images/train and images/test plus synthetic ones: a 12 MP upscale of a train image (reduced-scale
+decode path) and face-free noise frames (decode + empty detection). Train images are enrolled first into a
+separate collection (--collection, dropped afterwards unless --keep-collection), and the result cache is
+disabled unless --cache is given, so every request runs the models.
+
+For each endpoint the report has p50/p95/p99 latency, throughput and status codes; for each endpoint's
+requests, the same percentiles per pipeline stage (decode, detect, embed, spoof, search, store) from
+app.services.stage_timing. Results are written as JSON; with --baseline, latencies more than --tolerance
+above the baseline (or throughput that much below) are reported as regressions and the exit code is 1.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Sequence
+
+DEFAULT_METRICS = ("p50_ms", "p95_ms")
+POSES = ["frontal", "left", "right", "up", "down"]
+
+
+@dataclass
+class Scenario:
+    """One endpoint under test: every entry of `requests` is a set of httpx request arguments (files, data, params)."""
+    name: str
+    method: str
+    path: str
+    requests: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _jpeg(rgb, quality: int = 90) -> bytes:
+    import cv2
+    ok, buf = cv2.imencode(".jpg", rgb[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode synthetic image.")
+    return buf.tobytes()
+
+
+def synthetic_images(face_image: Optional[bytes] = None, seed: int = 0) -> Dict[str, bytes]:
+    """JPEG-encoded synthetic inputs: face-free noise frames at webcam and photo sizes and, from a face image, a 12 MP upscale."""
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    images = {
+        f"noise_{w}x{h}.jpg": _jpeg(cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (0, 0), 3))
+        for w, h in ((640, 480), (1920, 1080))
+    }
+    if face_image is not None:
+        from app.services.image_decoding import decode_image_bytes
+        rgb = decode_image_bytes(face_image)
+        images["face_4000x3000.jpg"] = _jpeg(cv2.resize(rgb, (4000, 3000), interpolation=cv2.INTER_CUBIC))
+    return images
+
+
+def build_scenarios(train: Dict[str, bytes], test: Dict[str, bytes], synthetic: Dict[str, bytes]) -> List[Scenario]:
+    """Benchmark scenarios over the given {filename: bytes} image sets; train images are enrolled by create_profile."""
+    def upload(field_name: str, name: str, contents: bytes) -> tuple:
+        return (field_name, (name, contents, "image/jpeg"))
+
+    probes = {**test, **synthetic}
+    user_ids = [f"bench-{os.path.splitext(name)[0]}" for name in train]
+    scenarios = [
+        Scenario("create_profile", "POST", "/v1/create-profile", [
+            {"files": [upload("file", name, contents)], "data": {"user_id": user_id, "name": user_id}}
+            for (name, contents), user_id in zip(train.items(), user_ids)
+        ]),
+        Scenario("verify_profile", "POST", "/v1/verify-profile", [
+            {"files": [upload("file", name, contents)]} for name, contents in probes.items()
+        ]),
+        Scenario("verify_claimed", "POST", "/v1/verify-profile/{user_id}", [
+            {"files": [upload("file", name, contents)], "path": {"user_id": user_id}}
+            for (name, contents), user_id in zip(train.items(), user_ids)
+        ]),
+        Scenario("verify_batch", "POST", "/v1/verify-profile/batch", [
+            {"files": [upload("files", name, contents) for name, contents in probes.items()]}
+        ]),
+        Scenario("enroll_qc", "POST", "/enroll/qc/frontal", [
+            {"files": [upload("frame", name, contents)]} for name, contents in {**train, **synthetic}.items()
+        ]),
+    ]
+    if len(train) >= len(POSES):
+        frames = list(train.items())[: len(POSES)]
+        scenarios.append(Scenario("create_profile_5poses", "POST", "/v1/profile-create-5poses/upload", [
+            {"files": [upload(pose, name, contents) for pose, (name, contents) in zip(POSES, frames)], "data": {"name": "bench-5poses"}}
+        ]))
+    return scenarios
+
+
+async def run_scenario(client, scenario: Scenario, iterations: int = 1, concurrency: int = 1, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Send the scenario's requests `iterations` times, at most `concurrency` in flight, after `warmup`
+    untimed requests. Returns endpoint latency percentiles, throughput, status counts and per-stage timings.
+    """
+    from app.services.stage_timing import stage_timings, summarize
+
+    async def send(kwargs: Dict[str, Any]) -> tuple:
+        kwargs = dict(kwargs)
+        path = scenario.path.format(**kwargs.pop("path", {}))
+        start = time.perf_counter()
+        response = await client.request(scenario.method, path, **kwargs)
+        return time.perf_counter() - start, response.status_code
+
+    for kwargs in scenario.requests[:warmup]:
+        await send(kwargs)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(kwargs: Dict[str, Any]) -> tuple:
+        async with semaphore:
+            return await send(kwargs)
+
+    stage_timings.reset()
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(bounded(kwargs) for _ in range(max(1, iterations)) for kwargs in scenario.requests))
+    wall = time.perf_counter() - started
+    statuses: Dict[str, int] = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "endpoint": f"{scenario.method} {scenario.path}",
+        "latency": summarize(latency for latency, _ in outcomes),
+        "throughput_rps": len(outcomes) / wall if wall > 0 else 0.0,
+        "status_counts": statuses,
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stage_timings.samples().items())},
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1, metrics: Sequence[str] = DEFAULT_METRICS) -> List[str]:
+    """Regressions of `results` against `baseline`: latencies (endpoint and stage) or throughput worse by more than `tolerance`."""
+    regressions = []
+
+    def check(label: str, current: Dict[str, Any], reference: Dict[str, Any]) -> None:
+        for metric in metrics:
+            if metric in current and reference.get(metric):
+                if current[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(f"{label} {metric}: {reference[metric]:.1f} -> {current[metric]:.1f}")
+
+    for name, reference in baseline.get("scenarios", {}).items():
+        current = results.get("scenarios", {}).get(name)
+        if current is None:
+            continue
+        check(name, current["latency"], reference["latency"])
+        if reference.get("throughput_rps") and current["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {reference['throughput_rps']:.2f} -> {current['throughput_rps']:.2f}")
+        for stage, stage_reference in reference.get("stages", {}).items():
+            if stage in current.get("stages", {}):
+                check(f"{name} [{stage}]", current["stages"][stage], stage_reference)
+    return regressions
+
+
+def format_report(results: Dict[str, Any]) -> str:
+    """Human-readable table of the endpoint and stage percentiles."""
+    lines = [f"{'scenario':<28}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}  status"]
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency"]
+        lines.append(
+            f"{name:<28}{latency.get('count', 0):>6}{latency.get('p50_ms', 0):>10.1f}{latency.get('p95_ms', 0):>10.1f}"
+            f"{latency.get('p99_ms', 0):>10.1f}{scenario['throughput_rps']:>9.2f}  {scenario['status_counts']}"
+        )
+        for stage, stats in scenario["stages"].items():
+            lines.append(
+                f"  {stage:<26}{stats.get('count', 0):>6}{stats.get('p50_ms', 0):>10.1f}{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}"
+            )
+    return "\n".join(lines)
+
+
+def _images(pattern: str) -> Dict[str, bytes]:
+    return {os.path.basename(path): _read(path) for path in sorted(glob.glob(pattern))}
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    from app.config import settings
+    from app.main import app
+    from app.services.chromadb_service import chromadb_service
+
+    train = _images(os.path.join(args.train_dir, "*"))
+    test = _images(os.path.join(args.test_dir, "*"))
+    synthetic = synthetic_images(next(iter(train.values()), None)) if args.synthetic else {}
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    scenarios = [s for s in build_scenarios(train, test, synthetic) if selected is None or s.name in selected]
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "images": {"train": len(train), "test": len(test), "synthetic": len(synthetic)},
+            "settings": {key: getattr(settings, key) for key in (
+                "DET_SIZE", "QC_DET_SIZE", "DECODE_MIN_SIDE", "INFERENCE_BATCHING", "INFERENCE_EXECUTOR",
+                "INFERENCE_WORKERS", "ORT_INTRA_OP_THREADS", "RESULT_CACHE_SIZE",
+            )},
+        },
+        "scenarios": {},
+    }
+    try:
+        # The ASGI transport does not send lifespan events, so run the app's startup/shutdown (model loading) here
+        async with app.router.lifespan_context(app):
+            # Models load in the background at startup; measure warm workers only, as /ready would
+            await asyncio.to_thread(app.state.lifecycle.wait)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                for scenario in scenarios:
+                    if not scenario.requests:
+                        continue
+                    # Enrollment runs once, so the gallery holds each train image a single time
+                    iterations = 1 if scenario.name.startswith("create_profile") else args.iterations
+                    results["scenarios"][scenario.name] = await run_scenario(client, scenario, iterations, args.concurrency, warmup=0 if iterations == 1 else 1)
+                    print(f"{scenario.name}: done", file=sys.stderr)
+    finally:
+        if not args.keep_collection:
+            chromadb_service.client.delete_collection(chromadb_service.collection_name)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the face enrollment/verification endpoints in-process.")
+    parser.add_argument("--train-dir", default="images/train", help="Images enrolled before the verification scenarios.")
+    parser.add_argument("--test-dir", default="images/test", help="Probe images for verification.")
+    parser.add_argument("--no-synthetic", dest="synthetic", action="store_false", help="Skip the synthetic images.")
+    parser.add_argument("--scenarios", help="Comma-separated subset of scenarios to run.")
+    parser.add_argument("--iterations", type=int, default=5, help="Times each scenario's request set is sent.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once.")
+    parser.add_argument("--collection", default="benchmark_profiles", help="ChromaDB collection used for the run.")
+    parser.add_argument("--keep-collection", action="store_true", help="Do not drop the benchmark collection afterwards.")
+    parser.add_argument("--cache", action="store_true", help="Keep the result cache enabled.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against the JSON results of an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before a regression is flagged.")
+    parser.add_argument("--metrics", default=",".join(DEFAULT_METRICS), help="Latency metrics compared with the baseline.")
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time, so the isolation overrides must be in place before the app is imported
+    os.environ["CHROMA_COLLECTION"] = args.collection
+    if not args.cache:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+
+    results = asyncio.run(_run(args))
+    print(format_report(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.metrics.split(","))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
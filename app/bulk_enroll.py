@@ -0,0 +1,254 @@
+"""
+Bulk enrollment of an image directory or CSV manifest into ChromaDB.
+
+Usage:
+    python -m app.bulk_enroll images/train
+    python -m app.bulk_enroll --manifest employees.csv --checkpoint employees.ckpt
+
+A directory is walked recursively; an image directly under it is enrolled with its file stem as
+user_id, an image inside a sub-directory with the sub-directory name. A manifest is a CSV of
+path,user_id,name rows (header optional, relative paths resolve against the manifest's folder).
+
+Images flow through a pipeline: a thread pool reads and decodes the next batch while the current
+one is analyzed (detection per image, recognition batched over all faces), anti-spoofing runs on
+the same pool, and accepted embeddings are written with chunked collection.add calls. Each finished
+batch is appended to the checkpoint file, so an interrupted run resumes where it stopped. Embedding
+ids are uuid5 of the image path, so the same image always maps to the same id. With CASCADE_ENABLED the
+light gallery of the verification cascade is filled alongside.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+@dataclass
+class EnrollItem:
+    path: str
+    user_id: Optional[str] = None
+    name: Optional[str] = None
+
+
+def iter_directory(root: str) -> Iterator[EnrollItem]:
+    """Images under `root` in a stable order, labelled by sub-directory name or file stem."""
+    root = os.path.abspath(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+            user_id = stem if dirpath == root else os.path.relpath(dirpath, root).replace(os.sep, "/")
+            yield EnrollItem(path=os.path.join(dirpath, filename), user_id=user_id)
+
+
+def iter_manifest(manifest: str) -> Iterator[EnrollItem]:
+    """Rows of a path,user_id,name CSV; a header row naming a `path` column is skipped."""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="") as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].strip().lower() == "path":
+                continue
+            fields = [value.strip() or None for value in row] + [None, None]
+            path = fields[0] if os.path.isabs(fields[0]) else os.path.join(base, fields[0])
+            yield EnrollItem(path=path, user_id=fields[1], name=fields[2])
+
+
+def embedding_id(item: EnrollItem) -> str:
+    """Deterministic id for an image, so re-enrolling the same file cannot create a duplicate id."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(item.path)))
+
+
+class Checkpoint:
+    """Append-only record of processed image paths (one `status<TAB>path` line each)."""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    status, _, item_path = line.rstrip("\n").partition("\t")
+                    if item_path:
+                        self.done.add(item_path)
+
+    def __contains__(self, item: EnrollItem) -> bool:
+        return os.path.abspath(item.path) in self.done
+
+    def mark(self, outcomes: Dict[str, str]) -> None:
+        """Record a finished batch of {path: status}."""
+        paths = {os.path.abspath(path): status for path, status in outcomes.items()}
+        self.done.update(paths)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.writelines(f"{status}\t{path}\n" for path, status in paths.items())
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _load(item: EnrollItem):
+    """Read and decode one image; None when the file is unreadable or not an image."""
+    from app.services.image_decoding import DecodedImage
+    try:
+        with open(item.path, "rb") as f:
+            return DecodedImage.from_bytes(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _batches(items: Iterable[EnrollItem], size: int) -> Iterator[List[EnrollItem]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def enroll(
+    items: Iterable[EnrollItem],
+    service,
+    spoof_model=None,
+    analyze: Optional[Callable] = None,
+    batch_size: int = 64,
+    workers: int = 4,
+    checkpoint: Optional[Checkpoint] = None,
+    cascade=None,
+) -> Dict[str, int]:
+    """
+    Enroll every item not already in the checkpoint. Returns counts per outcome:
+    enrolled, skipped (checkpointed), invalid_image, no_face, multiple_faces, spoof and error.
+    Anti-spoofing is skipped when no spoof model is given. With a cascade (app.services.model_cascade),
+    light-pack embeddings of the same faces are stored in its light gallery under the same ids.
+    """
+    from app.services.logging_config import setup_logging
+    from app.services.spoof_model import analyze_spoof_face
+    logger = setup_logging()
+    if analyze is None:
+        from app.services.facial_analysis import analyze_faces as analyze
+    checkpoint = checkpoint or Checkpoint(None)
+    counts = {"enrolled": 0, "skipped": 0, "invalid_image": 0, "no_face": 0, "multiple_faces": 0, "spoof": 0, "error": 0}
+
+    def pending() -> Iterator[EnrollItem]:
+        for item in items:
+            if item in checkpoint:
+                counts["skipped"] += 1
+            else:
+                yield item
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="enroll") as pool:
+        batches = _batches(pending(), max(1, batch_size))
+        batch = next(batches, None)
+        decoding = [pool.submit(_load, item) for item in batch] if batch else []
+        while batch:
+            images = [future.result() for future in decoding]
+            # Start decoding the next batch while this one runs through the models
+            next_batch = next(batches, None)
+            decoding = [pool.submit(_load, item) for item in next_batch] if next_batch else []
+
+            outcomes: Dict[str, str] = {}
+            valid = [i for i, image in enumerate(images) if image is not None]
+            for i in set(range(len(batch))) - set(valid):
+                outcomes[batch[i].path] = "invalid_image"
+            analyses = analyze([images[i] for i in valid]) if valid else []
+            accepted = []
+            for i, profile_data in zip(valid, analyses):
+                error = profile_data.get("error")
+                if error is None:
+                    accepted.append((i, profile_data))
+                elif error.startswith("No face"):
+                    outcomes[batch[i].path] = "no_face"
+                elif error.startswith("Multiple faces"):
+                    outcomes[batch[i].path] = "multiple_faces"
+                else:
+                    outcomes[batch[i].path] = "error"
+
+            if spoof_model is not None and accepted:
+                spoof_results = list(pool.map(lambda entry: analyze_spoof_face(spoof_model, images[entry[0]], entry[1]["face"]), accepted))
+            else:
+                spoof_results = [{} for _ in accepted]
+
+            ids, embeddings, metadatas, enrolled = [], [], [], []
+            created_at = datetime.now(UTC).isoformat()
+            for (i, profile_data), spoof_result in zip(accepted, spoof_results):
+                item = batch[i]
+                if spoof_model is not None and spoof_result.get("dominant_spoof") != "Real":
+                    outcomes[item.path] = "spoof"
+                    continue
+                metadata = {
+                    "filename": os.path.basename(item.path),
+                    "age": spoof_result.get("age"),
+                    "dominant_gender": spoof_result.get("dominant_gender"),
+                    "created_at": created_at,
+                    "user_id": item.user_id,
+                    "name": item.name,
+                }
+                ids.append(embedding_id(item))
+                embeddings.append(profile_data["embedding"])
+                metadatas.append({k: v for k, v in metadata.items() if v is not None})
+                if cascade is not None:
+                    enrolled.append((images[i], profile_data["face"]))
+                outcomes[item.path] = "enrolled"
+            if ids:
+                service.add_embeddings(ids, embeddings, metadatas)
+                if cascade is not None:
+                    from app.services.model_cascade import light_embeddings
+                    cascade.store(ids, light_embeddings(*zip(*enrolled)), metadatas)
+            checkpoint.mark(outcomes)
+            for status in outcomes.values():
+                counts[status] += 1
+
+            processed = sum(counts.values()) - counts["skipped"]
+            elapsed = time.monotonic() - started
+            logger.info(f"Bulk enrollment: {processed} images processed ({processed / max(elapsed, 1e-9):.1f}/s), {counts['enrolled']} enrolled")
+            batch = next_batch
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Enroll a directory or CSV manifest of face images into ChromaDB.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="Directory of images to enroll.")
+    source.add_argument("--manifest", help="CSV of path,user_id,name rows.")
+    parser.add_argument("--checkpoint", help="Checkpoint file recording processed images, for resuming.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode/anti-spoofing threads.")
+    parser.add_argument("--skip-spoof", action="store_true", help="Do not run the anti-spoofing check.")
+    args = parser.parse_args(argv)
+
+    from app.config import settings
+    from app.services.chromadb_service import chromadb_service
+    from app.services.logging_config import setup_logging
+    from app.services.model_cascade import model_cascade
+    from app.services.spoof_model import load_spoof_model
+    logger = setup_logging()
+
+    items = iter_manifest(args.manifest) if args.manifest else iter_directory(args.directory)
+    spoof_model = None if args.skip_spoof else load_spoof_model()
+    if spoof_model is None and not args.skip_spoof:
+        logger.error("Spoof model could not be loaded; pass --skip-spoof to enroll without anti-spoofing.")
+        return 1
+    started = time.monotonic()
+    counts = enroll(
+        items,
+        chromadb_service,
+        spoof_model=spoof_model,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        checkpoint=Checkpoint(args.checkpoint),
+        cascade=model_cascade if settings.CASCADE_ENABLED else None,
+    )
+    logger.info(f"Bulk enrollment finished in {time.monotonic() - started:.1f}s: {counts}")
+    print(counts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
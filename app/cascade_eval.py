@@ -0,0 +1,122 @@
+"""
+Error rates of the verification cascade's reject bound on labelled image pairs.
+
+Usage:
+    python -m app.cascade_eval --images images/train,images/test
+    python -m app.cascade_eval --images faces/by_user --bounds 0.3,0.35,0.4,0.45 --report cascade_report.json
+
+Images are labelled as app.bulk_enroll labels them (sub-directory name, else file stem), so two images are
+a genuine pair when they share a label. For every ordered pair the reference is enrolled as the routes
+enroll it (buffalo_l detection, light-pack template of that face) and the probe is analyzed by the light
+pack, giving the light score the cascade screens; the buffalo_l score of the same pair gives the decision
+without the cascade. For each candidate CASCADE_REJECT_SIMILARITY the report gives the share of pairs the
+light pack rejects, the genuine pairs it rejects (false-reject rate) and the buffalo_l matches it
+overturns. The light pack never accepts, so the false-accept rate is buffalo_l's, also reported.
+"""
+import argparse
+import itertools
+import json
+import sys
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_BOUNDS = "0.25,0.3,0.35,0.4,0.45,0.5"
+
+
+def _cosine(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def bound_report(pairs: Sequence[Dict[str, Any]], bounds: Sequence[float]) -> Dict[str, Any]:
+    """Rates per reject bound for pairs of {"genuine": bool, "light": light score, "heavy": buffalo_l score}."""
+    from app.services.model_cascade import MATCH_SIMILARITY, REJECT, cascade_decision
+    genuine = [p for p in pairs if p["genuine"]]
+    impostor = [p for p in pairs if not p["genuine"]]
+    heavy_matches = [p for p in pairs if p["heavy"] > MATCH_SIMILARITY]
+    rate = lambda count, total: round(count / total, 4) if total else None
+    report = {
+        "pairs": {"genuine": len(genuine), "impostor": len(impostor)},
+        "heavy": {
+            "false_accept_rate": rate(sum(p["heavy"] > MATCH_SIMILARITY for p in impostor), len(impostor)),
+            "false_reject_rate": rate(sum(p["heavy"] <= MATCH_SIMILARITY for p in genuine), len(genuine)),
+        },
+        "bounds": {},
+    }
+    for bound in bounds:
+        rejected = lambda p: cascade_decision(p["light"], reject=bound) == REJECT
+        report["bounds"][str(bound)] = {
+            "light_reject_rate": rate(sum(map(rejected, pairs)), len(pairs)),
+            "false_reject_rate": rate(sum(map(rejected, genuine)), len(genuine)),
+            "overturned_heavy_matches": sum(map(rejected, heavy_matches)),
+        }
+    return report
+
+
+def score_pairs(labels: Dict[str, str], heavy: Dict[str, List[float]], light_templates: Dict[str, List[float]], light_probes: Dict[str, List[float]]) -> List[Dict[str, Any]]:
+    """Light and buffalo_l cosine scores of every ordered pair of distinct images analyzed by both tiers."""
+    names = sorted(set(heavy) & set(light_templates) & set(light_probes))
+    return [
+        {"reference": ref, "probe": probe, "genuine": labels[ref] == labels[probe],
+         "light": _cosine(light_templates[ref], light_probes[probe]), "heavy": _cosine(heavy[ref], heavy[probe])}
+        for ref, probe in itertools.permutations(names, 2)
+    ]
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    heavy = report["heavy"]
+    lines = [
+        f"Pairs: {report['pairs']['genuine']} genuine, {report['pairs']['impostor']} impostor; "
+        f"buffalo_l FAR {heavy['false_accept_rate']}, FRR {heavy['false_reject_rate']}",
+        f"{'bound':<8}{'light rejects':>15}{'FRR':>10}{'overturned':>12}",
+    ]
+    for bound, metrics in report["bounds"].items():
+        lines.append(f"{bound:<8}{metrics['light_reject_rate']!s:>15}{metrics['false_reject_rate']!s:>10}{metrics['overturned_heavy_matches']:>12}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the cascade reject bound's error rates on labelled image pairs.")
+    parser.add_argument("--images", default="images/train,images/test", help="Comma-separated directories of labelled face images.")
+    parser.add_argument("--bounds", default=DEFAULT_BOUNDS, help="Comma-separated CASCADE_REJECT_SIMILARITY candidates.")
+    parser.add_argument("--report", default="cascade_report.json", help="Where to save the report.")
+    args = parser.parse_args(argv)
+
+    from insightface.app.common import Face
+    from app.bulk_enroll import iter_directory
+    from app.services.facial_analysis import analyze_face, analyze_face_light, embed_detected_face_light
+    from app.services.image_decoding import DecodedImage
+    log = lambda line: print(line, file=sys.stderr)
+
+    labels, heavy, light_templates, light_probes = {}, {}, {}, {}
+    for directory in args.images.split(","):
+        for item in iter_directory(directory):
+            try:
+                with open(item.path, "rb") as f:
+                    image = DecodedImage.from_bytes(f.read())
+            except (OSError, ValueError):
+                continue
+            labels[item.path] = item.user_id
+            profile_data = analyze_face(image)
+            if "error" not in profile_data:
+                heavy[item.path] = profile_data["embedding"]
+                light_templates[item.path] = embed_detected_face_light(image, Face(profile_data["face"]))
+            light_data = analyze_face_light(image)
+            if "error" not in light_data:
+                light_probes[item.path] = light_data["embedding"]
+    pairs = score_pairs(labels, heavy, light_templates, light_probes)
+    if not pairs:
+        log(f"No image pair with a face for both tiers in {args.images}")
+        return 1
+    report = {"created_at": datetime.now(UTC).isoformat(), **bound_report(pairs, [float(b) for b in args.bounds.split(",")]), "scores": pairs}
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(format_report(report))
+    log(f"Saved to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
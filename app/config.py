@@ -4,6 +4,11 @@ Loads settings from environment variables with sensible defaults.
 """
 import os
 
+def _size(value: str) -> tuple:
+    """Parse a detector input size such as "640,640" or "640" into (width, height)."""
+    parts = [int(p) for p in value.replace("x", ",").split(",") if p.strip()]
+    return (parts[0], parts[-1])
+
 class Settings:
     API_VERSION: str = os.environ.get("API_VERSION", "v1")
     HOST: str = os.environ.get("HOST", "127.0.0.1")
@@ -12,6 +17,78 @@ class Settings:
     LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
     RELOAD: bool = os.environ.get("RELOAD", "True").lower() == "true"
     CHROMA_COLLECTION: str = os.environ.get("CHROMA_COLLECTION", "face_profiles")
+    # Cross-request micro-batching of InsightFace inference (requests submit from the event loop, so batches are not capped by INFERENCE_WORKERS)
+    INFERENCE_BATCHING: bool = os.environ.get("INFERENCE_BATCHING", "False").lower() == "true"
+    INFERENCE_MAX_BATCH_SIZE: int = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", 8))
+    INFERENCE_MAX_WAIT_MS: float = float(os.environ.get("INFERENCE_MAX_WAIT_MS", 5))
+    # Executor for CPU-bound model work: "thread" or "process"; 0 workers = cores capped at 4
+    INFERENCE_EXECUTOR: str = os.environ.get("INFERENCE_EXECUTOR", "thread").lower()
+    INFERENCE_WORKERS: int = int(os.environ.get("INFERENCE_WORKERS", 0))
+    # Multi-worker server and per-worker thread budgets (0 = library default)
+    WORKERS: int = int(os.environ.get("WORKERS", 1))
+    ORT_INTRA_OP_THREADS: int = int(os.environ.get("ORT_INTRA_OP_THREADS", 0))
+    ORT_INTER_OP_THREADS: int = int(os.environ.get("ORT_INTER_OP_THREADS", 0))
+    TF_INTRA_OP_THREADS: int = int(os.environ.get("TF_INTRA_OP_THREADS", 0))
+    TF_INTER_OP_THREADS: int = int(os.environ.get("TF_INTER_OP_THREADS", 0))
+    # Anti-spoofing input: "frame" (full-resolution frame) or "crop" (aligned face crop, experimental: not yet evaluated
+    # with app.spoof_eval, for lack of spoof samples and model weights where it was built; see the README)
+    SPOOF_INPUT: str = os.environ.get("SPOOF_INPUT", "frame").lower()
+    # Shared ChromaDB server; leave unset to use the embedded persistent store
+    CHROMA_HOST: str = os.environ.get("CHROMA_HOST", "")
+    CHROMA_PORT: int = int(os.environ.get("CHROMA_PORT", 8001))
+    # Seconds between checks that the in-memory gallery still matches the collection (0 = never)
+    GALLERY_SYNC_INTERVAL: float = float(os.environ.get("GALLERY_SYNC_INTERVAL", 5))
+    # Maximum number of images accepted by /verify-profile/batch
+    VERIFY_BATCH_MAX_FILES: int = int(os.environ.get("VERIFY_BATCH_MAX_FILES", 64))
+    # How a probe's similarities to a profile's pose vectors are fused: "max" or "mean"
+    POSE_FUSION: str = os.environ.get("POSE_FUSION", "max")
+    # Detector input size (width,height) for recognition paths and for the per-pose QC fast path
+    DET_SIZE: tuple = _size(os.environ.get("DET_SIZE", "640,640"))
+    QC_DET_SIZE: tuple = _size(os.environ.get("QC_DET_SIZE", os.environ.get("DET_SIZE", "640,640")))
+    # Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale while the longest side stays >= this (0 = always full size)
+    DECODE_MIN_SIDE: int = int(os.environ.get("DECODE_MIN_SIDE", 800))
+    # Content-hash cache of face analysis/anti-spoofing results (0 entries disables it);
+    # RESULT_CACHE_DIR adds an on-disk tier shared by all workers
+    RESULT_CACHE_SIZE: int = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+    RESULT_CACHE_TTL: float = float(os.environ.get("RESULT_CACHE_TTL", 300))
+    RESULT_CACHE_DIR: str = os.environ.get("RESULT_CACHE_DIR", "")
+    # Most files kept in the disk tier; expired and then oldest files are removed by periodic sweeps
+    RESULT_CACHE_DISK_MAX_ENTRIES: int = int(os.environ.get("RESULT_CACHE_DISK_MAX_ENTRIES", 10000))
+    # Server-side enrollment sessions: seconds of inactivity before expiry, and maximum live sessions
+    ENROLL_SESSION_TTL: float = float(os.environ.get("ENROLL_SESSION_TTL", 900))
+    ENROLL_SESSION_MAX: int = int(os.environ.get("ENROLL_SESSION_MAX", 1000))
+    # Directory shared by all workers for enrollment sessions (needed when WORKERS > 1); defaults under RESULT_CACHE_DIR
+    ENROLL_SESSION_DIR: str = os.environ.get("ENROLL_SESSION_DIR", os.path.join(os.environ["RESULT_CACHE_DIR"], "enroll_sessions") if os.environ.get("RESULT_CACHE_DIR") else "")
+    # Enrollment QC on the face region: ROI side in pixels and the quality thresholds
+    QC_ROI_SIZE: int = int(os.environ.get("QC_ROI_SIZE", 192))
+    QC_BLUR_MIN: float = float(os.environ.get("QC_BLUR_MIN", 100))
+    QC_BRIGHTNESS_MIN: float = float(os.environ.get("QC_BRIGHTNESS_MIN", 70))
+    QC_BRIGHTNESS_MAX: float = float(os.environ.get("QC_BRIGHTNESS_MAX", 180))
+    QC_CONTRAST_MIN: float = float(os.environ.get("QC_CONTRAST_MIN", 10))
+    QC_CLIPPED_MAX: float = float(os.environ.get("QC_CLIPPED_MAX", 0.3))
+    # ONNX Runtime session tuning: graph optimization ("disable", "basic", "extended", "all"), execution mode
+    # ("sequential", "parallel"), CPU memory arena and memory pattern planning. ORT_TUNING_FILE points to the
+    # per-model settings saved by `python -m app.ort_autotune`; explicitly set ORT_* variables take precedence
+    ORT_GRAPH_OPTIMIZATION: str = os.environ.get("ORT_GRAPH_OPTIMIZATION", "all").lower()
+    ORT_EXECUTION_MODE: str = os.environ.get("ORT_EXECUTION_MODE", "sequential").lower()
+    ORT_CPU_MEM_ARENA: bool = os.environ.get("ORT_CPU_MEM_ARENA", "True").lower() == "true"
+    ORT_MEM_PATTERN: bool = os.environ.get("ORT_MEM_PATTERN", "True").lower() == "true"
+    ORT_TUNING_FILE: str = os.environ.get("ORT_TUNING_FILE", "")
+    # Model precision: "fp32" (the InsightFace files) or "int8" (the detection and recognition models quantized by
+    # `python -m app.quantize_models`, read from INT8_MODEL_DIR, default ~/.insightface/models/<pack>_int8).
+    # Models without a quantized file keep their FP32 version. EXPERIMENTAL: no evaluation report of int8 accuracy,
+    # latency or memory exists yet; keep fp32 in production until `--evaluate` has been run on the target hardware
+    MODEL_PRECISION: str = os.environ.get("MODEL_PRECISION", "fp32").lower()
+    INT8_MODEL_DIR: str = os.environ.get("INT8_MODEL_DIR", "")
+    # Verification cascade: a light pack (detection + recognition) screens probes against a light gallery kept
+    # side by side with the main one (same ids and metadata). Cosine scores below CASCADE_REJECT_SIMILARITY are
+    # rejected from the light pack; everything else, every match included, is decided by buffalo_l.
+    # EXPERIMENTAL: the bound's false-reject rate (`python -m app.cascade_eval`) and the speed-up are unmeasured
+    CASCADE_ENABLED: bool = os.environ.get("CASCADE_ENABLED", "False").lower() == "true"
+    CASCADE_LIGHT_PACK: str = os.environ.get("CASCADE_LIGHT_PACK", "buffalo_s")
+    CASCADE_LIGHT_DET_SIZE: tuple = _size(os.environ.get("CASCADE_LIGHT_DET_SIZE", os.environ.get("DET_SIZE", "640,640")))
+    CASCADE_LIGHT_COLLECTION: str = os.environ.get("CASCADE_LIGHT_COLLECTION", f"{CHROMA_COLLECTION}_light")
+    CASCADE_REJECT_SIMILARITY: float = float(os.environ.get("CASCADE_REJECT_SIMILARITY", 0.35))
     # Add more config as needed
 
 settings = Settings()
@@ -0,0 +1,166 @@
+"""
+ONNX Runtime autotuner for the InsightFace model pack.
+
+Usage:
+    python -m app.ort_autotune --output ort_tuning.json
+    python -m app.ort_autotune --workers 4 --threads 1,2,4,8 --output ort_tuning.json
+    ORT_TUNING_FILE=ort_tuning.json poetry run uvicorn app.main:app
+
+Each model file of the pack is timed on this machine with every combination of intra-op threads,
+graph optimization level and execution mode (inter-op threads 1, or 2 in parallel mode), on blank inputs at
+the serving shapes: the detector at DET_SIZE, the per-face heads at their input size with a batch of
+--batch crops. The fastest combination per model (median latency) is written to the output file, which
+session_options() applies when ORT_TUNING_FILE points to it. Run it on the target hardware, with --workers
+set to the number of server workers so the thread counts stay within each worker's share of the cores.
+"""
+import argparse
+import glob
+import json
+import os
+import os.path as osp
+import statistics
+import sys
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_OPT_LEVELS = ("extended", "all")
+DEFAULT_MODES = ("sequential", "parallel")
+
+
+def thread_candidates(cores: int, workers: int = 1) -> List[int]:
+    """Powers of two up to each worker's share of the cores, plus the share itself."""
+    budget = max(1, cores // max(1, workers))
+    candidates = {budget}
+    threads = 1
+    while threads < budget:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def candidate_grid(threads: Iterable[int], opt_levels: Sequence[str] = DEFAULT_OPT_LEVELS, modes: Sequence[str] = DEFAULT_MODES) -> List[Dict[str, Any]]:
+    """Session configurations to try; parallel mode gets two inter-op threads, since it only helps with more than one."""
+    grid = []
+    for intra in threads:
+        for level in opt_levels:
+            for mode in modes:
+                grid.append({
+                    "intra_op_threads": intra,
+                    "inter_op_threads": 2 if mode == "parallel" else 1,
+                    "graph_optimization": level,
+                    "execution_mode": mode,
+                })
+    return grid
+
+
+def pick_best(trials: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The fastest successful trial by median latency, preferring fewer threads on ties within 2%."""
+    ok = [trial for trial in trials if "median_ms" in trial]
+    if not ok:
+        return None
+    fastest = min(trial["median_ms"] for trial in ok)
+    close = [trial for trial in ok if trial["median_ms"] <= fastest * 1.02]
+    return min(close, key=lambda trial: (trial["config"]["intra_op_threads"] + trial["config"]["inter_op_threads"], trial["median_ms"]))
+
+
+def _dummy_inputs(session, det_size, batch: int) -> Dict[str, Any]:
+    """Blank inputs at serving shapes: dynamic batch dims get `batch`, dynamic spatial dims the detector size."""
+    import numpy as np
+    feeds = {}
+    for node in session.get_inputs():
+        shape = list(node.shape)
+        if len(shape) == 4 and not isinstance(shape[2], int):
+            # Fully convolutional detector: one image at the configured detection size
+            shape = [1, shape[1] if isinstance(shape[1], int) else 3, det_size[1], det_size[0]]
+        else:
+            shape = [dim if isinstance(dim, int) else batch for dim in shape]
+        feeds[node.name] = np.zeros(shape, dtype=np.float32)
+    return feeds
+
+
+def time_model(model_file: str, config: Dict[str, Any], det_size, batch: int = 1, runs: int = 20, warmup: int = 3) -> Dict[str, Any]:
+    """Median and p90 latency of one model under one session configuration."""
+    import onnxruntime
+    from app.services.onnx_runtime import DEFAULT_PROVIDERS, build_session_options
+    started = time.perf_counter()
+    session = onnxruntime.InferenceSession(model_file, sess_options=build_session_options(config), providers=DEFAULT_PROVIDERS)
+    load_ms = 1000 * (time.perf_counter() - started)
+    feeds = _dummy_inputs(session, det_size, batch)
+    outputs = [node.name for node in session.get_outputs()]
+    for _ in range(warmup):
+        session.run(outputs, feeds)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(outputs, feeds)
+        latencies.append(1000 * (time.perf_counter() - start))
+    latencies.sort()
+    return {
+        "config": config,
+        "median_ms": statistics.median(latencies),
+        "p90_ms": latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))],
+        "load_ms": load_ms,
+    }
+
+
+def tune(model_files: Iterable[str], grid: List[Dict[str, Any]], det_size, batch: int = 1, runs: int = 20, log=print) -> Dict[str, Any]:
+    """Time every model under every configuration; returns {"models": best config per file, "trials": all timings}."""
+    best, trials = {}, {}
+    for model_file in model_files:
+        name = osp.basename(model_file)
+        trials[name] = []
+        for config in grid:
+            try:
+                trial = time_model(model_file, config, det_size, batch=batch, runs=runs)
+            except Exception as e:
+                trial = {"config": config, "error": str(e)}
+            trials[name].append(trial)
+            log(f"{name:<20} {json.dumps(config)} -> {trial.get('median_ms', float('nan')):.2f} ms")
+        winner = pick_best(trials[name])
+        if winner is not None:
+            best[name] = {**winner["config"], "median_ms": winner["median_ms"]}
+            log(f"{name:<20} best: {json.dumps(best[name])}")
+    return {"models": best, "trials": trials}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ONNX Runtime session settings for the InsightFace models on this machine.")
+    parser.add_argument("--pack", default="buffalo_l", help="InsightFace model pack to tune.")
+    parser.add_argument("--root", default="~/.insightface", help="InsightFace model root.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 1)), help="Server workers sharing the cores.")
+    parser.add_argument("--threads", help="Comma-separated intra-op thread counts (default: powers of two up to cores // workers).")
+    parser.add_argument("--opt-levels", default=",".join(DEFAULT_OPT_LEVELS), help="Graph optimization levels to try.")
+    parser.add_argument("--modes", default=",".join(DEFAULT_MODES), help="Execution modes to try.")
+    parser.add_argument("--batch", type=int, default=1, help="Batch size for the per-face models (match INFERENCE_MAX_BATCH_SIZE when batching).")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per configuration.")
+    parser.add_argument("--output", default="ort_tuning.json", help="Where to save the tuned settings.")
+    args = parser.parse_args(argv)
+
+    from insightface.utils import ensure_available
+    from app.config import settings
+
+    model_dir = ensure_available("models", args.pack, root=args.root)
+    model_files = sorted(glob.glob(osp.join(model_dir, "*.onnx")))
+    cores = os.cpu_count() or 1
+    threads = [int(t) for t in args.threads.split(",")] if args.threads else thread_candidates(cores, args.workers)
+    grid = candidate_grid(threads, args.opt_levels.split(","), args.modes.split(","))
+    print(f"Tuning {len(model_files)} models x {len(grid)} configurations on {cores} cores ({args.workers} worker(s))", file=sys.stderr)
+    result = tune(model_files, grid, settings.DET_SIZE, batch=args.batch, runs=args.runs, log=lambda line: print(line, file=sys.stderr))
+    result.update({
+        "created_at": datetime.now(UTC).isoformat(),
+        "cpu_count": cores,
+        "workers": args.workers,
+        "pack": args.pack,
+        "det_size": list(settings.DET_SIZE),
+        "batch": args.batch,
+    })
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result["models"], indent=2))
+    print(f"Saved to {args.output}; set ORT_TUNING_FILE={args.output} to use it.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
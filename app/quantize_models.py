@@ -0,0 +1,503 @@
+"""
+INT8 quantization of the InsightFace detection and recognition models, and its evaluation against FP32.
+
+Usage:
+    python -m app.quantize_models --calibration images/train
+    python -m app.quantize_models --method dynamic
+    python -m app.quantize_models --evaluate-only --images images/train,images/test --report quantization_report.json
+    MODEL_PRECISION=int8 poetry run uvicorn app.main:app
+
+Static quantization (the default) writes QDQ models with per-channel INT8 weights and UINT8 activations,
+whose activation ranges are calibrated on the inputs the models see when serving: the letterboxed detector
+blob at DET_SIZE and, for recognition, the aligned crops of the faces the FP32 detector finds. Each
+calibration image is used as is, mirrored, darkened and brightened. Dynamic quantization needs no
+calibration data: weights are stored in INT8 and activations are quantized on the fly, which mostly helps
+MatMul-heavy models and can be slower than FP32 for convolutions. The quantized files and a
+quantization.json manifest are written to INT8_MODEL_DIR (default <pack directory>_int8), where
+MODEL_PRECISION=int8 picks them up; the other models of the pack stay FP32.
+
+--evaluate (after quantizing) or --evaluate-only loads both precisions and reports on --images: the cosine
+similarity between the FP32 and INT8 embeddings of each face, face count and box agreement, the match
+decisions of verify_embeddings (as the verification routes use it) for every image pair with each
+precision and for INT8 probes against FP32 references (a gallery enrolled before switching), per-image
+and per-model latency, model file sizes and the resident memory added by each precision's sessions.
+"""
+import argparse
+import json
+import os
+import os.path as osp
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+QUANTIZED_TASKS = ("detection", "recognition")
+METHODS = ("static", "dynamic")
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+
+
+def augmented(rgb) -> list:
+    """The image plus its mirror and a darker and a brighter copy, to widen the calibrated activation ranges."""
+    import numpy as np
+    pixels = rgb.astype(np.float32)
+    return [
+        rgb,
+        np.ascontiguousarray(rgb[:, ::-1]),
+        np.clip(pixels * 0.6, 0, 255).astype(np.uint8),
+        np.clip(pixels * 1.4, 0, 255).astype(np.uint8),
+    ]
+
+
+def detection_blob(det_model, rgb, input_size: Tuple[int, int]):
+    """The detector input for an image, letterboxed to input_size and normalized as RetinaFace.detect does."""
+    import cv2
+    import numpy as np
+    width, height = input_size
+    if rgb.shape[0] / rgb.shape[1] > height / width:
+        new_height, new_width = height, int(height * rgb.shape[1] / rgb.shape[0])
+    else:
+        new_width, new_height = width, int(width * rgb.shape[0] / rgb.shape[1])
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    canvas[:new_height, :new_width] = cv2.resize(rgb, (new_width, new_height))
+    mean = det_model.input_mean
+    return cv2.dnn.blobFromImage(canvas, 1.0 / det_model.input_std, (width, height), (mean, mean, mean), swapRB=True)
+
+
+def recognition_blobs(analyzer, rgb, input_size: Tuple[int, int]) -> list:
+    """Recognition inputs for every face the detector finds in an image, aligned and normalized as ArcFaceONNX.get_feat does."""
+    import cv2
+    from insightface.utils import face_align
+    rec_model = analyzer.models["recognition"]
+    _, kpss = analyzer.det_model.detect(rgb, input_size=input_size)
+    if kpss is None:
+        return []
+    mean = rec_model.input_mean
+    return [
+        cv2.dnn.blobFromImage(
+            face_align.norm_crop(rgb, landmark=kps, image_size=rec_model.input_size[0]),
+            1.0 / rec_model.input_std, rec_model.input_size, (mean, mean, mean), swapRB=True,
+        )
+        for kps in kpss
+    ]
+
+
+class BlobCalibrationReader:
+    """onnxruntime CalibrationDataReader over precomputed input blobs of a single-input model."""
+
+    def __init__(self, input_name: str, blobs: list) -> None:
+        self.input_name = input_name
+        self.blobs = blobs
+        self.set_range(0, len(blobs))
+
+    def get_next(self) -> Optional[Dict[str, Any]]:
+        if self._next >= self._end:
+            return None
+        blob = self.blobs[self._next]
+        self._next += 1
+        return {self.input_name: blob}
+
+    def set_range(self, start_index: int, end_index: int) -> None:
+        self._next, self._end = start_index, min(end_index, len(self.blobs))
+
+    def rewind(self) -> None:
+        self.set_range(0, len(self.blobs))
+
+    def __len__(self) -> int:
+        return len(self.blobs)
+
+
+def calibration_blobs(analyzer, task: str, images: Iterable, det_size: Tuple[int, int], max_samples: int) -> list:
+    """Up to max_samples calibration inputs for `task` from the (augmented) images."""
+    blobs = []
+    for rgb in images:
+        for variant in augmented(rgb):
+            if task == "detection":
+                blobs.append(detection_blob(analyzer.det_model, variant, det_size))
+            else:
+                blobs.extend(recognition_blobs(analyzer, variant, det_size))
+            if len(blobs) >= max_samples:
+                return blobs[:max_samples]
+    return blobs
+
+
+def quantize_model(
+    model_file: str,
+    output_file: str,
+    method: str = "static",
+    reader: Optional[BlobCalibrationReader] = None,
+    calibrate_method: str = "minmax",
+    per_channel: bool = True,
+    reduce_range: bool = False,
+) -> None:
+    """Write an INT8 version of model_file; static quantization needs a calibration reader."""
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference and graph cleanup first, so more nodes get quantized
+        prepared = osp.join(tmp, osp.basename(model_file))
+        try:
+            quant_pre_process(model_file, prepared)
+        except Exception as e:
+            print(f"Pre-processing {model_file} failed ({e}); quantizing the original graph", file=sys.stderr)
+            prepared = model_file
+        if method == "dynamic":
+            quantize_dynamic(prepared, output_file, weight_type=QuantType.QInt8, per_channel=per_channel, reduce_range=reduce_range)
+            return
+        if reader is None or not len(reader):
+            raise ValueError(f"Static quantization of {model_file} needs calibration data.")
+        quantize_static(
+            prepared,
+            output_file,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            reduce_range=reduce_range,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method={
+                "minmax": CalibrationMethod.MinMax,
+                "entropy": CalibrationMethod.Entropy,
+                "percentile": CalibrationMethod.Percentile,
+            }[calibrate_method],
+        )
+
+
+def quantize_pack(
+    analyzer,
+    images: Sequence,
+    output_dir: str,
+    det_size: Tuple[int, int],
+    method: str = "static",
+    max_samples: int = 200,
+    calibrate_method: str = "minmax",
+    per_channel: bool = True,
+    reduce_range: bool = False,
+    log=print,
+) -> Dict[str, Any]:
+    """Quantize the detection and recognition models of an FP32 analyzer into output_dir and write its manifest."""
+    from app.services.onnx_runtime import QUANTIZATION_MANIFEST
+    os.makedirs(output_dir, exist_ok=True)
+    models = {}
+    for task in QUANTIZED_TASKS:
+        model = analyzer.models[task]
+        name = osp.basename(model.model_file)
+        reader = None
+        if method == "static":
+            blobs = calibration_blobs(analyzer, task, images, det_size, max_samples)
+            if not blobs:
+                raise ValueError(f"No calibration inputs for {task}: the calibration images contain no detectable face.")
+            reader = BlobCalibrationReader(model.input_name, blobs)
+        started = time.perf_counter()
+        quantize_model(model.model_file, osp.join(output_dir, name), method, reader, calibrate_method, per_channel, reduce_range)
+        log(f"{task:<12} {name}: {method} INT8 in {time.perf_counter() - started:.1f}s ({len(reader) if reader else 0} calibration inputs)")
+        models[name] = {
+            "task": task,
+            "source": model.model_file,
+            "method": method,
+            "calibration_samples": len(reader) if reader else 0,
+            "input_mean": model.input_mean,
+            "input_std": model.input_std,
+        }
+    manifest = {
+        "created_at": datetime.now(UTC).isoformat(),
+        "method": method,
+        "calibrate_method": calibrate_method if method == "static" else None,
+        "per_channel": per_channel,
+        "reduce_range": reduce_range,
+        "det_size": list(det_size),
+        "models": models,
+    }
+    with open(osp.join(output_dir, QUANTIZATION_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def cosine(a, b) -> float:
+    import numpy as np
+    a, b = np.asarray(a, dtype=np.float64).ravel(), np.asarray(b, dtype=np.float64).ravel()
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def iou(a, b) -> float:
+    """Intersection over union of two x1, y1, x2, y2 boxes."""
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def value_summary(values: Sequence[float]) -> Dict[str, Any]:
+    """count, mean, min and max of values."""
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "mean": statistics.fmean(values), "min": min(values), "max": max(values)}
+
+
+def pair_decisions(references: Dict[str, Any], probes: Optional[Dict[str, Any]] = None, metric: str = "euclidean") -> Dict[Tuple[str, str], bool]:
+    """
+    verify_embeddings match decision for every pair of images. With probes, every reference is compared with
+    every probe (including the same image); otherwise each unordered pair of references once.
+    """
+    from app.services.facial_analysis import verify_embeddings
+    names = sorted(references)
+    if probes is None:
+        pairs = [(a, b) for i, a in enumerate(names) for b in names[i + 1:]]
+        probes = references
+    else:
+        pairs = [(a, b) for a in names for b in sorted(probes)]
+    return {(a, b): verify_embeddings(references[a], probes[b], metric=metric)["match"] for a, b in pairs}
+
+
+def decision_agreement(reference: Dict[Tuple[str, str], bool], candidate: Dict[Tuple[str, str], bool]) -> Dict[str, Any]:
+    """How often candidate match decisions equal the reference ones, and which pairs flipped."""
+    pairs = sorted(set(reference) & set(candidate))
+    flipped = [
+        f"{a} vs {b}: {'match' if reference[(a, b)] else 'no match'} -> {'match' if candidate[(a, b)] else 'no match'}"
+        for a, b in pairs if reference[(a, b)] != candidate[(a, b)]
+    ]
+    return {
+        "pairs": len(pairs),
+        "agreement": 1.0 - len(flipped) / len(pairs) if pairs else None,
+        "reference_matches": sum(reference[pair] for pair in pairs),
+        "candidate_matches": sum(candidate[pair] for pair in pairs),
+        "flipped": flipped,
+    }
+
+
+def rss_mb() -> Optional[float]:
+    """Resident memory of this process in MB (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def pack_available(pack: str, root: str, log=print) -> bool:
+    """Whether the FP32 model pack is in `root` (insightface downloads it when missing and online)."""
+    from insightface.utils import ensure_available
+    try:
+        ensure_available("models", pack, root=root)
+    except OSError as e:
+        log(f"Model pack {pack} is not in {root} and could not be downloaded ({e}); copy it to {osp.join(root, 'models', pack)}")
+        return False
+    return True
+
+
+def load_images(directories: Iterable[str]) -> Dict[str, Any]:
+    """RGB arrays of the images under the directories, keyed by path; unreadable files are skipped."""
+    from app.bulk_enroll import iter_directory
+    from app.services.image_decoding import decode_image_bytes
+    images = {}
+    for directory in directories:
+        for item in iter_directory(directory):
+            try:
+                with open(item.path, "rb") as f:
+                    images[osp.relpath(item.path)] = decode_image_bytes(f.read())
+            except (OSError, ValueError):
+                continue
+    return images
+
+
+def _analyze(analyzer, images: Dict[str, Any], repeat: int) -> Tuple[Dict[str, list], List[float]]:
+    """Faces per image (last pass) and the latency of every detection + recognition call, in ms."""
+    from app.services.inference_scheduler import analyze_batch
+    faces, latencies = {}, []
+    for _ in range(repeat):
+        for name, rgb in images.items():
+            started = time.perf_counter()
+            result = analyze_batch(analyzer, [rgb])[0]
+            latencies.append(1000 * (time.perf_counter() - started))
+            faces[name] = [] if isinstance(result, Exception) else result
+    return faces, latencies
+
+
+def evaluate(
+    images: Dict[str, Any],
+    pack: str = "buffalo_l",
+    root: str = "~/.insightface",
+    det_size: Tuple[int, int] = (640, 640),
+    metric: str = "euclidean",
+    repeat: int = 3,
+    runs: int = 20,
+    log=print,
+) -> Dict[str, Any]:
+    """Compare the INT8 detection and recognition models with FP32 on `images` (see the module docstring)."""
+    from app.ort_autotune import time_model
+    from app.services.onnx_runtime import PRECISIONS, build_face_analysis, session_config, warm_up_face_analysis
+    from app.services.stage_timing import summarize
+
+    runs_by_precision = {}
+    for precision in PRECISIONS:
+        before = rss_mb()
+        analyzer = build_face_analysis(name=pack, root=root, allowed_modules=QUANTIZED_TASKS, precision=precision)
+        analyzer.prepare(ctx_id=0, det_size=det_size)
+        warm_up_face_analysis(analyzer, [det_size])
+        faces, latencies = _analyze(analyzer, images, repeat)
+        after = rss_mb()
+        files = {task: analyzer.models[task].model_file for task in QUANTIZED_TASKS}
+        models = {}
+        for task, model_file in files.items():
+            timing = time_model(model_file, session_config(model_file), det_size, runs=runs)
+            models[task] = {
+                "file": model_file,
+                "size_mb": osp.getsize(model_file) / 2**20,
+                "median_ms": timing["median_ms"],
+                "p90_ms": timing["p90_ms"],
+                "load_ms": timing["load_ms"],
+            }
+        runs_by_precision[precision] = {
+            "analyzer": analyzer,
+            "faces": faces,
+            "report": {
+                "models": models,
+                # Sessions stay loaded, so the INT8 figure is what it adds on top of the FP32 sessions
+                "rss_added_mb": after - before if before is not None and after is not None else None,
+                "per_image": summarize(latency / 1000 for latency in latencies),
+            },
+        }
+        log(f"{precision}: {json.dumps(runs_by_precision[precision]['report']['models'])}")
+        if precision == "int8" and files == {task: runs_by_precision["fp32"]["report"]["models"][task]["file"] for task in files}:
+            log("No quantized models were loaded; run the quantization first or check INT8_MODEL_DIR.")
+
+    fp32_faces, int8_faces = runs_by_precision["fp32"]["faces"], runs_by_precision["int8"]["faces"]
+    count_mismatches = [name for name in images if len(fp32_faces[name]) != len(int8_faces[name])]
+    single = [name for name in images if len(fp32_faces[name]) == 1 and len(int8_faces[name]) == 1]
+    fp32_embeddings = {name: fp32_faces[name][0].embedding for name in single}
+    int8_embeddings = {name: int8_faces[name][0].embedding for name in single}
+    fp32_decisions = pair_decisions(fp32_embeddings, metric=metric)
+
+    speedups = {}
+    for task in QUANTIZED_TASKS:
+        fp32_ms = runs_by_precision["fp32"]["report"]["models"][task]["median_ms"]
+        int8_ms = runs_by_precision["int8"]["report"]["models"][task]["median_ms"]
+        speedups[task] = fp32_ms / int8_ms if int8_ms else None
+    per_image = {precision: run["report"]["per_image"] for precision, run in runs_by_precision.items()}
+    if per_image["fp32"].get("count") and per_image["int8"].get("count"):
+        speedups["per_image_p50"] = per_image["fp32"]["p50_ms"] / per_image["int8"]["p50_ms"]
+
+    return {
+        "created_at": datetime.now(UTC).isoformat(),
+        "pack": pack,
+        "det_size": list(det_size),
+        "metric": metric,
+        "images": len(images),
+        "precisions": {precision: run["report"] for precision, run in runs_by_precision.items()},
+        "speedup": speedups,
+        "detection": {
+            "face_count_agreement": 1.0 - len(count_mismatches) / len(images) if images else None,
+            "face_count_mismatches": count_mismatches,
+            "box_iou": value_summary([iou(fp32_faces[name][0].bbox, int8_faces[name][0].bbox) for name in single]),
+        },
+        "embedding_similarity": value_summary([cosine(fp32_embeddings[name], int8_embeddings[name]) for name in single]),
+        "decisions": {
+            "int8_vs_fp32": decision_agreement(fp32_decisions, pair_decisions(int8_embeddings, metric=metric)),
+            "int8_probe_vs_fp32_gallery": decision_agreement(
+                pair_decisions(fp32_embeddings, fp32_embeddings, metric=metric),
+                pair_decisions(fp32_embeddings, int8_embeddings, metric=metric),
+            ),
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Human-readable summary of an evaluate() report."""
+    def number(value, spec=".3f"):
+        return "n/a" if value is None else format(value, spec)
+
+    lines = [f"{'model':<12} {'fp32 ms':>9} {'int8 ms':>9} {'speed-up':>9} {'fp32 MB':>8} {'int8 MB':>8}"]
+    for task in QUANTIZED_TASKS:
+        fp32, int8 = report["precisions"]["fp32"]["models"][task], report["precisions"]["int8"]["models"][task]
+        lines.append(
+            f"{task:<12} {fp32['median_ms']:>9.2f} {int8['median_ms']:>9.2f} {number(report['speedup'][task], '.2f') + 'x':>9}"
+            f" {fp32['size_mb']:>8.1f} {int8['size_mb']:>8.1f}"
+        )
+    for precision, run in report["precisions"].items():
+        per_image = run["per_image"]
+        lines.append(
+            f"{precision} per image (detection + recognition): p50 {number(per_image.get('p50_ms'), '.1f')} ms,"
+            f" p95 {number(per_image.get('p95_ms'), '.1f')} ms; resident memory added {number(run['rss_added_mb'], '.0f')} MB"
+        )
+    similarity, detection = report["embedding_similarity"], report["detection"]
+    lines.append(
+        f"Embedding cosine FP32 vs INT8 over {similarity['count']} faces: mean {number(similarity.get('mean'), '.4f')},"
+        f" min {number(similarity.get('min'), '.4f')}"
+    )
+    lines.append(
+        f"Face count agreement {number(detection['face_count_agreement'])}, box IoU mean {number(detection['box_iou'].get('mean'))}"
+    )
+    for name, agreement in report["decisions"].items():
+        lines.append(f"Match decisions {name}: {number(agreement['agreement'])} of {agreement['pairs']} pairs agree")
+        lines.extend(f"  flipped: {pair}" for pair in agreement["flipped"])
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Quantize the InsightFace detection and recognition models to INT8 and compare them with FP32.")
+    parser.add_argument("--pack", default="buffalo_l", help="InsightFace model pack.")
+    parser.add_argument("--root", default="~/.insightface", help="InsightFace model root.")
+    parser.add_argument("--method", choices=METHODS, default="static", help="Static (calibrated QDQ) or dynamic quantization.")
+    parser.add_argument("--calibration", default="images/train", help="Comma-separated directories of calibration images (static).")
+    parser.add_argument("--max-samples", type=int, default=200, help="Calibration inputs per model.")
+    parser.add_argument("--calibrate-method", choices=CALIBRATION_METHODS, default="minmax", help="Activation range calibration (static).")
+    parser.add_argument("--no-per-channel", action="store_true", help="One weight scale per tensor instead of per output channel.")
+    parser.add_argument("--reduce-range", action="store_true", help="7-bit weights, for CPUs without VNNI where 8-bit can saturate.")
+    parser.add_argument("--output-dir", help="Where to write the quantized models (default: INT8_MODEL_DIR or <pack directory>_int8).")
+    parser.add_argument("--evaluate", action="store_true", help="Compare INT8 with FP32 after quantizing.")
+    parser.add_argument("--evaluate-only", action="store_true", help="Compare the existing INT8 models with FP32 without quantizing.")
+    parser.add_argument("--images", default="images/train,images/test", help="Comma-separated directories of evaluation images.")
+    parser.add_argument("--metric", choices=("euclidean", "cosine"), default="euclidean", help="verify_embeddings metric for the match decisions.")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the evaluation images for per-image latency.")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per model for per-model latency.")
+    parser.add_argument("--report", default="quantization_report.json", help="Where to save the evaluation report.")
+    args = parser.parse_args(argv)
+
+    from app.config import settings
+    from app.services.onnx_runtime import build_face_analysis, int8_model_dir
+
+    if args.output_dir:
+        # build_face_analysis reads the quantized models from INT8_MODEL_DIR
+        settings.INT8_MODEL_DIR = args.output_dir
+    log = lambda line: print(line, file=sys.stderr)
+
+    if not pack_available(args.pack, args.root, log):
+        return 1
+    if not args.evaluate_only:
+        analyzer = build_face_analysis(name=args.pack, root=args.root, allowed_modules=QUANTIZED_TASKS, precision="fp32")
+        analyzer.prepare(ctx_id=0, det_size=settings.DET_SIZE)
+        calibration = list(load_images(args.calibration.split(",")).values()) if args.method == "static" else []
+        output_dir = int8_model_dir(analyzer.model_dir)
+        log(f"Quantizing {QUANTIZED_TASKS} ({args.method}) from {analyzer.model_dir} to {output_dir} with {len(calibration)} calibration images")
+        manifest = quantize_pack(
+            analyzer,
+            calibration,
+            output_dir,
+            settings.DET_SIZE,
+            method=args.method,
+            max_samples=args.max_samples,
+            calibrate_method=args.calibrate_method,
+            per_channel=not args.no_per_channel,
+            reduce_range=args.reduce_range,
+            log=log,
+        )
+        print(json.dumps(manifest, indent=2))
+        log(f"Set MODEL_PRECISION=int8{f' INT8_MODEL_DIR={output_dir}' if args.output_dir else ''} to serve the quantized models.")
+
+    if args.evaluate or args.evaluate_only:
+        images = load_images(args.images.split(","))
+        if not images:
+            log(f"No evaluation images in {args.images}")
+            return 1
+        report = evaluate(images, args.pack, args.root, settings.DET_SIZE, args.metric, args.repeat, args.runs, log=log)
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(format_report(report))
+        log(f"Saved to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
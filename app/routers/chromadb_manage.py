@@ -1,39 +1,138 @@
 """
-ChromaDB management endpoints: list all data, delete by filename.
+ChromaDB management endpoints: list data page by page, stream a full export, delete by filename, id list or
+metadata filter (in chunks, followed by a background compaction), and reset the collection in constant time.
+With the verification cascade enabled, deletions and resets are mirrored to the light gallery.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from app.config import settings
 from app.services.chromadb_service import chromadb_service
+from app.services.model_cascade import model_cascade
 from app.services.standard_response import StandardResponse
+from typing import Any, Dict, Iterator, List, Optional
+import io
+import itertools
+import json
 import numpy as np
 
 router = APIRouter(tags=["ChromaDB Management"])
 
-@router.get("/chromadb/all", summary="List all ChromaDB data")
-def get_all_chromadb():
-    result = chromadb_service.collection.get(include=["embeddings", "documents", "metadatas"])
-    # Convert numpy arrays to lists for JSON serialization
-    if "embeddings" in result and isinstance(result["embeddings"], (list, dict, np.ndarray)):
-        if isinstance(result["embeddings"], dict):
-            result["embeddings"] = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in result["embeddings"].items()}
-        else:
-            result["embeddings"] = [e.tolist() if isinstance(e, np.ndarray) else e for e in result["embeddings"]]
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+@router.get("/chromadb/all", summary="List ChromaDB data page by page")
+def get_all_chromadb(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    include_embeddings: bool = True,
+):
+    try:
+        result = chromadb_service.get_page(limit=limit, offset=offset, include_embeddings=include_embeddings)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read ChromaDB: {e}")
+    end = offset + len(result["ids"])
+    result.update(limit=limit, offset=offset, next_offset=end if end < result["total"] else None)
     return StandardResponse(success=True, data=result, error=None)
 
+def _ndjson_export(include_embeddings: bool) -> Iterator[bytes]:
+    """One JSON object per record, built a page at a time."""
+    for page in chromadb_service.iter_pages(EXPORT_BATCH_SIZE, include_embeddings=include_embeddings):
+        ids = page["ids"]
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        documents = page.get("documents") or [None] * len(ids)
+        lines = []
+        for i, embedding_id in enumerate(ids):
+            record = {"id": embedding_id, "metadata": metadatas[i], "document": documents[i]}
+            if include_embeddings:
+                record["embedding"] = page["embeddings"][i].tolist()
+            lines.append(json.dumps(record))
+        yield ("\n".join(lines) + "\n").encode()
+
+def _npy_export(rows: int) -> Iterator[bytes]:
+    """A (rows, dim) float32 .npy stream; rows deleted during the export are zero-filled, rows added are left out."""
+    pages = chromadb_service.iter_pages(EXPORT_BATCH_SIZE, include_embeddings=True)
+    first = next(pages, None)
+    dim = first["embeddings"].shape[1] if first is not None else 0
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {"descr": "<f4", "fortran_order": False, "shape": (rows, dim)})
+    yield header.getvalue()
+    written = 0
+    for page in itertools.chain([first] if first is not None else [], pages):
+        block = page["embeddings"][: rows - written]
+        yield block.astype("<f4", copy=False).tobytes()
+        written += len(block)
+        if written >= rows:
+            return
+    if written < rows:
+        yield bytes(4 * dim * (rows - written))
+
+@router.get("/chromadb/export", summary="Stream every ChromaDB record as NDJSON or .npy")
+def export_chromadb(
+    format: str = Query("ndjson", pattern="^(ndjson|npy)$"),
+    include_embeddings: bool = True,
+):
+    """
+    ndjson: one {id, metadata, document, embedding} object per line.
+    npy: the embedding matrix only, in the same order as the NDJSON export; its row count is in X-Row-Count.
+    Records are read a page at a time, so memory use does not grow with the collection.
+    """
+    if format == "npy":
+        rows = chromadb_service.collection.count()
+        return StreamingResponse(
+            _npy_export(rows),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": "attachment; filename=embeddings.npy", "X-Row-Count": str(rows)},
+        )
+    return StreamingResponse(
+        _ndjson_export(include_embeddings),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=chromadb_export.ndjson"},
+    )
+
+class DeleteRequest(BaseModel):
+    """Embeddings to delete: an explicit id list and/or a ChromaDB metadata filter."""
+    ids: Optional[List[str]] = Field(None, json_schema_extra={"example": ["3f2c...:frontal"]}, description="Embedding ids to delete.")
+    where: Optional[Dict[str, Any]] = Field(None, json_schema_extra={"example": {"user_id": "user123"}}, description="ChromaDB metadata filter, e.g. {\"user_id\": \"user123\"}.")
+
+@router.post("/chromadb/delete", summary="Delete embeddings by id list or metadata filter")
+def delete_embeddings(request: DeleteRequest, background_tasks: BackgroundTasks):
+    if not request.ids and not request.where:
+        raise HTTPException(status_code=422, detail="Provide ids and/or where.")
+    try:
+        deleted = 0
+        if request.ids:
+            deleted += chromadb_service.delete_ids(request.ids)
+            if settings.CASCADE_ENABLED:
+                model_cascade.delete_ids(request.ids)
+        if request.where:
+            deleted += chromadb_service.delete_where(request.where)
+            if settings.CASCADE_ENABLED:
+                model_cascade.delete_where(request.where)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete embeddings: {e}")
+    background_tasks.add_task(chromadb_service.compact)
+    return StandardResponse(success=True, data={"deleted": deleted}, error=None)
+
 @router.delete("/chromadb/delete-by-filename/{filename}", summary="Delete embedding by filename")
-def delete_embedding_by_filename(filename: str):
+def delete_embedding_by_filename(filename: str, background_tasks: BackgroundTasks):
     # Try to delete by metadata 'filename' field
     try:
-        chromadb_service.collection.delete(where={"filename": filename})
-        return StandardResponse(success=True, data={"deleted": filename}, error=None)
+        deleted = chromadb_service.delete_by_filename(filename)
+        if settings.CASCADE_ENABLED:
+            model_cascade.delete_where({"filename": filename})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete embedding: {e}")
+    background_tasks.add_task(chromadb_service.compact)
+    return StandardResponse(success=True, data={"deleted": filename, "count": deleted}, error=None)
 
 @router.delete("/chromadb/clear", summary="Delete all face profiles in ChromaDB")
 def clear_chromadb():
+    # Drops and recreates the collection, so it takes the same time whatever the collection size
     try:
-        all_ids = chromadb_service.collection.get().get("ids", [])
-        if all_ids:
-            chromadb_service.collection.delete(ids=all_ids)
+        chromadb_service.clear()
+        if settings.CASCADE_ENABLED:
+            model_cascade.clear()
         return StandardResponse(success=True, data={"message": "All face profiles deleted."}, error=None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear ChromaDB: {e}")
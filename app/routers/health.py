@@ -1,12 +1,19 @@
 """
-Health check endpoint for the API. Returns status and version.
+Health check endpoints for the API: liveness (/health, status and version) and readiness (/ready, model loading progress).
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 from app.config import settings
 from app.services.standard_response import StandardResponse
+from app.services.result_cache import result_cache
 
 router = APIRouter(tags=["Health"])
 
-@router.get("/health", summary="Health check", description="Returns the health and version of the API.", response_model=StandardResponse)
+@router.get("/health", summary="Health check", description="Returns the health and version of the API, and result cache statistics.", response_model=StandardResponse)
 def health():
-    return StandardResponse(success=True, data={"status": "ok", "version": settings.API_VERSION}, error=None)
+    return StandardResponse(success=True, data={"status": "ok", "version": settings.API_VERSION, "result_cache": result_cache.stats()}, error=None)
+
+@router.get("/ready", summary="Readiness check", description="Returns 200 once InsightFace, the anti-spoofing model and ChromaDB are loaded and warmed up, 503 with per-component progress before that.")
+def ready(request: Request):
+    status = request.app.state.lifecycle.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=StandardResponse(success=status["ready"], data=status, error=None).model_dump())
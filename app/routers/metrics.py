@@ -0,0 +1,13 @@
+"""
+Prometheus metrics endpoint: per-stage and per-route latency histograms, in-flight requests,
+inference queue depths, result cache hit rates, gallery size and live enrollment sessions.
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.services.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter(tags=["Health"])
+
+@router.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -16,22 +16,21 @@ Response:
 """
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form, status, Depends
-from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from PIL import Image
-from io import BytesIO
 from typing import List, Optional, Dict, Any
-from app.services.facial_analysis import analyze_face
+from app.services.image_decoding import LazyImage
+from app.services.result_cache import content_key, result_cache
+from app.services.facial_analysis import analyze_face_async
 from app.services.logging_config import setup_logging
 from app.services.chromadb_service import chromadb_service
+from app.services.model_cascade import light_embeddings, model_cascade
 from app.services.standard_response import StandardResponse
-from app.services.spoof_model import get_spoof_model
+from app.services.spoof_model import get_spoof_model, analyze_spoof_face, spoof_cache_kind
+from app.services.inference_executor import run_inference, run_in_model_thread
 from app.config import settings
 import uuid
 from datetime import datetime, UTC
 import json
-from tempfile import NamedTemporaryFile
-import os
 
 router = APIRouter(prefix=f"/{settings.API_VERSION}", tags=["Profile"])
 logger = setup_logging()
@@ -75,38 +74,43 @@ async def create_profile(
     if size > MAX_SIZE:
         logger.error(f"File too large: {size} bytes")
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail={"code": 413, "message": "File too large. Max 10MB allowed."})
-    try:
-        img = Image.open(BytesIO(contents))
-    except Exception as e:
-        logger.error(f"Invalid image file: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail={"code": 415, "message": "Unsupported file type. Please upload a valid image."})
-    try:
-        profile_data = analyze_face(img)
-    except Exception as e:
-        logger.error(f"Face analysis service error: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail={"code": 500, "message": "Face analysis failed."})
+    upload = LazyImage(contents)
+    key = content_key(contents)
+    # Retried uploads are answered from the result cache without decoding or running the models
+    profile_data = result_cache.get(key, "face")
+    if profile_data is None:
+        try:
+            img = upload.image
+        except Exception as e:
+            logger.error(f"Invalid image file: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail={"code": 415, "message": "Unsupported file type. Please upload a valid image."})
+        try:
+            profile_data = await analyze_face_async(img)
+        except Exception as e:
+            logger.error(f"Face analysis service error: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail={"code": 500, "message": "Face analysis failed."})
+        result_cache.put(key, "face", profile_data)
     if "error" in profile_data:
         logger.warning(f"Face analysis failed: {profile_data['error']}")
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"code": 422, "message": profile_data["error"]})
+    face = profile_data["face"]
+    profile_data = {k: v for k, v in profile_data.items() if k != "face"}
 
-    # Run anti-spoofing and age/gender analysis
-    with NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        tmp.write(contents)
-        tmp_path = tmp.name
-    try:
-        if not spoof_model:
-            raise HTTPException(status_code=500, detail={"code": 500, "message": "Spoof model not available."})
-        spoof_result = await run_in_threadpool(spoof_model.analyze_image, tmp_path)
-        logger.info(f"Anti-spoofing/age/gender result: {spoof_result}")
-        if spoof_result.get("dominant_spoof") != "Real":
-            logger.warning("Anti-spoofing check failed: not a real face")
-            raise HTTPException(status_code=400, detail={"code": 400, "message": "Image failed anti-spoofing check. Not a real face."})
-        # Extract age and dominant_gender for metadata
-        age = spoof_result.get("age")
-        dominant_gender = spoof_result.get("dominant_gender")
-    finally:
-        if 'tmp_path' in locals() and os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    # Run anti-spoofing and age/gender analysis on the decoded upload (no temp file, no second decode)
+    if not spoof_model:
+        raise HTTPException(status_code=500, detail={"code": 500, "message": "Spoof model not available."})
+    spoof_result = result_cache.get(key, spoof_cache_kind())
+    if spoof_result is None:
+        spoof_result = await run_in_model_thread(analyze_spoof_face, spoof_model, upload.image, face)
+        if "error" not in spoof_result:
+            result_cache.put(key, spoof_cache_kind(), spoof_result)
+    logger.info(f"Anti-spoofing/age/gender result: {spoof_result}")
+    if spoof_result.get("dominant_spoof") != "Real":
+        logger.warning("Anti-spoofing check failed: not a real face")
+        raise HTTPException(status_code=400, detail={"code": 400, "message": "Image failed anti-spoofing check. Not a real face."})
+    # Extract age and dominant_gender for metadata
+    age = spoof_result.get("age")
+    dominant_gender = spoof_result.get("dominant_gender")
 
     # Store embedding in ChromaDB
     embedding_id = str(uuid.uuid4())
@@ -135,6 +139,10 @@ async def create_profile(
     except Exception as e:
         logger.error(f"ChromaDB storage failed: {e}", exc_info=True)
         return StandardResponse(success=False, data=None, error={"code": 500, "message": "Failed to store profile in vector database."})
+    if settings.CASCADE_ENABLED:
+        # Light template for the verification cascade, from the face buffalo_l found
+        light_embedding = (await run_inference(light_embeddings, [upload.image], [face]))[0]
+        model_cascade.store([embedding_id], [light_embedding], [metadata])
     logger.info(f"Profile created and stored with id {embedding_id}")
     return StandardResponse(
         success=True,
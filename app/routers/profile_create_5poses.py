@@ -1,12 +1,25 @@
 """
-Profile creation endpoint (five-pose): Accepts five RGB frames (one per pose bucket), runs quality and pose checks on each, extracts robust facial embeddings, stores them in ChromaDB with optional user metadata, and returns the profile ID. Handles errors gracefully and logs all operations.
+Profile creation endpoint (five-pose): Accepts five RGB frames (one per pose bucket), runs quality and pose checks on each, extracts robust facial embeddings, stores one vector per pose in ChromaDB (ids "{profile_id}:{pose}", linked by profile_id metadata) with optional user metadata, and returns the profile ID. Handles errors gracefully and logs all operations.
 
-Request (JSON):
+Request (JSON, /profile-create-5poses):
 - frames: List[List[List[List[int]]]] (five RGB images as nested lists)
 - user_id: str (optional)
 - name: str (optional)
 - extra: dict (optional, for arbitrary metadata)
 
+Request (multipart, /profile-create-5poses/upload):
+- frontal, left, right, up, down: one file per pose, either an encoded image (JPEG/PNG)
+  or a raw uint8 RGB buffer sent as application/octet-stream
+- frame_shape: str (required for raw buffers, e.g. "480,640,3")
+- user_id: str (optional)
+- name: str (optional)
+- extra: JSON string (optional, for arbitrary metadata)
+
+Request (form, /profile-create-5poses/session/{session_id}):
+- finalizes an enrollment session whose five poses passed /enroll/qc/{bucket}?session_id=...;
+  the embeddings computed during QC are stored, so no frame is uploaded or analyzed again
+- user_id, name, extra: as for /upload
+
 Response:
 - profile_id: str
 - num_frames: int
@@ -14,26 +27,29 @@ Response:
 - name: str (if provided)
 - extra: dict (if provided)
 
-QC checks per frame:
-- Pose bucket (frontal, left, right, up, down)
-- Blur (Laplacian var ≥ 100)
-- Brightness (mean 70-180)
-- Embedding norm ≥ 25
-- Optional: PAD/spoof > 0.1
+Checks per frame in this route: a valid RGB image with exactly one detected face.
+Quality checks run earlier, per pose, in /enroll/qc/{bucket} (quality_check.py): the face region is scored by
+quality_metrics.quality_failure against the QC_* settings (QC_BLUR_MIN, QC_BRIGHTNESS_MIN/MAX, QC_CLIPPED_MAX,
+QC_CONTRAST_MIN), followed by the anti-spoofing check.
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, File, Form, UploadFile
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from app.services.facial_analysis import face_app
+from typing import List, Optional, Dict, Any, Tuple
+from app.services.facial_analysis import detect_faces_async
+from app.services.image_decoding import decode_image_bytes, frame_from_raw_bytes, parse_frame_shape
 from app.services.logging_config import setup_logging
 from app.services.chromadb_service import chromadb_service
+from app.services.enrollment_sessions import enrollment_sessions
+from app.services.inference_executor import run_inference
+from app.services.model_cascade import light_embeddings, model_cascade
 from app.services.spoof_model import get_spoof_model
-from app.services.quality_check_utils import is_blurry, is_bright
 from app.config import settings
 import numpy as np
 import cv2
+import asyncio
 import uuid
+import json
 from datetime import datetime, UTC
 
 router = APIRouter(prefix=f"/{settings.API_VERSION}", tags=["Profile"])
@@ -47,6 +63,10 @@ POSE_BUCKETS = {
     "down":    lambda y, p: p >= 12,
 }
 
+POSES = ["frontal", "left", "right", "up", "down"]  # Enforce strict order
+MAX_FRAME_SIZE = 10 * 1024 * 1024  # 10 MB per frame
+RAW_CONTENT_TYPE = "application/octet-stream"
+
 # --- QC helpers ---
 class FivePosePayload(BaseModel):
     frames: Dict[str, List[List[List[int]]]] = Field(..., description="Dictionary mapping pose names to RGB frames (frontal, left, right, up, down)")
@@ -61,33 +81,19 @@ class FivePoseResponse(BaseModel):
     name: Optional[str] = None
     extra: Optional[Dict[str, Any]] = None
 
-@router.post(
-    "/profile-create-5poses",
-    response_model=FivePoseResponse,
-    summary="Create a facial profile from five guided poses",
-    description="Upload five RGB frames (frontal, left, right, up, down) to extract facial features, run QC, and store the profile in ChromaDB.",
-    tags=["Profile"]
-)
-async def profile_create_5poses(
-    payload: FivePosePayload,
-    spoof_model = Depends(get_spoof_model)
-) -> FivePoseResponse:
-    """Create a facial profile from five guided pose frames and store in ChromaDB."""
-    logger.info("Received 5-pose enrollment request")
-
-    POSES = ["frontal", "left", "right", "up", "down"]  # Enforce strict order
-
-    if set(payload.frames.keys()) != set(POSES):
-        logger.error(f"Expected pose keys {POSES}, got {list(payload.frames.keys())}")
-        raise HTTPException(status_code=400, detail=f"Frames must include exactly these keys: {POSES}")
-    embeddings = []
+async def _embed_pose_frames(frames: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Optional[List[Optional[List[float]]]]]:
+    """
+    Run face analysis on the pose frames concurrently and return the embeddings stacked in strict F, L, R, U, D order,
+    with the light-pack embeddings of the same faces when the verification cascade is enabled (else None).
+    """
     for pose in POSES:
-        arr = payload.frames[pose]
-        rgb = np.array(arr, dtype=np.uint8)
+        rgb = frames[pose]
         if rgb.ndim != 3 or rgb.shape[2] != 3:
             logger.error(f"Frame {pose} is not a valid RGB image: shape {rgb.shape}")
             raise HTTPException(status_code=415, detail=f"Frame {pose} is not a valid RGB image")
-        faces = face_app.get(rgb)
+    results = await asyncio.gather(*(detect_faces_async(frames[pose]) for pose in POSES))
+    embeddings = []
+    for pose, faces in zip(POSES, results):
         if not faces:
             logger.warning(f"No face detected in {pose} frame")
             raise HTTPException(status_code=422, detail=f"No face detected in {pose} frame")
@@ -96,32 +102,162 @@ async def profile_create_5poses(
             raise HTTPException(status_code=422, detail=f" {len(faces)} faces detected in {pose} frame")
         f = faces[0]
         embeddings.append(f.embedding)
-    # Stack or average embeddings in strict order: F, L, R, U, D
-    embeddings_np = np.vstack(embeddings)
-    mean_embedding = embeddings_np.mean(axis=0)
-    # Store in ChromaDB
-    
+    light = None
+    if settings.CASCADE_ENABLED:
+        detected = [{"bbox": faces[0].bbox, "kps": faces[0].kps} for faces in results]
+        light = await run_inference(light_embeddings, [frames[pose] for pose in POSES], detected)
+    return np.vstack(embeddings), light
+
+def _store_profile(
+    embeddings_np: np.ndarray,
+    user_id: Optional[str],
+    name: Optional[str],
+    extra: Optional[Dict[str, Any]],
+    light: Optional[List[Optional[List[float]]]] = None,
+) -> FivePoseResponse:
+    """
+    Store the five-pose template in ChromaDB, one vector per pose linked by profile_id, and build the response.
+    light, the per-pose light-pack embeddings, goes to the verification cascade's light gallery under the same ids.
+    """
     profile_id = str(uuid.uuid4())
     metadata = {
         "created_at": datetime.now(UTC).isoformat(),
-        "user_id": payload.user_id,
-        "name": payload.name,
-        "extra": payload.extra,
+        "user_id": user_id,
+        "name": name,
+        "extra": json.dumps(extra) if extra is not None else None,  # Store as JSON string
         "num_frames": 5,
         "pose_buckets": "FLRUD",
+        "profile_id": profile_id,
     }
     # Remove None values
     metadata = {k: v for k, v in metadata.items() if v is not None}
+    # Embeddings are in strict order: F, L, R, U, D
+    ids = [f"{profile_id}:{pose}" for pose in POSES]
+    metadatas = [{**metadata, "pose": pose} for pose in POSES]
     try:
-        chromadb_service.add_embedding(profile_id, mean_embedding.tolist(), metadata)
+        chromadb_service.add_embeddings(ids, embeddings_np.tolist(), metadatas)
     except Exception as e:
         logger.error(f"ChromaDB storage failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to store profile in vector database.")
+    if light is not None:
+        model_cascade.store(ids, light, metadatas)
     logger.info(f"Profile created and stored with id {profile_id}")
     return FivePoseResponse(
         profile_id=profile_id,
         num_frames=5,
-        user_id=payload.user_id,
-        name=payload.name,
-        extra=payload.extra
+        user_id=user_id,
+        name=name,
+        extra=extra
     )
+
+@router.post(
+    "/profile-create-5poses",
+    response_model=FivePoseResponse,
+    summary="Create a facial profile from five guided poses",
+    description="Upload five RGB frames (frontal, left, right, up, down) to extract facial features, run QC, and store the profile in ChromaDB.",
+    tags=["Profile"]
+)
+async def profile_create_5poses(
+    payload: FivePosePayload,
+    spoof_model = Depends(get_spoof_model)
+) -> FivePoseResponse:
+    """Create a facial profile from five guided pose frames and store in ChromaDB."""
+    logger.info("Received 5-pose enrollment request")
+
+    if set(payload.frames.keys()) != set(POSES):
+        logger.error(f"Expected pose keys {POSES}, got {list(payload.frames.keys())}")
+        raise HTTPException(status_code=400, detail=f"Frames must include exactly these keys: {POSES}")
+    frames = {pose: np.array(payload.frames[pose], dtype=np.uint8) for pose in POSES}
+    embeddings_np, light = await _embed_pose_frames(frames)
+    return _store_profile(embeddings_np, payload.user_id, payload.name, payload.extra, light)
+
+@router.post(
+    "/profile-create-5poses/upload",
+    response_model=FivePoseResponse,
+    summary="Create a facial profile from five guided poses (binary upload)",
+    description="Upload five frames (frontal, left, right, up, down) as multipart files, either encoded JPEG/PNG images or raw uint8 RGB buffers with a frame_shape header, and store the profile in ChromaDB.",
+    tags=["Profile"]
+)
+async def profile_create_5poses_upload(
+    frontal: UploadFile = File(...),
+    left: UploadFile = File(...),
+    right: UploadFile = File(...),
+    up: UploadFile = File(...),
+    down: UploadFile = File(...),
+    frame_shape: Optional[str] = Form(None),  # e.g. "480,640,3", required for raw buffers
+    user_id: Optional[str] = Form(None),
+    name: Optional[str] = Form(None),
+    extra: Optional[str] = Form(None),  # JSON string for arbitrary metadata
+    spoof_model = Depends(get_spoof_model)
+) -> FivePoseResponse:
+    """Create a facial profile from five binary pose frames and store in ChromaDB."""
+    logger.info("Received 5-pose enrollment upload")
+    uploads = {"frontal": frontal, "left": left, "right": right, "up": up, "down": down}
+    shape = None
+    if frame_shape:
+        try:
+            shape = parse_frame_shape(frame_shape)
+        except ValueError as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=400, detail=str(e))
+    frames = {}
+    for pose in POSES:
+        upload = uploads[pose]
+        contents = await upload.read()
+        if len(contents) > MAX_FRAME_SIZE:
+            logger.error(f"Frame {pose} too large: {len(contents)} bytes")
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Frame {pose} too large. Max 10MB allowed.")
+        try:
+            if upload.content_type == RAW_CONTENT_TYPE:
+                if shape is None:
+                    raise ValueError("frame_shape is required for raw frames")
+                frames[pose] = frame_from_raw_bytes(contents, shape)
+            else:
+                frames[pose] = decode_image_bytes(contents)
+        except ValueError as e:
+            logger.error(f"Frame {pose} could not be decoded: {e}")
+            raise HTTPException(status_code=415, detail=f"Frame {pose} is not a valid RGB image")
+    embeddings_np, light = await _embed_pose_frames(frames)
+    return _store_profile(embeddings_np, user_id, name, _parse_extra(extra), light)
+
+def _parse_extra(extra: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not extra:
+        return None
+    try:
+        return json.loads(extra)
+    except Exception as e:
+        logger.warning(f"Failed to parse extra metadata: {e}", exc_info=True)
+        return None
+
+@router.post(
+    "/profile-create-5poses/session/{session_id}",
+    response_model=FivePoseResponse,
+    summary="Create a facial profile from a completed enrollment session",
+    description="Store the five pose embeddings captured by /enroll/qc/{bucket} during an enrollment session, without uploading the frames again.",
+    tags=["Profile"]
+)
+def profile_create_5poses_session(
+    session_id: str,
+    user_id: Optional[str] = Form(None),
+    name: Optional[str] = Form(None),
+    extra: Optional[str] = Form(None),  # JSON string for arbitrary metadata
+) -> FivePoseResponse:
+    """Create a facial profile from the QC results of an enrollment session and store in ChromaDB."""
+    logger.info(f"Received 5-pose enrollment for session {session_id}")
+    # Taken out of the store so a concurrent finalize of the same session cannot create a second profile
+    session = enrollment_sessions.pop(session_id)
+    if session is None:
+        logger.error(f"Unknown or expired enrollment session: {session_id}")
+        raise HTTPException(status_code=404, detail="Unknown or expired enrollment session")
+    missing = [pose for pose in POSES if pose not in session.captures]
+    if missing:
+        enrollment_sessions.restore(session)
+        logger.warning(f"Enrollment session {session_id} is missing poses: {missing}")
+        raise HTTPException(status_code=409, detail=f"Poses not captured yet: {missing}")
+    embeddings_np = np.vstack([np.asarray(session.captures[pose].embedding, dtype=np.float32) for pose in POSES])
+    light = [session.captures[pose].light_embedding for pose in POSES] if settings.CASCADE_ENABLED else None
+    try:
+        return _store_profile(embeddings_np, user_id, name, _parse_extra(extra), light)
+    except HTTPException:
+        enrollment_sessions.restore(session)
+        raise
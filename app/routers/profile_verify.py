@@ -1,49 +1,43 @@
 """
-Profile verification endpoint: Extracts facial embedding from an uploaded image, queries ChromaDB for nearest neighbors, and returns match result, distance, and metadata. Handles errors gracefully and logs all operations.
+Profile verification endpoint: Extracts facial embedding from an uploaded image, searches the in-memory gallery (kept in sync with ChromaDB) for nearest neighbors by exact cosine similarity, and returns match result, distance, and metadata. Handles errors gracefully and logs all operations.
 
-Request:
+Request (/verify-profile, 1:N search):
 - file: image file (required)
 - top_k: int (optional, number of nearest neighbors to consider)
 
+Request (/verify-profile/{user_id}, 1:1 against the claimed user's profiles only):
+- file: image file (required)
+
 Response:
-- match: bool
-- distance: float
+- match: bool, decided on the (POSE_FUSION-fused) cosine similarity
+- semantic_distance: ChromaDB l2 distance to the nearest stored vector; euclidean_distance, cosine_similarity, cosine_distance
 - message: str
 - matched_profile: dict (if match found, includes metadata)
+- model_tier: "light" when the cascade's light pack rejected the probe (CASCADE_ENABLED), else "heavy" (buffalo_l); matches are always "heavy"
 """
 
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status
-from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from PIL import Image
-from io import BytesIO
-from typing import List, Optional, Dict, Any
-from app.services.facial_analysis import analyze_face, verify_embeddings
-from app.services.spoof_model import get_spoof_model
+from typing import Callable, List, Optional, Dict, Any
+from app.services.image_decoding import LazyImage
+from app.services.result_cache import content_key, result_cache
+from app.services.facial_analysis import analyze_face_async, analyze_face_light_async, verify_similarity
+from app.services.model_cascade import ESCALATE, model_cascade
+from app.services.spoof_model import get_spoof_model, analyze_spoof_face, spoof_cache_kind
+from app.services.inference_executor import run_in_model_thread
 from app.services.logging_config import setup_logging
 from app.services.chromadb_service import chromadb_service
+from app.services.embedding_gallery import l2_distance
 from app.config import settings
 from app.services.standard_response import StandardResponse
-import tempfile
-import os
 
 router = APIRouter(prefix=f"/{settings.API_VERSION}", tags=["Profile"])
 logger = setup_logging()
 
 
 
-@router.post(
-    "/verify-profile",
-    response_model=StandardResponse,
-    summary="Verify a facial profile",
-    description="Upload an image to verify against stored profiles in ChromaDB. Returns match result and matched profile metadata if found."
-)
-async def verify_profile(
-    file: UploadFile = File(...),
-    top_k: int = 1,
-    spoof_model = Depends(get_spoof_model)
-):
-    logger.info("Received request to verify profile (ChromaDB)")
+async def _read_upload(file: UploadFile):
+    """Read the probe upload; returns (lazy image, content key) or raises 413 for oversized files."""
     contents = await file.read()
 
     # Check file size before reading (e.g., 10MB limit)
@@ -53,90 +47,194 @@ async def verify_profile(
     if size > MAX_SIZE:
         logger.error(f"File too large: {size} bytes")
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail={"code": 413, "message": "File too large. Max 10MB allowed."})
+    return LazyImage(contents), content_key(contents)
+
+async def _analyze_upload(upload: LazyImage, key: str, kind: str = "face", analyze=analyze_face_async) -> Dict[str, Any]:
+    """
+    Decode and analyze the probe (analyze_face_async, or analyze_face_light_async for the cascade's "face_light" kind);
+    repeated uploads are answered from the result cache without decoding. The result may hold an "error".
+    """
+    profile_data = result_cache.get(key, kind)
+    if profile_data is not None:
+        logger.info(f"Face analysis ({kind}) served from the result cache")
+        return profile_data
     try:
         logger.info("Attempting to open uploaded file as image")
-        img = Image.open(BytesIO(contents))
-        logger.info("Image file opened successfully")
+        img = upload.image
+        logger.info("Image file decoded successfully")
     except Exception as e:
         logger.error(f"Invalid image file: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail={"code": 415, "message": "Unsupported file type. Please upload a valid image."})
     try:
-        logger.info("Analyzing face in uploaded image")
-        profile_data = analyze_face(img)
+        logger.info(f"Analyzing face in uploaded image ({kind})")
+        profile_data = await analyze(img)
     except Exception as e:
         logger.error(f"Face analysis service error: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail={"code": 500, "message": "Face analysis failed."})
+    result_cache.put(key, kind, profile_data)
+    return profile_data
+
+async def _probe_embedding(upload: LazyImage, key: str):
+    """buffalo_l embedding and face geometry of the probe, or the matching HTTP error."""
+    profile_data = await _analyze_upload(upload, key)
     if "error" in profile_data:
         logger.warning(f"Face analysis failed: {profile_data['error']}")
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"code": 422, "message": profile_data["error"]})
-    embedding = profile_data["embedding"]
+    return profile_data["embedding"], profile_data["face"]
+
+async def _light_screen(upload: LazyImage, key: str, search: Callable, screen: Callable):
+    """
+    First tier of the verification cascade: light-pack embedding and light gallery search.
+    Returns (embedding, hits, face) when the light pack rejects the probe, None when it escalates to buffalo_l.
+    """
     try:
-        logger.info(f"Querying ChromaDB for top {top_k} nearest neighbors")
-        results = chromadb_service.query_embedding(
-            embedding, n_results=top_k)
-        logger.info(f"Queried ChromaDB for nearest neighbors: {results['metadatas']}")
-        if not results["ids"] or not results["ids"][0]:
-            logger.info("No matching profiles found in ChromaDB.")
-            return StandardResponse(success=True, data={
-                "match": False,
-                "distance": None,
-                "message": "No match found.",
-                "matched_profile": None,
-                "failure_reason": "no_match"
-            }, error=None)
-
-        best_distance = results["distances"][0][0]
-        best_metadata = results["metadatas"][0][0] if results["metadatas"] and results["metadatas"][0] else None
-
-        logger.info("Verifying embedding against nearest neighbor(s)")
-        match_result = verify_embeddings(embedding, results["embeddings"], metric="euclidean")
-        match = match_result["match"]
-        logger.info(f"Verification {'match' if match else 'no match'} (distance: {best_distance})")
-
-        failure_reason = None
-        # Only check spoofing if match is found
-        if match:
-            try:
-                logger.info("Running DeepFace anti-spoofing check")
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                    tmp.write(contents)
-                    tmp_path = tmp.name
-                logger.info(f"Temporary file created for anti-spoofing check: {tmp_path}")
-                
-                if not spoof_model:
-                    out = {"dominant_spoof": None, "spoof_score": None}
-                else:
-                    logger.info(f"Spoof model loaded: {spoof_model}")
-                    out = await run_in_threadpool(spoof_model.analyze_image, tmp_path)
-                logger.info(f"Anti-spoofing analysis result: {out}")
-                is_real_face = out.get("dominant_spoof") == "Real"
-
-                if not is_real_face:
-                    logger.warning("Anti-spoofing check failed: not a real face")
-                    match = False
-                    failure_reason = "not_real_face"
-            except Exception as e:
-                logger.error(f"DeepFace anti-spoofing error: {e}", exc_info=True)
+        profile_data = await _analyze_upload(upload, key, "face_light", analyze_face_light_async)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE:
+            raise
+        # The light pack failed (e.g. could not be loaded): buffalo_l still answers
+        model_cascade.record(ESCALATE)
+        return None
+    if "error" in profile_data:
+        # No face or several for the light detector: let buffalo_l decide
+        model_cascade.record(ESCALATE)
+        logger.info(f"Light pack could not analyze the probe ({profile_data['error']}); escalating")
+        return None
+    try:
+        hits = search(profile_data["embedding"])
+    except Exception as e:
+        logger.error(f"Light gallery search failed, escalating: {e}", exc_info=True)
+        model_cascade.record(ESCALATE)
+        return None
+    decision = screen(hits)
+    logger.info(f"Cascade decision: {decision} (light score {hits[0]['score'] if hits else None})")
+    if decision == ESCALATE:
+        return None
+    return profile_data["embedding"], hits, profile_data["face"]
+
+async def _verification_result(embedding: List[float], best: Dict[str, Any], upload: LazyImage, key: str, face: Dict[str, Any], spoof_model, tier: str = "heavy") -> Dict[str, Any]:
+    """Match decision against the best gallery hit, with the anti-spoofing check for matches; tier names the model pack that decided."""
+    # semantic_distance keeps ChromaDB's l2 distance to the nearest stored vector; the gallery score is the
+    # exact (POSE_FUSION-fused) cosine similarity, and the match is decided on it
+    best_distance = l2_distance(embedding, best)
+    best_metadata = best["metadata"] or None
+
+    logger.info("Verifying embedding against nearest neighbor(s)")
+    match_result = verify_similarity(best["score"])
+    match = match_result["match"]
+    logger.info(f"Verification {'match' if match else 'no match'} (distance: {best_distance})")
+
+    failure_reason = None
+    # Only check spoofing if match is found
+    if match:
+        try:
+            logger.info("Running DeepFace anti-spoofing check")
+            if not spoof_model:
+                out = {"dominant_spoof": None, "spoof_score": None}
+            else:
+                logger.info(f"Spoof model loaded: {spoof_model}")
+                out = result_cache.get(key, spoof_cache_kind())
+                if out is None:
+                    out = await run_in_model_thread(analyze_spoof_face, spoof_model, upload.image, face)
+                    if "error" not in out:
+                        result_cache.put(key, spoof_cache_kind(), out)
+            logger.info(f"Anti-spoofing analysis result: {out}")
+            is_real_face = out.get("dominant_spoof") == "Real"
+
+            if not is_real_face:
+                logger.warning("Anti-spoofing check failed: not a real face")
                 match = False
-                failure_reason = "spoofing_check_error"
-            finally:
-                if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                    logger.info(f"Cleaning up temp file: {tmp_path}")
-                    os.remove(tmp_path)
-        else:
-            logger.info("No match found, skipping anti-spoofing check")
-            failure_reason = "no_match"
-
-        logger.info(f"Returning verification result: match={match}, failure_reason={failure_reason}")
-        return StandardResponse(success=True, data={
-            "match": match,
-            "semantic_distance": best_distance,
-            "euclidean_distance": match_result["distance"] if match_result.get("distance") is not None else None,
-            "cosine_similarity": match_result["similarity"] if match_result.get("similarity") is not None else None,
-            "message": "Match" if match else "No match",
-            "matched_profile": best_metadata if match else None,
-            "failure_reason": failure_reason
-        }, error=None)
+                failure_reason = "not_real_face"
+        except Exception as e:
+            logger.error(f"DeepFace anti-spoofing error: {e}", exc_info=True)
+            match = False
+            failure_reason = "spoofing_check_error"
+    else:
+        logger.info("No match found, skipping anti-spoofing check")
+        failure_reason = "no_match"
+
+    logger.info(f"Returning verification result: match={match}, failure_reason={failure_reason}")
+    return {
+        "match": match,
+        "semantic_distance": best_distance,
+        "euclidean_distance": match_result["distance"] if match_result.get("distance") is not None else None,
+        "cosine_similarity": best["score"],
+        "cosine_distance": 1.0 - best["score"],
+        "message": "Match" if match else "No match",
+        "matched_profile": best_metadata if match else None,
+        "failure_reason": failure_reason,
+        "model_tier": tier
+    }
+
+def _no_match(tier: str) -> Dict[str, Any]:
+    return {
+        "match": False,
+        "distance": None,
+        "message": "No match found.",
+        "matched_profile": None,
+        "failure_reason": "no_match",
+        "model_tier": tier
+    }
+
+@router.post(
+    "/verify-profile",
+    response_model=StandardResponse,
+    summary="Verify a facial profile",
+    description="Upload an image to verify against stored profiles in ChromaDB. Returns match result and matched profile metadata if found."
+)
+async def verify_profile(
+    file: UploadFile = File(...),
+    top_k: int = 1,
+    spoof_model = Depends(get_spoof_model)
+):
+    logger.info("Received request to verify profile (ChromaDB)")
+    upload, key = await _read_upload(file)
+    if settings.CASCADE_ENABLED:
+        screened = await _light_screen(upload, key, lambda e: model_cascade.light.search_profiles(e, n_results=top_k), model_cascade.screen)
+        if screened is not None:
+            embedding, hits, face = screened
+            if not hits:
+                return StandardResponse(success=True, data=_no_match("light"), error=None)
+            return StandardResponse(success=True, data=await _verification_result(embedding, hits[0], upload, key, face, spoof_model, "light"), error=None)
+    embedding, face = await _probe_embedding(upload, key)
+    try:
+        logger.info(f"Searching the in-memory gallery for top {top_k} nearest neighbors")
+        hits = chromadb_service.search_profiles(embedding, n_results=top_k)
+        logger.info(f"Nearest neighbors: {[hit['metadata'] for hit in hits]}")
+        if not hits:
+            logger.info("No matching profiles found in ChromaDB.")
+            return StandardResponse(success=True, data=_no_match("heavy"), error=None)
+        return StandardResponse(success=True, data=await _verification_result(embedding, hits[0], upload, key, face, spoof_model), error=None)
     except Exception as e:
         logger.error(f"ChromaDB query failed: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail={"code": 500, "message": "Failed to query vector database."})
\ No newline at end of file
+        raise HTTPException(status_code=500, detail={"code": 500, "message": "Failed to query vector database."})
+
+# Declared after /verify-profile/batch (registered by an earlier router) so "batch" is never taken as a user_id
+@router.post(
+    "/verify-profile/{user_id}",
+    response_model=StandardResponse,
+    summary="Verify a facial image against a claimed identity",
+    description="Upload an image to verify against the profile(s) enrolled for user_id only (1:1). Returns match result and matched profile metadata."
+)
+async def verify_claimed_profile(
+    user_id: str,
+    file: UploadFile = File(...),
+    spoof_model = Depends(get_spoof_model)
+):
+    logger.info(f"Received request to verify claimed identity {user_id}")
+    upload, key = await _read_upload(file)
+    if settings.CASCADE_ENABLED:
+        screened = await _light_screen(upload, key, lambda e: model_cascade.light.search_user(e, user_id), lambda hits: model_cascade.screen_user(hits, user_id))
+        if screened is not None:
+            embedding, hits, face = screened
+            return StandardResponse(success=True, data=await _verification_result(embedding, hits[0], upload, key, face, spoof_model, "light"), error=None)
+    embedding, face = await _probe_embedding(upload, key)
+    try:
+        hits = chromadb_service.search_user(embedding, user_id)
+    except Exception as e:
+        logger.error(f"Gallery lookup failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail={"code": 500, "message": "Failed to query vector database."})
+    if hits is None:
+        logger.info(f"No profile enrolled for user_id {user_id}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": 404, "message": "No profile enrolled for this user_id."})
+    return StandardResponse(success=True, data=await _verification_result(embedding, hits[0], upload, key, face, spoof_model), error=None)
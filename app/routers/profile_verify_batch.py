@@ -0,0 +1,287 @@
+"""
+Batch profile verification endpoint: Verifies many probe images in one call. Images are decoded in parallel, faces are detected per image and embedded with batched recognition calls, all probes are scored against the in-memory gallery with a single matrix product, and anti-spoofing runs only for probes whose best candidate passes the match threshold. Returns one result per image, in upload order.
+
+Request:
+- files: image files (multipart, repeat the field), and/or
+- archive: a .zip of images (entries in archive order, after the files)
+- top_k: int (optional, number of nearest neighbors to consider)
+
+Response:
+- results: List[dict] with index, filename, match, semantic_distance, euclidean_distance, cosine_similarity, cosine_distance, message, matched_profile, failure_reason, model_tier
+
+With CASCADE_ENABLED, images are first analyzed with the light pack and searched in the light gallery; probes
+the light pack rejects are answered from it, and every other probe (every potential match) runs buffalo_l.
+"""
+
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status
+from typing import List, Optional, Tuple
+from app.services.facial_analysis import analyze_faces, get_light_app, verify_similarity
+from app.services.model_cascade import ESCALATE, model_cascade
+from app.services.image_decoding import DecodedImage
+from app.services.spoof_model import get_spoof_model, analyze_spoof_face, spoof_cache_kind
+from app.services.inference_executor import run_inference, run_in_model_thread
+from app.services.logging_config import setup_logging
+from app.services.chromadb_service import chromadb_service
+from app.services.embedding_gallery import l2_distance
+from app.services.result_cache import content_key, result_cache
+from app.config import settings
+from app.services.standard_response import StandardResponse
+import asyncio
+import zipfile
+from io import BytesIO
+
+router = APIRouter(prefix=f"/{settings.API_VERSION}", tags=["Profile"])
+logger = setup_logging()
+
+MAX_SIZE = 10 * 1024 * 1024  # 10 MB per image
+
+# failure_reason of the per-image error rows, by status code
+FAILURE_REASONS = {413: "file_too_large", 415: "invalid_image", 422: "face_analysis_error"}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def _archive_images(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Image entries of a zip archive (by extension), without decompressing anything."""
+    return [info for info in zf.infolist() if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+def _read_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> Optional[bytes]:
+    """Bytes of an archive entry, or None when it is larger than MAX_SIZE (never decompressed past the limit)."""
+    if info.file_size > MAX_SIZE:
+        return None
+    with zf.open(info) as entry:
+        contents = entry.read(MAX_SIZE + 1)
+    return contents if len(contents) <= MAX_SIZE else None
+
+def _too_large(contents: Optional[bytes]) -> bool:
+    return contents is None or len(contents) > MAX_SIZE
+
+def _max_archive_size() -> int:
+    """Largest zip accepted: every allowed image at MAX_SIZE (stored entries are never larger than their data)."""
+    return MAX_SIZE * settings.VERIFY_BATCH_MAX_FILES
+
+async def _read_archive(archive: UploadFile) -> bytes:
+    """The archive's bytes, or 413 when it is larger than _max_archive_size (read no further than the limit)."""
+    limit = _max_archive_size()
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail={"code": 413, "message": f"Archive too large. Max {limit // (1024 * 1024)}MB allowed."})
+    if archive.size is not None and archive.size > limit:
+        raise too_large
+    data = await archive.read(limit + 1)
+    if len(data) > limit:
+        raise too_large
+    return data
+
+def _decode(contents: bytes) -> Optional[DecodedImage]:
+    try:
+        return DecodedImage.from_bytes(contents)
+    except ValueError:
+        return None
+
+def _error_result(index: int, filename: str, code: int, message: str, tier: str = "heavy") -> dict:
+    """Result row of an image that could not be scored; light-pack failures escalate, so errors are reported as heavy."""
+    return {"index": index, "filename": filename, "match": False, "message": message, "matched_profile": None,
+            "failure_reason": FAILURE_REASONS.get(code, "face_analysis_error"), "error": {"code": code, "message": message},
+            "model_tier": tier}
+
+async def _light_tier(keys: List[str], decoded: list, valid: List[int], light_analyses: dict, top_k: int):
+    """
+    First tier of the verification cascade for a batch: light-pack analysis of the decoded images (batched)
+    plus the cached ones, and one light gallery search. Returns the indices escalated to buffalo_l, and
+    (index, embedding, hits, face) for the probes the light pack rejected.
+    """
+    analyses = dict(light_analyses)
+    try:
+        fresh = await run_inference(analyze_faces, [decoded[i] for i in valid], get_light_app) if valid else []
+    except Exception as e:
+        logger.error(f"Light face analysis failed, escalating: {e}", exc_info=True)
+        fresh = None
+    if fresh is None:
+        escalated = sorted(valid + list(analyses))
+        for _ in escalated:
+            model_cascade.record(ESCALATE)
+        return escalated, []
+    for index, profile_data in zip(valid, fresh):
+        result_cache.put(keys[index], "face_light", profile_data)
+        analyses[index] = profile_data
+    # No face or several for the light detector: let buffalo_l decide
+    escalated = [index for index, profile_data in analyses.items() if "error" in profile_data]
+    for _ in escalated:
+        model_cascade.record(ESCALATE)
+    probes = [(index, profile_data) for index, profile_data in sorted(analyses.items()) if "error" not in profile_data]
+    decided = []
+    if probes:
+        try:
+            hits_per_probe = model_cascade.light.search_profiles_many([profile_data["embedding"] for _, profile_data in probes], n_results=top_k)
+        except Exception as e:
+            logger.error(f"Light gallery search failed, escalating: {e}", exc_info=True)
+            for _ in probes:
+                model_cascade.record(ESCALATE)
+            return sorted(analyses), []
+        for (index, profile_data), hits in zip(probes, hits_per_probe):
+            if model_cascade.screen(hits) == ESCALATE:
+                escalated.append(index)
+            else:
+                decided.append((index, profile_data["embedding"], hits, profile_data["face"]))
+    logger.info(f"Cascade: {len(decided)} probes rejected by the light pack, {len(escalated)} escalated")
+    return sorted(escalated), decided
+
+@router.post(
+    "/verify-profile/batch",
+    response_model=StandardResponse,
+    summary="Verify many facial images in one call",
+    description="Upload several images (multipart files and/or a zip archive) to verify each against stored profiles. Returns per-image results in upload order."
+)
+async def verify_profile_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    top_k: int = 1,
+    spoof_model = Depends(get_spoof_model)
+):
+    logger.info("Received batch verification request")
+    too_many = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail={"code": 413, "message": f"Too many images. Max {settings.VERIFY_BATCH_MAX_FILES} per batch."})
+    # Archive entries over MAX_SIZE are kept as None, so they are reported without being decompressed
+    items: List[Tuple[str, Optional[bytes]]] = []
+    for upload in files or []:
+        items.append((upload.filename, await upload.read()))
+    if archive is not None:
+        try:
+            with zipfile.ZipFile(BytesIO(await _read_archive(archive))) as zf:
+                entries = _archive_images(zf)
+                # Count before reading, so a huge archive is refused without decompressing it
+                if len(items) + len(entries) > settings.VERIFY_BATCH_MAX_FILES:
+                    raise too_many
+                items.extend((info.filename, _read_entry(zf, info)) for info in entries)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail={"code": 415, "message": "Archive is not a valid zip file."})
+    if not items:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"code": 422, "message": "No images provided."})
+    if len(items) > settings.VERIFY_BATCH_MAX_FILES:
+        raise too_many
+    logger.info(f"Batch contains {len(items)} images")
+
+    results: List[Optional[dict]] = [None] * len(items)
+    keys = [None if _too_large(contents) else content_key(contents) for _, contents in items]
+    # Images seen recently are answered from the result cache; only the rest are decoded and analyzed
+    analyses = {}
+    light_analyses = {}
+    for index, (_, contents) in enumerate(items):
+        if not _too_large(contents):
+            cached = result_cache.get(keys[index], "face")
+            if cached is not None:
+                analyses[index] = cached
+            elif settings.CASCADE_ENABLED:
+                cached = result_cache.get(keys[index], "face_light")
+                if cached is not None:
+                    light_analyses[index] = cached
+    # Decode in parallel on the inference threads
+    decoded = await asyncio.gather(*(
+        run_in_model_thread(_decode, contents) if not _too_large(contents) and index not in analyses and index not in light_analyses else asyncio.sleep(0, result=None)
+        for index, (_, contents) in enumerate(items)
+    ))
+    valid = []
+    for index, ((filename, contents), image) in enumerate(zip(items, decoded)):
+        if _too_large(contents):
+            results[index] = _error_result(index, filename, 413, "File too large. Max 10MB allowed.")
+        elif index in analyses or index in light_analyses:
+            continue
+        elif image is None:
+            results[index] = _error_result(index, filename, 415, "Unsupported file type. Please upload a valid image.")
+        else:
+            valid.append(index)
+
+    # (index, embedding, hits, model tier) of every probe with a face, scored against its tier's gallery
+    scored = []
+    faces = {}
+    if settings.CASCADE_ENABLED:
+        escalated, decided = await _light_tier(keys, decoded, valid, light_analyses, top_k)
+        for index, embedding, hits, face in decided:
+            scored.append((index, embedding, hits, "light"))
+            faces[index] = face
+        # Escalated images answered from the light cache have not been decoded yet
+        missing = [i for i in escalated if decoded[i] is None]
+        for index, image in zip(missing, await asyncio.gather(*(run_in_model_thread(_decode, items[i][1]) for i in missing))):
+            decoded[index] = image
+        valid = []
+        for index in escalated:
+            if decoded[index] is None:
+                results[index] = _error_result(index, items[index][0], 415, "Unsupported file type. Please upload a valid image.")
+            else:
+                valid.append(index)
+
+    # Batched detection/recognition for every decodable image (escalated ones only, with the cascade)
+    fresh = await run_inference(analyze_faces, [decoded[i] for i in valid]) if valid else []
+    for index, profile_data in zip(valid, fresh):
+        result_cache.put(keys[index], "face", profile_data)
+        analyses[index] = profile_data
+    probes = []
+    for index, profile_data in sorted(analyses.items()):
+        if "error" in profile_data:
+            results[index] = _error_result(index, items[index][0], 422, profile_data["error"])
+        else:
+            probes.append((index, profile_data["embedding"]))
+            faces[index] = profile_data["face"]
+
+    if probes:
+        try:
+            hits_per_probe = chromadb_service.search_profiles_many([embedding for _, embedding in probes], n_results=top_k)
+        except Exception as e:
+            logger.error(f"Gallery search failed: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail={"code": 500, "message": "Failed to query vector database."})
+        scored.extend((index, embedding, hits, "heavy") for (index, embedding), hits in zip(probes, hits_per_probe))
+
+    if scored:
+        candidates = []
+        for index, embedding, hits, tier in scored:
+            filename = items[index][0]
+            if not hits:
+                results[index] = {"index": index, "filename": filename, "match": False, "distance": None,
+                                  "message": "No match found.", "matched_profile": None, "failure_reason": "no_match", "model_tier": tier}
+                continue
+            best = hits[0]
+            # Decided on the (POSE_FUSION-fused) gallery score, as /verify-profile
+            match_result = verify_similarity(best["score"])
+            results[index] = {
+                "index": index,
+                "filename": filename,
+                "match": match_result["match"],
+                "semantic_distance": l2_distance(embedding, best),
+                "euclidean_distance": match_result.get("distance"),
+                "cosine_similarity": best["score"],
+                "cosine_distance": 1.0 - best["score"],
+                "matched_profile": best["metadata"] or None,
+                "failure_reason": None if match_result["match"] else "no_match",
+                "model_tier": tier,
+            }
+            if match_result["match"]:
+                candidates.append(index)
+
+        async def _spoof(index: int) -> dict:
+            out = result_cache.get(keys[index], spoof_cache_kind())
+            if out is None:
+                image = decoded[index] or await run_in_model_thread(_decode, items[index][1])
+                out = await run_in_model_thread(analyze_spoof_face, spoof_model, image, faces[index])
+                if "error" not in out:
+                    result_cache.put(keys[index], spoof_cache_kind(), out)
+            return out
+
+        # Anti-spoofing only for probes above the match threshold
+        if candidates:
+            if spoof_model:
+                spoof_results = await asyncio.gather(*(_spoof(i) for i in candidates), return_exceptions=True)
+            else:
+                spoof_results = [{"dominant_spoof": None}] * len(candidates)
+            for index, out in zip(candidates, spoof_results):
+                if isinstance(out, Exception):
+                    logger.error(f"DeepFace anti-spoofing error for item {index}: {out}")
+                    results[index].update(match=False, failure_reason="spoofing_check_error")
+                elif out.get("dominant_spoof") != "Real":
+                    results[index].update(match=False, failure_reason="not_real_face")
+
+        for index, _, _, _ in scored:
+            result = results[index]
+            result["message"] = "Match" if result["match"] else "No match"
+            if not result["match"]:
+                result["matched_profile"] = None
+
+    matched = sum(1 for r in results if r["match"])
+    logger.info(f"Batch verification done: {matched}/{len(results)} matched")
+    return StandardResponse(success=True, data={"results": results}, error=None)
@@ -1,14 +1,16 @@
-# FastAPI endpoints for five-pose guided enrollment QC only
+# FastAPI endpoints for five-pose guided enrollment QC and server-side enrollment sessions
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from starlette.concurrency import run_in_threadpool
-from tempfile import NamedTemporaryFile
-import numpy as np
-import cv2
-from app.services.facial_analysis import face_app
-from app.services.spoof_model import get_spoof_model
+from typing import Optional
+from app.services.facial_analysis import detect_poses_async, embed_detected_face, unmirror_face
+from app.services.enrollment_sessions import PoseCapture, enrollment_sessions
+from app.services.image_decoding import DecodedImage
+from app.services.spoof_model import get_spoof_model, analyze_spoof_face
+from app.services.inference_executor import run_inference, run_in_model_thread
 from app.services.logging_config import setup_logging
-from app.services.quality_check_utils import is_blurry, is_bright
+from app.services.model_cascade import light_embeddings
+from app.config import settings
+from app.services.quality_metrics import face_quality, quality_failure
 
 router = APIRouter(prefix="/enroll", tags=["Enroll"])
 logger = setup_logging()
@@ -21,38 +23,71 @@ POSE_BUCKETS = {
     "down":    lambda y, p: p >= 12,
 }
 
+@router.post("/sessions")
+def create_session():
+    """Start an enrollment session; pass its session_id to each QC call, then finalize it to create the profile."""
+    if not enrollment_sessions.shared and settings.WORKERS > 1:
+        # Requests are not routed back to the worker holding an in-process session
+        logger.error("Enrollment sessions need ENROLL_SESSION_DIR (or RESULT_CACHE_DIR) when WORKERS > 1")
+        raise HTTPException(503, "Enrollment sessions are not available: set ENROLL_SESSION_DIR to run them with several workers")
+    session = enrollment_sessions.create()
+    logger.info(f"Enrollment session created: {session.session_id}")
+    return session.summary(enrollment_sessions.ttl)
+
+@router.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    session = enrollment_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(404, "Unknown or expired enrollment session")
+    return session.summary(enrollment_sessions.ttl)
+
+@router.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if enrollment_sessions.pop(session_id) is None:
+        raise HTTPException(404, "Unknown or expired enrollment session")
+    return {"deleted": session_id}
+
 @router.post("/qc/{bucket}")
-async def quick_check(bucket: str, frame: UploadFile = File(...), spoof_model = Depends(get_spoof_model)):
+async def quick_check(bucket: str, frame: UploadFile = File(...), session_id: Optional[str] = None, spoof_model = Depends(get_spoof_model)):
     logger.info(f"QC request for bucket: {bucket}")
     if bucket not in POSE_BUCKETS:
         logger.error(f"Invalid pose bucket: {bucket}")
         raise HTTPException(400, "bad bucket")
+    if session_id is not None and enrollment_sessions.get(session_id) is None:
+        logger.error(f"Unknown or expired enrollment session: {session_id}")
+        raise HTTPException(404, "Unknown or expired enrollment session")
     contents = await frame.read()
-    rgb = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)[:, :, ::-1]
-    rgb = rgb[:, ::-1, :] 
-    faces = face_app.get(rgb)
+    try:
+        image = DecodedImage.from_bytes(contents)
+    except ValueError as e:
+        logger.error(f"Invalid image for bucket {bucket}: {e}")
+        raise HTTPException(415, "Unsupported file type. Please upload a valid image.")
+    # Selfie view: detect on the mirrored frame; QC only needs face count and pose, so skip recognition
+    faces = await detect_poses_async(image.mirrored)
     if not faces:
         logger.warning(f"No face detected for bucket: {bucket}")
         return {"ok": False, "reason": "no face"}
+    if session_id is not None and len(faces) > 1:
+        logger.warning(f"Multiple faces detected for bucket: {bucket}")
+        return {"ok": False, "reason": "multiple faces"}
     f = faces[0]
     yaw, pitch = f.pose[:2]
     logger.info(f"Detected pose for {bucket}: yaw={yaw}, pitch={pitch}")
     # if not POSE_BUCKETS[bucket](yaw, pitch):
     #     logger.warning(f"Wrong pose for {bucket}: yaw={yaw}, pitch={pitch}")
     #     return {"ok": False, "reason": "wrong pose"}
-    if is_blurry(rgb):
-        logger.warning(f"Blurry image for {bucket}")
-        return {"ok": False, "reason": "blurry"}
-    if not is_bright(rgb):
-        logger.warning(f"Bad lighting for {bucket}")
-        return {"ok": False, "reason": "bad_light"}
+    # Blur, brightness, contrast and clipping of the detected face region, in one pass
+    quality = await run_in_model_thread(face_quality, image.mirrored, f.bbox)
+    reason = quality_failure(quality)
+    if reason is not None:
+        logger.warning(f"Quality check failed for {bucket}: {reason} {quality}")
+        return {"ok": False, "reason": reason, "quality": quality}
 
     if spoof_model:
-        with NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
         try:
-            spoof_result = await run_in_threadpool(spoof_model.analyze_image, tmp_path)
+            # The crop reuses the QC detection on the mirrored frame; the frame input is the original (unmirrored) pixels
+            spoof_image = image.mirrored if settings.SPOOF_INPUT == "crop" else image
+            spoof_result = await run_in_model_thread(analyze_spoof_face, spoof_model, spoof_image, f)
             logger.info(f"Spool result {bucket}: {spoof_result}")
             if spoof_result.get("dominant_spoof") != "Real":
                 logger.warning(f"Spoof detected for {bucket}")
@@ -60,4 +95,21 @@ async def quick_check(bucket: str, frame: UploadFile = File(...), spoof_model =
         except Exception as e:
             logger.error(f"Spoof model error for {bucket}: {e}")
     logger.info(f"QC passed for {bucket}")
-    return {"ok": True}
+    if session_id is None:
+        return {"ok": True, "quality": quality}
+    # Keep the accepted frame's embedding server-side; recognition runs on the original (unmirrored)
+    # pixels at the already-detected landmarks, so the profile can be finalized without re-uploading
+    face = unmirror_face(f, round(image.width * image.scale))
+    embedding = await run_inference(embed_detected_face, image, face)
+    # The verification cascade's light template is taken from the same face
+    light_embedding = (await run_inference(light_embeddings, [image], [face]))[0] if settings.CASCADE_ENABLED else None
+    capture = PoseCapture(
+        embedding=embedding,
+        pose=[float(v) for v in f.pose],
+        quality={"det_score": float(f.det_score), **quality},
+        light_embedding=light_embedding,
+    )
+    session = enrollment_sessions.add_capture(session_id, bucket, capture)
+    if session is None:
+        raise HTTPException(404, "Unknown or expired enrollment session")
+    return {"ok": True, "quality": quality, **session.summary(enrollment_sessions.ttl)}
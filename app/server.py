@@ -0,0 +1,65 @@
+"""
+Multi-worker launcher.
+
+Usage:
+    python -m app.server --workers 4
+
+Sets a per-worker thread budget (cores // workers) for ONNX Runtime, TensorFlow and OpenMP, exports
+WORKERS, and runs uvicorn with that many worker processes. uvicorn starts the workers as fresh
+processes that inherit the environment, and supervises and restarts them.
+
+Nothing is shared between workers: ONNX Runtime sessions own thread pools that do not survive fork
+and TensorFlow is not fork-safe, so every worker builds its own InsightFace sessions (with its thread
+budget) and anti-spoofing model in the app's startup hook, and model memory grows linearly with the
+number of workers. Several workers should share a ChromaDB server (CHROMA_HOST) rather than the
+embedded store.
+"""
+import argparse
+import os
+import sys
+
+
+def thread_budget(workers: int) -> int:
+    """Threads each worker may use without oversubscribing the machine's cores."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def apply_thread_budget(threads: int) -> None:
+    """Export the budget before any model library is imported; explicit environment settings win."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("ORT_INTRA_OP_THREADS", str(threads))
+    os.environ.setdefault("ORT_INTER_OP_THREADS", "1")
+    os.environ.setdefault("TF_INTRA_OP_THREADS", str(threads))
+    os.environ.setdefault("TF_INTER_OP_THREADS", "1")
+
+
+def run(workers: int, host: str, port: int) -> None:
+    """Export the thread budget and WORKERS, then serve app.main:app with `workers` uvicorn workers."""
+    apply_thread_budget(thread_budget(workers))
+    # Workers read settings.WORKERS (e.g. to refuse in-process enrollment sessions), whatever set --workers
+    os.environ["WORKERS"] = str(workers)
+    import uvicorn
+    from app.config import settings
+    from app.services.logging_config import setup_logging
+    logger = setup_logging()
+
+    if workers > 1 and not settings.CHROMA_HOST:
+        logger.warning("Running several workers on the embedded ChromaDB store; set CHROMA_HOST to share a ChromaDB server.")
+    logger.info(f"Starting {workers} worker(s) with {thread_budget(workers)} thread(s) each")
+    uvicorn.run("app.main:app", host=host, port=port, workers=workers)
+
+
+def main() -> None:
+    # Defaults come straight from the environment: app.config must not be imported before the
+    # thread budget is exported, since Settings reads the environment at import time.
+    parser = argparse.ArgumentParser(description="Run the API with several uvicorn workers and a per-worker thread budget.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 1)))
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    args = parser.parse_args()
+    run(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,200 @@
 """
 ChromaDB service for storing and querying facial embeddings.
+
+With a shared ChromaDB server (CHROMA_HOST), every write call (one add_embeddings batch, one delete_*) also
+stores a fresh random version marker in the collection metadata. Other processes (workers, bulk_enroll)
+compare it and the count with their in-memory gallery every GALLERY_SYNC_INTERVAL seconds and reload on any
+difference, so a delete followed by an add is noticed even though the count did not change. The embedded
+store is single-process and its writes update the gallery directly, so no marker is written there.
+The collection is looked up by name again at each check, and writes re-fetch it once when it was dropped
+by a reset in another process.
 """
+import uuid
 import chromadb
+import numpy as np
 from chromadb.config import Settings
+from chromadb.errors import NotFoundError
 from app.services.logging_config import setup_logging
-from typing import Dict, Any, List, Optional
+from app.services.embedding_gallery import EmbeddingGallery
+from app.services.stage_timing import timed
+from typing import Dict, Any, Iterator, List, Optional
 from app.config import settings
 import os
+import threading
+import time
 
 logger = setup_logging()
 
+# Collection metadata key holding the version marker of the latest write
+VERSION_KEY = "gallery_version"
+
 class ChromaDBService:
     def __init__(self, collection_name: str = None) -> None:
-        """Initialize ChromaDB client and collection."""
+        """Configure the service; the ChromaDB client and collection are opened by connect() (at startup, or on first use)."""
         if collection_name is None:
             collection_name = getattr(settings, "CHROMA_COLLECTION", "face_profiles")
+        self.collection_name = collection_name
+        self._client = None
+        self._collection = None
+        self._connect_lock = threading.Lock()
+        # In-memory normalized copy of the collection used for exact search
+        self.gallery = EmbeddingGallery()
+        self._gallery_lock = threading.Lock()
+        self._gallery_checked_at = 0.0
+        # Version marker of the collection the gallery was loaded from (or last brought up to date with)
+        self._gallery_version = None
+        # Other processes write to the same collection (shared server): publish version markers
+        self.shared = bool(settings.CHROMA_HOST)
+
+    def connect(self) -> None:
+        """Open the ChromaDB client and collection if not done yet."""
+        if self._collection is not None:
+            return
+        with self._connect_lock:
+            if self._collection is not None:
+                return
+            if settings.CHROMA_HOST:
+                # Shared server: required when several worker processes write to the same store
+                client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+                location = f"{settings.CHROMA_HOST}:{settings.CHROMA_PORT}"
+            else:
+                # Use absolute path for persistent storage
+                persist_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../chromadb_data"))
+                os.makedirs(persist_dir, exist_ok=True)
+                client = chromadb.PersistentClient(path=persist_dir)
+                location = persist_dir
+            self._client = client
+            self._collection = client.get_or_create_collection(self.collection_name)
+            logger.info(f"ChromaDB collection '{self.collection_name}' initialized at {location}.")
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.connect()
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self.connect()
+        return self._collection
+
+    @collection.setter
+    def collection(self, collection) -> None:
+        self._collection = collection
 
-        # Use absolute path for persistent storage
-        persist_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../chromadb_data"))
-        os.makedirs(persist_dir, exist_ok=True)
+    def _version(self, collection) -> Optional[str]:
+        return (collection.metadata or {}).get(VERSION_KEY)
 
-        self.client = chromadb.PersistentClient(path=persist_dir)
-        self.collection = self.client.get_or_create_collection(collection_name)
-        logger.info(f"ChromaDB collection '{collection_name}' initialized at {persist_dir}.")
+    def _refetch(self):
+        """Look the collection up by name again (another process may have reset it) and return it."""
+        self.collection = self.client.get_or_create_collection(self.collection_name)
+        return self.collection
 
+    def ensure_gallery(self) -> EmbeddingGallery:
+        """Load the in-memory gallery on first use, and reload it if another process changed the collection."""
+        now = time.monotonic()
+        stale = (
+            self.gallery.loaded
+            and settings.GALLERY_SYNC_INTERVAL > 0
+            and now - self._gallery_checked_at > settings.GALLERY_SYNC_INTERVAL
+        )
+        if self.gallery.loaded and not stale:
+            return self.gallery
+        with self._gallery_lock:
+            if stale and self._client is not None:
+                # Fresh handle and metadata: follows resets and picks up the latest version marker
+                self._refetch()
+            reload = not self.gallery.loaded or (
+                stale and (self._version(self.collection) != self._gallery_version or self.collection.count() != len(self.gallery))
+            )
+            if reload:
+                started = time.monotonic()
+                # Read before loading, so a write landing during the load triggers another reload
+                version = self._version(self.collection)
+                self.gallery.load_from_collection(self.collection)
+                self._gallery_version = version
+                logger.info(f"Loaded {len(self.gallery)} embeddings into the in-memory gallery in {time.monotonic() - started:.2f}s.")
+            self._gallery_checked_at = now
+        return self.gallery
+
+    def _write(self, operation) -> Any:
+        """Run operation(collection), re-fetching the collection once if another process dropped it (reset)."""
+        try:
+            return operation(self.collection)
+        except NotFoundError:
+            logger.warning(f"ChromaDB collection '{self.collection_name}' was reset by another process; re-fetching it.")
+            collection = self._refetch()
+            with self._gallery_lock:
+                # Reload on next use: the gallery still holds the dropped collection's embeddings
+                self.gallery.loaded = False
+            return operation(collection)
+
+    def _gallery_add(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]]) -> None:
+        """Mirror an add into the gallery; under the load lock, so an add racing a (re)load is never lost."""
+        with self._gallery_lock:
+            if self.gallery.loaded:
+                self.gallery.add(ids, embeddings, metadatas)
+
+    def _mark_changed(self) -> None:
+        """Store a new version marker after a write, so other processes reload their galleries (shared server only)."""
+        if not self.shared:
+            return
+        try:
+            metadata = self.client.get_collection(self.collection_name).metadata or {}
+            version = uuid.uuid4().hex
+            # The distance settings (hnsw:*) cannot be passed to modify; they are kept by the collection
+            self.collection.modify(metadata={**{k: v for k, v in metadata.items() if not k.startswith("hnsw:")}, VERSION_KEY: version})
+        except Exception as e:
+            # Other processes still notice count changes
+            logger.warning(f"Failed to update the version marker of ChromaDB collection '{self.collection_name}': {e}")
+            return
+        with self._gallery_lock:
+            # Our gallery already has this write; it is only up to date if it had every earlier one too
+            if metadata.get(VERSION_KEY) == self._gallery_version:
+                self._gallery_version = version
+
+    @timed("store")
     def add_embedding(self, embedding_id: str, embedding: List[float], metadata: Dict[str, Any]) -> None:
         """Add a facial embedding and its metadata to the collection."""
         try:
-            self.collection.add(
+            self._write(lambda collection: collection.add(
                 ids=[embedding_id],
                 embeddings=[embedding],
                 metadatas=[metadata]
-            )
+            ))
+            self._gallery_add([embedding_id], [embedding], [metadata])
+            self._mark_changed()
             logger.info(f"Embedding {embedding_id} added to ChromaDB.")
         except Exception as e:
             logger.error(f"Failed to add embedding to ChromaDB: {e}")
             raise
 
+    @timed("store")
+    def add_embeddings(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]], batch_size: int = 1000) -> None:
+        """Add many embeddings with one collection.add per chunk of `batch_size` (capped at the client's max batch size)."""
+        try:
+            max_batch = getattr(self.client, "get_max_batch_size", lambda: batch_size)()
+            step = max(1, min(batch_size, max_batch))
+            for start in range(0, len(ids), step):
+                end = start + step
+                self._write(lambda collection: collection.add(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end]
+                ))
+            self._gallery_add(ids, embeddings, metadatas)
+            self._mark_changed()
+            logger.info(f"{len(ids)} embeddings added to ChromaDB.")
+        except Exception as e:
+            logger.error(f"Failed to add embeddings to ChromaDB: {e}")
+            raise
+
+    @timed("search")
     def query_embedding(self, embedding: List[float], n_results: int = 1) -> dict:
         """Query the collection for nearest neighbors to the given embedding."""
         try:
@@ -51,12 +209,154 @@ class ChromaDBService:
             logger.error(f"Failed to query ChromaDB: {e}")
             raise
 
-    def delete_by_filename(self, filename: str) -> None:
+    @timed("search")
+    def search(self, embedding: List[float], n_results: int = 1) -> List[Dict[str, Any]]:
+        """Exact cosine search of the in-memory gallery; hits carry id, score, metadata and normalized embedding."""
+        try:
+            return self.ensure_gallery().search(embedding, k=n_results)
+        except Exception as e:
+            logger.error(f"Failed to search the embedding gallery: {e}")
+            raise
+
+    @timed("search")
+    def search_many(self, embeddings: List[List[float]], n_results: int = 1) -> List[List[Dict[str, Any]]]:
+        """Exact cosine search for several probes with one matrix product; one hit list per probe."""
+        try:
+            return self.ensure_gallery().search_many(embeddings, k=n_results)
+        except Exception as e:
+            logger.error(f"Failed to search the embedding gallery: {e}")
+            raise
+
+    def search_profiles(self, embedding: List[float], n_results: int = 1) -> List[Dict[str, Any]]:
+        """Like search, but collapses multi-vector templates to one hit per profile (POSE_FUSION fusion)."""
+        return self.search_profiles_many([embedding], n_results=n_results)[0]
+
+    @timed("search")
+    def search_profiles_many(self, embeddings: List[List[float]], n_results: int = 1) -> List[List[Dict[str, Any]]]:
+        """search_profiles for several probes with one matrix product."""
+        try:
+            return self.ensure_gallery().search_profiles_many(embeddings, k=n_results, fusion=settings.POSE_FUSION)
+        except Exception as e:
+            logger.error(f"Failed to search the embedding gallery: {e}")
+            raise
+
+    def get_page(self, limit: int, offset: int = 0, include_embeddings: bool = False) -> Dict[str, Any]:
+        """One page of the collection (ids, metadatas, documents and optionally embeddings as float lists) plus the total count."""
+        include = ["metadatas", "documents"] + (["embeddings"] if include_embeddings else [])
+        try:
+            page = self.collection.get(limit=limit, offset=offset, include=include)
+            total = self.collection.count()
+        except Exception as e:
+            logger.error(f"Failed to read ChromaDB page (offset={offset}, limit={limit}): {e}")
+            raise
+        ids = page.get("ids") or []
+        result = {
+            "ids": ids,
+            "metadatas": page.get("metadatas") or [None] * len(ids),
+            "documents": page.get("documents") or [None] * len(ids),
+            "total": total,
+        }
+        if include_embeddings:
+            embeddings = page.get("embeddings")
+            result["embeddings"] = [] if embeddings is None or len(embeddings) == 0 else np.asarray(embeddings, dtype=np.float32).tolist()
+        return result
+
+    def iter_pages(self, batch_size: int = 1000, include_embeddings: bool = True) -> Iterator[Dict[str, Any]]:
+        """Page through the whole collection; embeddings come back as one float32 array per page."""
+        include = ["metadatas", "documents"] + (["embeddings"] if include_embeddings else [])
+        offset = 0
+        while True:
+            page = self.collection.get(limit=batch_size, offset=offset, include=include)
+            ids = page.get("ids") or []
+            if not ids:
+                return
+            if include_embeddings:
+                page["embeddings"] = np.asarray(page.get("embeddings"), dtype=np.float32).reshape(len(ids), -1)
+            yield page
+            offset += len(ids)
+            if len(ids) < batch_size:
+                return
+
+    def _max_batch(self, batch_size: int) -> int:
+        return max(1, min(batch_size, getattr(self.client, "get_max_batch_size", lambda: batch_size)()))
+
+    @timed("search")
+    def search_user(self, embedding: List[float], user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """1:1 search against the profiles enrolled for user_id only; None when the user has none."""
+        try:
+            return self.ensure_gallery().search_user(embedding, user_id, fusion=settings.POSE_FUSION)
+        except Exception as e:
+            logger.error(f"Failed to search the embedding gallery for user {user_id}: {e}")
+            raise
+
+    def delete_ids(self, ids: List[str], batch_size: int = 1000) -> int:
+        """Delete embeddings by id, one collection.delete per chunk; returns how many existed and were deleted."""
+        deleted = 0
+        try:
+            step = self._max_batch(batch_size)
+            for start in range(0, len(ids), step):
+                chunk = ids[start:start + step]
+                existing = self._write(lambda collection: collection.get(ids=chunk, include=[])).get("ids", [])
+                if not existing:
+                    continue
+                self._write(lambda collection: collection.delete(ids=existing))
+                self.gallery.remove(existing)
+                deleted += len(existing)
+            if deleted:
+                self._mark_changed()
+            logger.info(f"Deleted {deleted} of {len(ids)} requested embeddings from ChromaDB.")
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete embeddings by id: {e}")
+            raise
+
+    def delete_where(self, where: Dict[str, Any], batch_size: int = 1000) -> int:
+        """Delete every embedding whose metadata matches a ChromaDB `where` filter, a chunk of ids at a time."""
+        deleted = 0
+        try:
+            step = self._max_batch(batch_size)
+            while True:
+                ids = self._write(lambda collection: collection.get(where=where, limit=step, include=[])).get("ids", [])
+                if not ids:
+                    break
+                self._write(lambda collection: collection.delete(ids=ids))
+                self.gallery.remove(ids)
+                deleted += len(ids)
+            if deleted:
+                self._mark_changed()
+            logger.info(f"Deleted {deleted} embeddings matching {where} from ChromaDB.")
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete embeddings matching {where}: {e}")
+            raise
+
+    def delete_by_filename(self, filename: str) -> int:
         """Delete embedding(s) from the collection by filename in metadata."""
+        return self.delete_where({"filename": filename})
+
+    def compact(self) -> None:
+        """Release memory held by deleted embeddings (meant to run in the background after large deletes)."""
+        started = time.monotonic()
+        freed = self.gallery.compact()
+        logger.info(f"Compacted the in-memory gallery: freed {freed} rows in {time.monotonic() - started:.3f}s.")
+
+    def clear(self) -> None:
+        """Drop and recreate the collection, in constant time whatever its size, and empty the gallery."""
         try:
-            self.collection.delete(where={"filename": filename})
+            metadata = self.collection.metadata
+            version = uuid.uuid4().hex
+            self.client.delete_collection(self.collection_name)
+            # Other processes still holding the dropped collection re-fetch it by name (see _write, ensure_gallery)
+            self.collection = self.client.get_or_create_collection(self.collection_name, metadata={**(metadata or {}), VERSION_KEY: version})
+            with self._gallery_lock:
+                self.gallery.clear()
+                self.gallery.compact()
+                self.gallery.loaded = True
+                self._gallery_version = version
+                self._gallery_checked_at = time.monotonic()
+            logger.info(f"ChromaDB collection '{self.collection_name}' reset.")
         except Exception as e:
-            logger.error(f"Failed to delete embedding by filename '{filename}': {e}")
+            logger.error(f"Failed to clear ChromaDB: {e}")
             raise
 
 # Singleton instance for use across the app
@@ -0,0 +1,323 @@
+"""
+In-memory gallery of L2-normalized float32 embeddings mirroring the ChromaDB collection.
+
+Search is exact cosine similarity: one matrix-vector product over the whole gallery followed by
+argpartition for the top-k, so no HNSW approximation and no re-scoring of raw vectors.
+ChromaDB remains the persistent store; ChromaDBService keeps this gallery in sync on writes.
+
+Multi-vector templates (e.g. one vector per enrollment pose) share a `profile_id` in their metadata.
+search_profiles scores every vector in the same matrix product, takes a bounded candidate set of
+the best vectors, and collapses them per profile with max or mean fusion over the profile's vectors.
+A user_id index (from the `user_id` metadata) lets search_user compare a probe against one claimed
+user's vectors only, independent of the gallery size.
+
+The norm of each raw embedding is kept next to its normalized row, so hits also report ChromaDB's l2
+distance to the raw vector (l2_distance), the value verification returned as semantic_distance when
+it queried ChromaDB directly.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+import numpy as np
+
+PROFILE_KEY = "profile_id"
+USER_KEY = "user_id"
+FUSIONS = ("max", "mean")
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalization to float32; all-zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def l2_distance(probe: Any, hit: Dict[str, Any]) -> float:
+    """ChromaDB's default l2 distance (squared euclidean) between a raw probe and a hit's raw vector."""
+    probe = np.asarray(probe, dtype=np.float32).reshape(-1)
+    probe_norm = float(np.linalg.norm(probe))
+    cosine = float(np.dot(probe, hit["embedding"])) / probe_norm if probe_norm else 0.0
+    return max(0.0, probe_norm ** 2 + hit["norm"] ** 2 - 2.0 * probe_norm * hit["norm"] * cosine)
+
+
+class EmbeddingGallery:
+    """Contiguous float32 matrix of normalized embeddings with ids and metadata, searchable by cosine similarity."""
+
+    def __init__(self, dim: int = 512, initial_capacity: int = 1024) -> None:
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((max(1, initial_capacity), dim), dtype=np.float32)
+        self._norms = np.zeros(max(1, initial_capacity), dtype=np.float32)
+        self._count = 0
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._groups: Dict[str, Set[str]] = {}
+        self._users: Dict[str, Set[str]] = {}
+        self._version = 0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, embedding_id: str) -> bool:
+        return embedding_id in self._rows
+
+    def _profile_of(self, embedding_id: str, metadata: Optional[Dict[str, Any]]) -> str:
+        """Profile an embedding belongs to: its `profile_id` metadata, or the embedding itself."""
+        return str((metadata or {}).get(PROFILE_KEY) or embedding_id)
+
+    def _index(self, embedding_id: str, metadata: Optional[Dict[str, Any]]) -> None:
+        self._groups.setdefault(self._profile_of(embedding_id, metadata), set()).add(embedding_id)
+        user_id = (metadata or {}).get(USER_KEY)
+        if user_id is not None:
+            self._users.setdefault(str(user_id), set()).add(embedding_id)
+
+    def _unindex(self, embedding_id: str, metadata: Optional[Dict[str, Any]]) -> None:
+        user_id = (metadata or {}).get(USER_KEY)
+        for index, key in ((self._groups, self._profile_of(embedding_id, metadata)), (self._users, None if user_id is None else str(user_id))):
+            members = index.get(key)
+            if members is not None:
+                members.discard(embedding_id)
+                if not members:
+                    del index[key]
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._count + extra
+        if needed <= self._matrix.shape[0]:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0])
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[: self._count] = self._matrix[: self._count]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[: self._count] = self._norms[: self._count]
+        self._matrix, self._norms = grown, norms
+
+    def add(self, ids: Sequence[str], embeddings: Any, metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+        """Add (or replace) embeddings by id."""
+        raw = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dim)
+        vectors, norms = l2_normalize(raw), np.linalg.norm(raw, axis=1)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+        with self._lock:
+            self._reserve(len(ids))
+            for embedding_id, vector, norm, metadata in zip(ids, vectors, norms, metadatas):
+                row = self._rows.get(embedding_id)
+                if row is None:
+                    row = self._count
+                    self._count += 1
+                    self._ids.append(embedding_id)
+                    self._metadatas.append(metadata or {})
+                    self._rows[embedding_id] = row
+                else:
+                    self._unindex(embedding_id, self._metadatas[row])
+                    self._metadatas[row] = metadata or {}
+                    self._version += 1
+                self._index(embedding_id, metadata)
+                self._matrix[row] = vector
+                self._norms[row] = norm
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Remove embeddings by id (swapping the last row into each hole); returns how many were removed."""
+        removed = 0
+        with self._lock:
+            for embedding_id in ids:
+                row = self._rows.pop(embedding_id, None)
+                if row is None:
+                    continue
+                self._unindex(embedding_id, self._metadatas[row])
+                last = self._count - 1
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self._norms[row] = self._norms[last]
+                    self._ids[row] = self._ids[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._metadatas.pop()
+                self._count -= 1
+                removed += 1
+            if removed:
+                self._version += 1
+        return removed
+
+    def clear(self) -> None:
+        """Drop every embedding."""
+        with self._lock:
+            self._count = 0
+            self._ids.clear()
+            self._metadatas.clear()
+            self._rows.clear()
+            self._groups.clear()
+            self._users.clear()
+            self._version += 1
+
+    def compact(self, min_capacity: int = 1024) -> int:
+        """Shrink the matrix to fit the current embeddings; returns how many spare rows were released."""
+        with self._lock:
+            capacity = max(self._count, min_capacity, 1)
+            spare = self._matrix.shape[0] - capacity
+            if spare <= 0:
+                return 0
+            # Searches still holding the old matrix keep it alive until they finish
+            self._matrix, self._norms = self._matrix[:capacity].copy(), self._norms[:capacity].copy()
+            return spare
+
+    def get(self, embedding_id: str) -> Optional[np.ndarray]:
+        """Normalized embedding for an id, or None."""
+        with self._lock:
+            row = self._rows.get(embedding_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def search(self, probe: Any, k: int = 1) -> List[Dict[str, Any]]:
+        """Top-k gallery entries by cosine similarity to the probe, best first."""
+        return self.search_many(np.asarray(probe, dtype=np.float32).reshape(1, -1), k)[0]
+
+    def search_many(self, probes: Any, k: int = 1) -> List[List[Dict[str, Any]]]:
+        """Top-k hits for each row of a (P, dim) probe matrix, scored with a single matrix product."""
+        queries = l2_normalize(np.asarray(probes, dtype=np.float32).reshape(-1, self.dim))
+        while True:
+            with self._lock:
+                count, matrix, norms, version = self._count, self._matrix, self._norms, self._version
+            if count == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+            # Scoring runs outside the lock; the version check below catches concurrent removals.
+            scores = queries @ matrix[:count].T
+            k_eff = min(k, count)
+            if k_eff < count:
+                top = np.argpartition(-scores, k_eff - 1, axis=1)[:, :k_eff]
+            else:
+                top = np.tile(np.arange(count), (len(queries), 1))
+            with self._lock:
+                if self._version != version:
+                    continue
+                results = []
+                for q, rows in enumerate(top):
+                    rows = rows[np.argsort(-scores[q, rows])]
+                    results.append([
+                        {
+                            "id": self._ids[row],
+                            "score": float(scores[q, row]),
+                            "metadata": self._metadatas[row],
+                            "embedding": matrix[row].copy(),
+                            "norm": float(norms[row]),
+                        }
+                        for row in rows
+                    ])
+                return results
+
+    def search_profiles(self, probe: Any, k: int = 1, fusion: str = "max", candidates_per_hit: int = 5) -> List[Dict[str, Any]]:
+        """Top-k profiles for one probe; see search_profiles_many."""
+        return self.search_profiles_many(np.asarray(probe, dtype=np.float32).reshape(1, -1), k, fusion, candidates_per_hit)[0]
+
+    def search_profiles_many(self, probes: Any, k: int = 1, fusion: str = "max", candidates_per_hit: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Top-k profiles per probe. Every vector is scored in one matrix product; the best
+        k * candidates_per_hit vectors select the candidate profiles, and each candidate's score is the
+        max (or mean) similarity over all of its vectors. With max fusion and at most
+        candidates_per_hit vectors per profile the result is exact.
+        Hits carry the profile id, the fused score, and the metadata, embedding and raw norm of the best vector.
+        """
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}', expected one of {FUSIONS}")
+        queries = l2_normalize(np.asarray(probes, dtype=np.float32).reshape(-1, self.dim))
+        while True:
+            with self._lock:
+                count, matrix, norms, version = self._count, self._matrix, self._norms, self._version
+            if count == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+            scores = queries @ matrix[:count].T
+            m = min(count, k * max(1, candidates_per_hit))
+            if m < count:
+                top = np.argpartition(-scores, m - 1, axis=1)[:, :m]
+            else:
+                top = np.tile(np.arange(count), (len(queries), 1))
+            with self._lock:
+                if self._version != version:
+                    continue
+                results = []
+                for q, rows in enumerate(top):
+                    best_rows: Dict[str, int] = {}
+                    for row in rows[np.argsort(-scores[q, rows])]:
+                        best_rows.setdefault(self._profile_of(self._ids[row], self._metadatas[row]), row)
+                    hits = []
+                    for key, best_row in best_rows.items():
+                        # Rows appended after the snapshot are not scored in this pass
+                        member_rows = [r for r in (self._rows[i] for i in self._groups.get(key, ())) if r < count]
+                        member_scores = scores[q, member_rows or [best_row]]
+                        hits.append({
+                            "id": key,
+                            "score": float(member_scores.max() if fusion == "max" else member_scores.mean()),
+                            "metadata": self._metadatas[best_row],
+                            "embedding": matrix[best_row].copy(),
+                            "norm": float(norms[best_row]),
+                        })
+                    hits.sort(key=lambda hit: hit["score"], reverse=True)
+                    results.append(hits[:k])
+                return results
+
+    def has_user(self, user_id: str) -> bool:
+        return str(user_id) in self._users
+
+    def profile_keys(self, user_id: Optional[str] = None) -> Set[str]:
+        """Keys of every profile, or of the profiles enrolled under user_id."""
+        with self._lock:
+            if user_id is None:
+                return set(self._groups)
+            ids = self._users.get(str(user_id), ())
+            return {self._profile_of(i, self._metadatas[self._rows[i]]) for i in ids}
+
+    @property
+    def state(self) -> tuple:
+        """Changes whenever embeddings are added, replaced or removed."""
+        return self._count, self._version
+
+    def search_user(self, probe: Any, user_id: str, fusion: str = "max") -> Optional[List[Dict[str, Any]]]:
+        """
+        1:1 search: score the probe only against the vectors enrolled under `user_id` (its `user_id`
+        metadata) and return that user's profiles best first, fused like search_profiles.
+        Returns None when the user has no embeddings.
+        """
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}', expected one of {FUSIONS}")
+        query = l2_normalize(np.asarray(probe, dtype=np.float32).reshape(self.dim))
+        with self._lock:
+            ids = self._users.get(str(user_id))
+            if not ids:
+                return None
+            rows = [self._rows[i] for i in ids]
+            vectors, norms = self._matrix[rows], self._norms[rows]
+            profiles = [self._profile_of(self._ids[row], self._metadatas[row]) for row in rows]
+            metadatas = [self._metadatas[row] for row in rows]
+        scores = vectors @ query
+        members: Dict[str, List[int]] = {}
+        for i, key in enumerate(profiles):
+            members.setdefault(key, []).append(i)
+        hits = []
+        for key, idx in members.items():
+            best = idx[int(np.argmax(scores[idx]))]
+            hits.append({
+                "id": key,
+                "score": float(scores[idx].max() if fusion == "max" else scores[idx].mean()),
+                "metadata": metadatas[best],
+                "embedding": vectors[best],
+                "norm": float(norms[best]),
+            })
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return hits
+
+    def load_from_collection(self, collection: Any, batch_size: int = 1000) -> None:
+        """Rebuild the gallery from a ChromaDB collection, paging through it in batches."""
+        with self._lock:
+            self.clear()
+            offset = 0
+            while True:
+                page = collection.get(limit=batch_size, offset=offset, include=["embeddings", "metadatas"])
+                ids = page.get("ids") or []
+                if not ids:
+                    break
+                embeddings = page.get("embeddings")
+                metadatas = page.get("metadatas") or [{} for _ in ids]
+                self.add(ids, np.asarray(embeddings, dtype=np.float32), metadatas)
+                offset += len(ids)
+                if len(ids) < batch_size:
+                    break
+            self.loaded = True
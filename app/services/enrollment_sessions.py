@@ -0,0 +1,270 @@
+"""
+Server-side enrollment sessions for the guided five-pose flow.
+
+Each QC-passed frame's embedding, head pose and quality data is kept under a session token, so the
+profile can be created from the QC results instead of uploading and analyzing the five frames again.
+Sessions expire after a TTL of inactivity and the store holds a bounded number of them (oldest evicted).
+
+By default sessions live in the worker process that created them, which only works with a single worker:
+the launcher's workers share one socket without sticky routing, so a QC call or the finalize call may reach
+another worker. With ENROLL_SESSION_DIR (by default a directory under RESULT_CACHE_DIR, when set) sessions
+are kept in that directory instead and every worker sees them; without it, session mode is refused when
+WORKERS > 1.
+"""
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+
+@dataclass
+class PoseCapture:
+    """QC result for one accepted pose frame."""
+    embedding: List[float]
+    pose: List[float]  # yaw, pitch, roll in degrees
+    quality: Dict[str, Any] = field(default_factory=dict)
+    light_embedding: Optional[List[float]] = None  # light-pack embedding for the verification cascade
+
+
+@dataclass
+class EnrollmentSession:
+    session_id: str
+    created_at: float
+    touched_at: float
+    captures: Dict[str, PoseCapture] = field(default_factory=dict)
+
+    def summary(self, ttl: float) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "captured": sorted(self.captures),
+            "expires_in": max(0.0, ttl - (time.monotonic() - self.touched_at)),
+        }
+
+
+class EnrollmentSessionStore:
+    """Thread-safe, bounded store of enrollment sessions with inactivity expiry."""
+
+    # Sessions are only visible to this process
+    shared = False
+
+    def __init__(self, ttl_seconds: float = 900.0, max_sessions: int = 1000) -> None:
+        self.ttl = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, EnrollmentSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _purge(self, now: float) -> None:
+        # Sessions are kept in touch order, so expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.touched_at <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self) -> EnrollmentSession:
+        now = time.monotonic()
+        session = EnrollmentSession(session_id=secrets.token_urlsafe(16), created_at=now, touched_at=now)
+        with self._lock:
+            self._purge(now)
+            while len(self._sessions) >= self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.warning(f"Enrollment session store full; evicted session {evicted}")
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[EnrollmentSession]:
+        """The live session, refreshing its expiry; None if unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.touched_at = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def add_capture(self, session_id: str, pose: str, capture: PoseCapture) -> Optional[EnrollmentSession]:
+        """Store (or replace) the capture for a pose; None if the session is unknown or expired."""
+        session = self.get(session_id)
+        if session is not None:
+            with self._lock:
+                session.captures[pose] = capture
+        return session
+
+    def pop(self, session_id: str) -> Optional[EnrollmentSession]:
+        """Remove and return a live session."""
+        with self._lock:
+            self._purge(time.monotonic())
+            return self._sessions.pop(session_id, None)
+
+    def restore(self, session: EnrollmentSession) -> None:
+        """Put back a session taken with pop (e.g. when finalizing it failed)."""
+        with self._lock:
+            session.touched_at = time.monotonic()
+            self._sessions[session.session_id] = session
+
+
+SESSION_FILE = "session.json"
+# secrets.token_urlsafe ids; anything else (including path separators) is never looked up on disk
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_POSE = re.compile(r"^\w{1,32}$")
+
+
+def _write_json(path: str, value: Any) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp, path)  # atomic, so other workers never read a partial file
+
+
+def _monotonic(wall: float) -> float:
+    """A wall-clock timestamp on this process's monotonic clock (EnrollmentSession keeps monotonic times)."""
+    return time.monotonic() - (time.time() - wall)
+
+
+class DiskEnrollmentSessionStore:
+    """
+    Enrollment sessions in a directory shared by every worker: one subdirectory per session holding
+    session.json (its mtime is the last activity) and one JSON file per captured pose. pop renames the
+    subdirectory away before reading it, so only one worker can finalize a session.
+    """
+
+    shared = True
+
+    def __init__(self, directory: str, ttl_seconds: float = 900.0, max_sessions: int = 1000) -> None:
+        self.directory = directory
+        self.ttl = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str, *parts: str) -> str:
+        return os.path.join(self.directory, name, *parts)
+
+    def _sessions(self) -> List[Tuple[float, str]]:
+        """(last activity, session id) of the stored sessions, oldest first."""
+        sessions = []
+        for name in os.listdir(self.directory):
+            if not _SESSION_ID.match(name):
+                continue  # sessions taken by pop
+            try:
+                sessions.append((os.path.getmtime(self._path(name, SESSION_FILE)), name))
+            except OSError:
+                continue
+        return sorted(sessions)
+
+    def __len__(self) -> int:
+        now = time.time()
+        return sum(1 for touched, _ in self._sessions() if now - touched <= self.ttl)
+
+    def _load(self, session_id: str, path: str) -> Optional[EnrollmentSession]:
+        try:
+            with open(os.path.join(path, SESSION_FILE)) as f:
+                created_at = json.load(f)["created_at"]
+            touched_at = os.path.getmtime(os.path.join(path, SESSION_FILE))
+            captures = {}
+            for name in os.listdir(path):
+                pose, ext = os.path.splitext(name)
+                if ext == ".json" and name != SESSION_FILE:
+                    with open(os.path.join(path, name)) as f:
+                        captures[pose] = PoseCapture(**json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            # Taken by pop or expired in another worker meanwhile
+            return None
+        return EnrollmentSession(session_id=session_id, created_at=_monotonic(created_at), touched_at=_monotonic(touched_at), captures=captures)
+
+    def _save(self, session: EnrollmentSession) -> None:
+        path = self._path(session.session_id)
+        os.makedirs(path, exist_ok=True)
+        for pose, capture in session.captures.items():
+            _write_json(os.path.join(path, f"{pose}.json"), asdict(capture))
+        _write_json(os.path.join(path, SESSION_FILE), {"created_at": time.time() - (time.monotonic() - session.created_at)})
+
+    def create(self) -> EnrollmentSession:
+        now = time.time()
+        live = []
+        for touched, name in self._sessions():
+            if now - touched > self.ttl:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+            else:
+                live.append(name)
+        for name in live[:max(0, len(live) - self.max_sessions + 1)]:
+            logger.warning(f"Enrollment session store full; evicted session {name}")
+            shutil.rmtree(self._path(name), ignore_errors=True)
+        session = EnrollmentSession(session_id=secrets.token_urlsafe(16), created_at=time.monotonic(), touched_at=time.monotonic())
+        self._save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[EnrollmentSession]:
+        """The live session, refreshing its expiry; None if unknown or expired."""
+        if not _SESSION_ID.match(session_id):
+            return None
+        path = self._path(session_id)
+        try:
+            expired = time.time() - os.path.getmtime(os.path.join(path, SESSION_FILE)) > self.ttl
+            if not expired:
+                os.utime(os.path.join(path, SESSION_FILE))
+        except OSError:
+            return None
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        return self._load(session_id, path)
+
+    def add_capture(self, session_id: str, pose: str, capture: PoseCapture) -> Optional[EnrollmentSession]:
+        """Store (or replace) the capture for a pose; None if the session is unknown or expired."""
+        if not _POSE.match(pose):
+            raise ValueError(f"Invalid pose name: {pose!r}")
+        session = self.get(session_id)
+        if session is None:
+            return None
+        try:
+            _write_json(self._path(session_id, f"{pose}.json"), asdict(capture))
+        except OSError:
+            return None  # taken by pop meanwhile
+        session.captures[pose] = capture
+        return session
+
+    def pop(self, session_id: str) -> Optional[EnrollmentSession]:
+        """Remove and return a live session."""
+        if not _SESSION_ID.match(session_id):
+            return None
+        taken = self._path(f".{session_id}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            os.rename(self._path(session_id), taken)
+        except OSError:
+            return None
+        try:
+            session = self._load(session_id, taken)
+        finally:
+            shutil.rmtree(taken, ignore_errors=True)
+        if session is None or time.monotonic() - session.touched_at > self.ttl:
+            return None
+        return session
+
+    def restore(self, session: EnrollmentSession) -> None:
+        """Put back a session taken with pop (e.g. when finalizing it failed)."""
+        self._save(session)
+
+
+def create_session_store():
+    """Shared on-disk store when ENROLL_SESSION_DIR is set, else the in-process one."""
+    if settings.ENROLL_SESSION_DIR:
+        return DiskEnrollmentSessionStore(settings.ENROLL_SESSION_DIR, ttl_seconds=settings.ENROLL_SESSION_TTL, max_sessions=settings.ENROLL_SESSION_MAX)
+    return EnrollmentSessionStore(ttl_seconds=settings.ENROLL_SESSION_TTL, max_sessions=settings.ENROLL_SESSION_MAX)
+
+
+# Singleton instance for use across the app
+enrollment_sessions = create_session_store()
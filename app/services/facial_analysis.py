@@ -1,16 +1,31 @@
 # Facial analysis service for extracting facial features
 from PIL import Image
 import numpy as np
-import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from app.services.onnx_runtime import build_face_analysis, subset_face_analysis, warm_up_face_analysis
 from app.services.logging_config import setup_logging
 from app.config import settings
-import torch
-import cv2
+from app.services.inference_scheduler import MicroBatchScheduler, aligned_crop, analyze_batch, to_full_resolution
+from app.services.image_decoding import DecodedImage
+from app.services.inference_executor import run_in_model_thread, run_inference
+from app.services.stage_timing import stage_timings
+from typing import Callable, List, Union
+import asyncio
+import threading
 
-# Initialize the face analysis model once (global, for performance)
-face_app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
-face_app.prepare(ctx_id=0)
+# Enrollment QC only needs the face count and head pose: detection plus the 3D landmark head,
+# sharing face_app's sessions and skipping the 2D landmarks, gender/age and recognition models
+QC_TASKS = ("detection", "landmark_3d_68")
+
+# Verification cascade (CASCADE_ENABLED): the light pack only needs detection and recognition
+LIGHT_TASKS = ("detection", "recognition")
+
+# The face analysis models are built once per process by load_face_models (at startup, or on first use)
+face_app = None
+qc_app = None
+light_app = None
+_models_lock = threading.Lock()
 
 logger = setup_logging()
 logger.remove()
@@ -22,10 +37,153 @@ logger.add(
     format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {name}:{function}:{line} - {message}"
 )
 
-def analyze_face(image: Image.Image) -> dict:
-    logger.info("Analyzing face for embedding and gender.")
-    img_array = np.array(image.convert("RGB"))
-    faces = face_app.get(img_array)
+def load_face_models(warm_up: bool = True) -> FaceAnalysis:
+    """Build face_app and qc_app if not done yet and, with warm_up, run every ONNX session once at its configured input size."""
+    global face_app, qc_app
+    if face_app is None:
+        with _models_lock:
+            if face_app is None:
+                analyzer = build_face_analysis(name="buffalo_l", providers=["CPUExecutionProvider"])
+                analyzer.prepare(ctx_id=0, det_size=settings.DET_SIZE)
+                qc_app = subset_face_analysis(analyzer, QC_TASKS, det_size=settings.QC_DET_SIZE)
+                if warm_up:
+                    warm_up_face_analysis(analyzer, [settings.DET_SIZE, settings.QC_DET_SIZE])
+                face_app = analyzer
+    return face_app
+
+def load_light_models(warm_up: bool = True) -> FaceAnalysis:
+    """Build light_app, the CASCADE_LIGHT_PACK detection and recognition models, if not done yet."""
+    global light_app
+    if light_app is None:
+        with _models_lock:
+            if light_app is None:
+                analyzer = build_face_analysis(name=settings.CASCADE_LIGHT_PACK, allowed_modules=LIGHT_TASKS, providers=["CPUExecutionProvider"])
+                analyzer.prepare(ctx_id=0, det_size=settings.CASCADE_LIGHT_DET_SIZE)
+                if warm_up:
+                    warm_up_face_analysis(analyzer, [settings.CASCADE_LIGHT_DET_SIZE])
+                light_app = analyzer
+    return light_app
+
+def get_face_app() -> FaceAnalysis:
+    """The full InsightFace pipeline, loading it on first use."""
+    return face_app if face_app is not None else load_face_models()
+
+def get_qc_app() -> FaceAnalysis:
+    """The detection + head pose subset used by enrollment QC, loading the models on first use."""
+    if qc_app is None:
+        load_face_models()
+    return qc_app
+
+def get_light_app() -> FaceAnalysis:
+    """The light pack of the verification cascade, loading it on first use."""
+    return light_app if light_app is not None else load_light_models()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> MicroBatchScheduler:
+    """Return the process-wide micro-batching scheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = MicroBatchScheduler(
+                    get_face_app(),
+                    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+                    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+                )
+    return _scheduler
+
+def scheduler_queue_depth() -> int:
+    """Images waiting for the micro-batching scheduler (0 when it has not been started)."""
+    return _scheduler.qsize() if _scheduler is not None else 0
+
+def detect_faces(image: Union[DecodedImage, np.ndarray]) -> list:
+    """
+    Run the InsightFace pipeline on an image, through the micro-batching scheduler when enabled.
+    Reduced-scale decodes are detected at their reduced size and aligned from full-resolution pixels when needed.
+    """
+    if settings.INFERENCE_BATCHING:
+        return get_scheduler().get(image)
+    if isinstance(image, DecodedImage):
+        # Same models as face_app.get, with detection and recognition timed as separate stages
+        faces = analyze_batch(get_face_app(), [image])[0]
+        if isinstance(faces, Exception):
+            raise faces
+        return faces
+    with stage_timings.time("analyze"):
+        return get_face_app().get(_as_rgb_array(image))
+
+def detect_face_records(image: Union[DecodedImage, np.ndarray]) -> list:
+    """detect_faces returning plain dicts, which (unlike insightface Face objects) can be pickled across processes."""
+    return [dict(face) for face in detect_faces(image)]
+
+async def _scheduled(image: Union[DecodedImage, np.ndarray]) -> list:
+    """
+    Faces from the micro-batching scheduler, awaited on the event loop. No executor thread is held while the
+    image waits for its batch, so concurrent requests fill batches up to INFERENCE_MAX_BATCH_SIZE whatever
+    the size of the inference executor.
+    """
+    scheduler = _scheduler if _scheduler is not None else await run_in_model_thread(get_scheduler)
+    return await asyncio.wrap_future(scheduler.submit(image))
+
+async def detect_faces_async(image: Union[DecodedImage, np.ndarray]) -> list:
+    """Await detect_faces through the scheduler (INFERENCE_BATCHING) or on the inference executor, so the event loop stays free."""
+    if settings.INFERENCE_BATCHING:
+        return await _scheduled(image)
+    records = await run_inference(detect_face_records, image)
+    return [Face(record) for record in records]
+
+def detect_pose_records(image: Union[DecodedImage, np.ndarray]) -> list:
+    """Detection and head pose only (no embedding), as picklable dicts with full-resolution coordinates."""
+    with stage_timings.time("detect"):
+        faces = get_qc_app().get(_as_rgb_array(image))
+    scale = image.scale if isinstance(image, DecodedImage) else 1.0
+    if scale != 1.0:
+        for face in faces:
+            to_full_resolution(face, scale)
+    return [dict(face) for face in faces]
+
+async def detect_poses_async(image: Union[DecodedImage, np.ndarray]) -> list:
+    """Await the QC fast path on the inference executor; faces carry bbox, kps, det_score, landmark_3d_68 and pose."""
+    records = await run_inference(detect_pose_records, image)
+    return [Face(record) for record in records]
+
+# Keypoint order after a horizontal flip: the eyes and the mouth corners swap sides
+MIRRORED_KPS_ORDER = [1, 0, 2, 4, 3]
+
+def unmirror_face(face: Face, width: int) -> Face:
+    """Map a face detected on a horizontally flipped image (full-resolution width) back to the original image."""
+    bbox = np.asarray(face.bbox, dtype=np.float32)
+    kps = np.asarray(face.kps, dtype=np.float32)[MIRRORED_KPS_ORDER]
+    kps[:, 0] = width - 1 - kps[:, 0]
+    return Face(bbox=np.array([width - 1 - bbox[2], bbox[1], width - 1 - bbox[0], bbox[3]], dtype=np.float32), kps=kps, det_score=face.det_score)
+
+def embed_detected_face(image: Union[DecodedImage, np.ndarray], face: Face) -> List[float]:
+    """Recognition embedding for a face that was already detected (full-resolution coordinates), without detecting again."""
+    return _embed_with(get_face_app().models["recognition"], image, face)
+
+def embed_detected_face_light(image: Union[DecodedImage, np.ndarray], face: Face) -> List[float]:
+    """embed_detected_face with the light pack's recognition model, for the cascade's light gallery."""
+    return _embed_with(get_light_app().models["recognition"], image, face)
+
+def _embed_with(rec_model, image: Union[DecodedImage, np.ndarray], face: Face) -> List[float]:
+    scale = image.scale if isinstance(image, DecodedImage) else 1.0
+    detection_face = Face(kps=np.asarray(face.kps, dtype=np.float32) / scale)
+    crop = aligned_crop(image, detection_face, rec_model.input_size[0])
+    with stage_timings.time("embed"):
+        return rec_model.get_feat(crop).flatten().tolist()
+
+def _as_rgb_array(image: Union[DecodedImage, np.ndarray, Image.Image]) -> np.ndarray:
+    """Return the (possibly reduced-scale) RGB pixels of a decoded image without copying when they are already decoded."""
+    if isinstance(image, DecodedImage):
+        return image.rgb
+    if isinstance(image, np.ndarray):
+        return image
+    return np.array(image.convert("RGB"))
+
+def _face_result(faces: list) -> dict:
+    """Profile data for the single face in an image, or an error when there is none or several."""
     if not faces:
         logger.warning("No face detected in the image.")
         return {"error": "No face detected."}
@@ -38,7 +196,66 @@ def analyze_face(image: Image.Image) -> dict:
     logger.info(f"Face analysis successful.")
     return {
         "embedding": embedding,
-        "gender": gender
+        "gender": gender,
+        # Detection geometry (full-resolution pixels), reused for the anti-spoofing crop
+        "face": {"bbox": face.bbox.tolist(), "kps": face.kps.tolist()},
+    }
+
+def analyze_face(image: Union[DecodedImage, np.ndarray, Image.Image]) -> dict:
+    logger.info("Analyzing face for embedding and gender.")
+    faces = detect_faces(image if isinstance(image, DecodedImage) else _as_rgb_array(image))
+    return _face_result(faces)
+
+async def analyze_face_async(image: Union[DecodedImage, np.ndarray, Image.Image]) -> dict:
+    """analyze_face for async endpoints: through the scheduler with INFERENCE_BATCHING, else on the inference executor."""
+    if settings.INFERENCE_BATCHING:
+        return _face_result(await _scheduled(image if isinstance(image, DecodedImage) else _as_rgb_array(image)))
+    return await run_inference(analyze_face, image)
+
+def analyze_faces(images: List[Union[DecodedImage, np.ndarray, Image.Image]], get_app: Callable[[], FaceAnalysis] = get_face_app) -> List[dict]:
+    """
+    analyze_face for many images, running recognition in batches over the crops of all their faces.
+    get_app picks the model pack: get_face_app (buffalo_l) or get_light_app for the cascade's light tier.
+    """
+    logger.info(f"Analyzing faces in a batch of {len(images)} images.")
+    arrays = [image if isinstance(image, DecodedImage) else _as_rgb_array(image) for image in images]
+    results = []
+    chunk = max(1, settings.INFERENCE_MAX_BATCH_SIZE)
+    for start in range(0, len(arrays), chunk):
+        for faces in analyze_batch(get_app(), arrays[start:start + chunk]):
+            if isinstance(faces, Exception):
+                logger.error(f"Face analysis failed for a batch item: {faces}")
+                results.append({"error": "Face analysis failed."})
+            else:
+                results.append(_face_result(faces))
+    return results
+
+def analyze_face_light(image: Union[DecodedImage, np.ndarray, Image.Image]) -> dict:
+    """analyze_face with the light pack (embedding and face geometry; no gender, the light pack has no attribute model)."""
+    faces = analyze_batch(get_light_app(), [image if isinstance(image, DecodedImage) else _as_rgb_array(image)])[0]
+    if isinstance(faces, Exception):
+        raise faces
+    return _face_result(faces)
+
+async def analyze_face_light_async(image: Union[DecodedImage, np.ndarray, Image.Image]) -> dict:
+    """analyze_face_light on the inference executor (the light pack is not micro-batched)."""
+    return await run_inference(analyze_face_light, image)
+
+def verify_similarity(similarity: float) -> dict:
+    """
+    verify_embeddings' euclidean decision for a cosine similarity of unit vectors, e.g. a gallery score fused
+    over a profile's pose vectors, so the decision and the reported score are the same number.
+    """
+    # |a - b| = sqrt(2 - 2 cos) for unit vectors
+    distance = float(np.sqrt(max(0.0, 2.0 - 2.0 * float(similarity))))
+    threshold = 1.0
+    match = bool(np.isclose(distance, 0.0) or distance < threshold)
+    logger.info(f"Verification {'match' if match else 'no match'} (euclidean distance: {distance}, threshold: {threshold})")
+    return {
+        "match": match,
+        "distance": distance,
+        "threshold": threshold,
+        "message": "Match" if match else "No match"
     }
 
 def verify_embeddings(ref_embedding, new_embedding, metric: str = "euclidean") -> dict:
@@ -0,0 +1,156 @@
+"""
+Image decoding helpers: turn uploaded bytes (encoded JPEG/PNG or raw uint8 buffers) into RGB NumPy arrays,
+and the request-scoped DecodedImage shared by face analysis, QC and anti-spoofing.
+
+Large JPEGs are decoded at reduced scale with the decoder's built-in DCT downscaling
+(IMREAD_REDUCED_COLOR_2/4/8); the full-resolution pixels are only decoded if something asks for them.
+"""
+from functools import cached_property, partial
+from io import BytesIO
+from typing import Callable, Dict, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+from app.config import settings
+from app.services.stage_timing import timed
+
+JPEG_MAGIC = b"\xff\xd8"
+REDUCED_DECODE_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+
+@timed("decode")
+def decode_image_bytes(contents: bytes, reduction: int = 1) -> np.ndarray:
+    """Decode encoded image bytes (JPEG, PNG, ...) into a contiguous RGB uint8 array, optionally at 1/2, 1/4 or 1/8 scale."""
+    buf = np.frombuffer(contents, dtype=np.uint8)
+    flag = REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+    bgr = cv2.imdecode(buf, flag) if buf.size else None
+    if bgr is None:
+        raise ValueError("Could not decode image bytes.")
+    # Swap channels in place so decoding allocates a single pixel buffer.
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+
+
+def jpeg_reduction(contents: bytes, min_side: int) -> int:
+    """Largest decoder scale-down (1, 2, 4 or 8) keeping a JPEG's longest side at least min_side; reads only the header."""
+    if min_side <= 0 or not contents.startswith(JPEG_MAGIC):
+        return 1
+    try:
+        with Image.open(BytesIO(contents)) as header:
+            longest = max(header.size)
+    except Exception:
+        return 1
+    for reduction in REDUCED_DECODE_FLAGS:
+        if longest // reduction >= min_side:
+            return reduction
+    return 1
+
+
+def parse_frame_shape(shape: str) -> Tuple[int, int, int]:
+    """Parse a frame shape header such as '480,640,3' or '480x640x3' into (height, width, channels)."""
+    parts = shape.replace("x", ",").split(",")
+    try:
+        dims = tuple(int(p) for p in parts)
+    except ValueError:
+        raise ValueError(f"Invalid frame shape: {shape!r}")
+    if len(dims) == 2:
+        dims = (*dims, 3)
+    if len(dims) != 3 or any(d <= 0 for d in dims):
+        raise ValueError(f"Invalid frame shape: {shape!r}")
+    return dims
+
+
+def frame_from_raw_bytes(contents: bytes, shape: Tuple[int, int, int]) -> np.ndarray:
+    """View a raw uint8 RGB buffer as an (H, W, 3) array without copying the pixels."""
+    height, width, channels = shape
+    if channels != 3:
+        raise ValueError(f"Raw frames must have 3 channels, got {channels}.")
+    expected = height * width * channels
+    if len(contents) != expected:
+        raise ValueError(f"Raw frame has {len(contents)} bytes, expected {expected} for shape {shape}.")
+    return np.frombuffer(contents, dtype=np.uint8).reshape(height, width, channels)
+
+
+class DecodedImage:
+    """
+    Request-scoped image: decoded once into a contiguous RGB array, with grayscale,
+    downscaled and mirrored versions derived lazily and cached for the rest of the request.
+
+    `rgb` may be a reduced-scale decode; `scale` is then the full-resolution size divided by its size,
+    and `full_rgb` decodes the original pixels on first use.
+    """
+
+    def __init__(self, rgb: np.ndarray, scale: float = 1.0, load_full: Optional[Callable[[], np.ndarray]] = None) -> None:
+        if rgb.ndim != 3 or rgb.shape[2] != 3:
+            raise ValueError(f"Expected an RGB image, got shape {rgb.shape}.")
+        self.rgb = rgb if rgb.flags.c_contiguous else np.ascontiguousarray(rgb)
+        self.scale = scale
+        self._load_full = load_full
+        self._downscaled: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def from_bytes(cls, contents: bytes, min_side: Optional[int] = None) -> "DecodedImage":
+        """
+        Decode encoded image bytes; raises ValueError if they are not a supported image.
+        JPEGs larger than min_side (default DECODE_MIN_SIDE) are decoded at reduced scale.
+        """
+        reduction = jpeg_reduction(contents, settings.DECODE_MIN_SIDE if min_side is None else min_side)
+        if reduction == 1:
+            return cls(decode_image_bytes(contents))
+        rgb = decode_image_bytes(contents, reduction)
+        return cls(rgb, scale=float(reduction), load_full=partial(decode_image_bytes, contents))
+
+    @property
+    def height(self) -> int:
+        return self.rgb.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.rgb.shape[1]
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        """Single-channel grayscale version, computed on first use."""
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+
+    @property
+    def reduced(self) -> bool:
+        """True when rgb is a reduced-scale decode of a larger image."""
+        return self._load_full is not None
+
+    @cached_property
+    def full_rgb(self) -> np.ndarray:
+        """Full-resolution RGB pixels (decoded on first use when rgb is a reduced decode)."""
+        return self._load_full() if self._load_full is not None else self.rgb
+
+    @cached_property
+    def mirrored(self) -> "DecodedImage":
+        """Horizontally flipped copy (selfie view), as a contiguous image of its own."""
+        load_full = partial(_mirror_full, self) if self.reduced else None
+        return DecodedImage(cv2.flip(self.rgb, 1), scale=self.scale, load_full=load_full)
+
+    def downscaled(self, max_side: int) -> np.ndarray:
+        """RGB version whose longest side is at most max_side; returns the original when already small enough."""
+        longest = max(self.height, self.width)
+        if longest <= max_side:
+            return self.rgb
+        if max_side not in self._downscaled:
+            scale = max_side / longest
+            size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+            self._downscaled[max_side] = cv2.resize(self.rgb, size, interpolation=cv2.INTER_AREA)
+        return self._downscaled[max_side]
+
+
+class LazyImage:
+    """Encoded upload bytes whose DecodedImage is only built when something needs the pixels (e.g. on a result cache miss)."""
+
+    def __init__(self, contents: bytes) -> None:
+        self.contents = contents
+
+    @cached_property
+    def image(self) -> DecodedImage:
+        """Decoded image; raises ValueError if the bytes are not a supported image."""
+        return DecodedImage.from_bytes(self.contents)
+
+
+def _mirror_full(image: DecodedImage) -> np.ndarray:
+    return cv2.flip(image.full_rgb, 1)
@@ -0,0 +1,104 @@
+"""
+Dedicated executor for CPU-bound model work, so async endpoints await inference instead of running it on the event loop.
+
+INFERENCE_EXECUTOR selects a thread pool (default; ONNX Runtime sessions are shared, and release the GIL while running)
+or a process pool whose workers each import the face analysis module and so own their own ONNX sessions.
+Work that needs objects which cannot be pickled (the TensorFlow spoof model) always runs on a thread.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+from app.config import settings
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+_executor: Optional[Executor] = None
+_thread_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def inference_workers() -> int:
+    """Configured worker count, defaulting to the number of cores capped at 4."""
+    if settings.INFERENCE_WORKERS > 0:
+        return settings.INFERENCE_WORKERS
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _init_process_worker() -> None:
+    """Build the worker's own ONNX sessions up front rather than on its first task."""
+    from app.services.facial_analysis import load_face_models, load_light_models
+    load_face_models()
+    if settings.CASCADE_ENABLED:
+        load_light_models()
+
+
+def get_inference_executor() -> Executor:
+    """Return the process-wide inference executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = inference_workers()
+                if settings.INFERENCE_EXECUTOR == "process":
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_process_worker,
+                    )
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+                logger.info(f"Inference executor started: {settings.INFERENCE_EXECUTOR} pool with {workers} workers")
+    return _executor
+
+
+def _get_thread_executor() -> Executor:
+    """Thread pool for model work that cannot leave the process; reuses the inference pool in thread mode."""
+    global _thread_executor
+    executor = get_inference_executor()
+    if isinstance(executor, ThreadPoolExecutor):
+        return executor
+    if _thread_executor is None:
+        with _lock:
+            if _thread_executor is None:
+                _thread_executor = ThreadPoolExecutor(max_workers=inference_workers(), thread_name_prefix="inference-local")
+    return _thread_executor
+
+
+async def run_inference(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a picklable, module-level model function on the inference executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_inference_executor(), partial(fn, *args, **kwargs))
+
+
+async def run_in_model_thread(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run model work bound to in-process objects (e.g. the spoof model) on an inference thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_thread_executor(), partial(fn, *args, **kwargs))
+
+
+def queue_depth() -> int:
+    """Tasks submitted to the inference executors and not yet started (0 before first use)."""
+    depth = 0
+    for executor in (_executor, _thread_executor):
+        if isinstance(executor, ThreadPoolExecutor):
+            depth += executor._work_queue.qsize()
+        elif isinstance(executor, ProcessPoolExecutor):
+            # Pending items include the ones running in the workers; subtract one per worker at most
+            depth += max(0, len(executor._pending_work_items) - executor._max_workers)
+    return depth
+
+
+def shutdown_executors() -> None:
+    """Shut down the inference executors, waiting for in-flight work."""
+    global _executor, _thread_executor
+    with _lock:
+        for executor in (_executor, _thread_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        _executor = None
+        _thread_executor = None
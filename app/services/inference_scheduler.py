@@ -0,0 +1,213 @@
+"""
+Cross-request micro-batching scheduler for InsightFace inference.
+
+Requests submit decoded images and get a Future back. A single worker thread collects
+queued images (up to a maximum batch size, waiting at most a few milliseconds for
+stragglers when under load), runs detection and the per-face heads for each image, and
+then runs the recognition model once over the aligned crops of every face in the batch.
+
+Images may be reduced-scale decodes (DecodedImage with scale > 1): detection runs on the reduced
+pixels, and a face that is too small there to fill the recognition crop is aligned from the
+full-resolution pixels instead. Face coordinates are reported in full-resolution pixels.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+import numpy as np
+from insightface.app.common import Face
+from insightface.utils import face_align
+from insightface.utils.face_align import arcface_dst
+from app.services.logging_config import setup_logging
+from app.services.stage_timing import timed
+
+logger = setup_logging()
+
+# Eye distance, in pixels, of the ArcFace alignment template for a 112x112 crop
+TEMPLATE_EYE_DISTANCE = float(np.linalg.norm(arcface_dst[1] - arcface_dst[0]))
+COORDINATE_KEYS = ("bbox", "kps", "landmark_2d_106", "landmark_3d_68")
+
+
+@dataclass
+class _Request:
+    img: Any  # RGB array or DecodedImage
+    max_num: int = 0
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatchScheduler:
+    """Batch face analysis across concurrent requests and resolve per-request futures."""
+
+    def __init__(self, analyzer, max_batch_size: int = 8, max_wait_ms: float = 5.0) -> None:
+        self.analyzer = analyzer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._last_batch_size = 0
+
+    def submit(self, img: np.ndarray, max_num: int = 0) -> Future:
+        """Queue an image for analysis and return a Future resolving to its list of faces."""
+        self._ensure_started()
+        request = _Request(img=img, max_num=max_num)
+        self._queue.put(request)
+        return request.future
+
+    def get(self, img: np.ndarray, max_num: int = 0) -> list:
+        """Blocking drop-in replacement for FaceAnalysis.get."""
+        return self.submit(img, max_num).result()
+
+    def qsize(self) -> int:
+        """Number of requests waiting to be batched."""
+        return self._queue.qsize()
+
+    def shutdown(self) -> None:
+        """Stop the worker thread after the queued requests are processed."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def _collect(self, first: _Request) -> tuple:
+        """Collect a batch starting with `first`; returns (batch, stop_requested)."""
+        batch = [first]
+        # Take whatever is already queued without waiting.
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        # Only hold the batch open when the previous one shows concurrent traffic, so a
+        # lone request is never delayed by the wait window.
+        if len(batch) < self.max_batch_size and self.max_wait > 0 and (len(batch) > 1 or self._last_batch_size > 1):
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    return batch, True
+                batch.append(item)
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            self._last_batch_size = len(batch)
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch: List[_Request]) -> None:
+        live = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        results = analyze_batch(self.analyzer, [request.img for request in live], [request.max_num for request in live])
+        logger.debug(f"Micro-batch processed: {len(live)} images")
+        for request, result in zip(live, results):
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+
+
+@timed("detect")
+def _detect(analyzer, img: np.ndarray, max_num: int) -> list:
+    """Detection plus every per-face head except recognition, mirroring FaceAnalysis.get."""
+    bboxes, kpss = analyzer.det_model.detect(img, max_num=max_num, metric="default")
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        face = Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4])
+        for taskname, model in analyzer.models.items():
+            if taskname in ("detection", "recognition"):
+                continue
+            model.get(img, face)
+        faces.append(face)
+    return faces
+
+
+@timed("embed")
+def _embed(rec_model, crops: list) -> np.ndarray:
+    """Run the recognition model over all crops, in one call when the model has a dynamic batch axis."""
+    batch_dim = rec_model.input_shape[0] if getattr(rec_model, "input_shape", None) else None
+    if isinstance(batch_dim, int) and batch_dim == 1:
+        return np.vstack([rec_model.get_feat(crop) for crop in crops])
+    return rec_model.get_feat(crops)
+
+
+def aligned_crop(item: Any, face: Face, image_size: int) -> np.ndarray:
+    """
+    Aligned recognition crop for a face with kps in detection (item.rgb) coordinates; taken from
+    full-resolution pixels when the face is too small in a reduced decode.
+    """
+    scale = getattr(item, "scale", 1.0)
+    img = getattr(item, "rgb", item)
+    if scale > 1.0:
+        eye_distance = float(np.linalg.norm(face.kps[1] - face.kps[0]))
+        if eye_distance < TEMPLATE_EYE_DISTANCE * image_size / 112.0:
+            return face_align.norm_crop(item.full_rgb, landmark=face.kps * scale, image_size=image_size)
+    return face_align.norm_crop(img, landmark=face.kps, image_size=image_size)
+
+
+def to_full_resolution(face: Face, scale: float) -> None:
+    """Scale detection coordinates of a face found on a reduced decode to full-resolution pixels."""
+    for key in COORDINATE_KEYS:
+        if face.get(key) is not None:
+            face[key] = face[key] * scale
+
+
+def analyze_batch(analyzer, imgs: List[Any], max_nums: Optional[List[int]] = None) -> list:
+    """
+    Analyze several images (RGB arrays or DecodedImages) with one recognition call over the aligned
+    crops of all their faces. Returns, per image, its list of faces or the exception raised while analyzing it.
+    """
+    max_nums = max_nums or [0] * len(imgs)
+    rec_model = analyzer.models.get("recognition")
+    results: list = []
+    crops, owners = [], []
+    for item, max_num in zip(imgs, max_nums):
+        try:
+            faces = _detect(analyzer, getattr(item, "rgb", item), max_num)
+            if rec_model is not None:
+                for face in faces:
+                    crops.append(aligned_crop(item, face, rec_model.input_size[0]))
+                    owners.append(face)
+        except Exception as e:
+            results.append(e)
+            continue
+        scale = getattr(item, "scale", 1.0)
+        if scale != 1.0:
+            for face in faces:
+                to_full_resolution(face, scale)
+        results.append(faces)
+    if crops:
+        try:
+            feats = _embed(rec_model, crops)
+        except Exception as e:
+            logger.error(f"Batched recognition failed: {e}")
+            return [e if not isinstance(result, Exception) else result for result in results]
+        for face, feat in zip(owners, feats):
+            face.embedding = feat.flatten()
+    return results
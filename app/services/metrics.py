@@ -0,0 +1,156 @@
+"""
+Prometheus metrics for the API, rendered in the text exposition format by the /metrics endpoint.
+
+The hot path only updates in-process counters: an ASGI middleware tracks in-flight requests and a
+request-duration histogram per route, pipeline stages feed app.services.stage_timing, and JSON responses
+time their own serialization. Queue depths, result cache hit rates, gallery sizes, enrollment
+sessions and verification cascade decisions are read when /metrics is scraped. Metrics are per
+worker process; Prometheus aggregates them across workers when each is scraped (or labelled) separately.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+from fastapi.responses import JSONResponse
+from app.services.stage_timing import Histogram, stage_timings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestMetrics:
+    """In-flight gauge and per (method, route, status) duration histograms of HTTP requests."""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self._durations: Dict[Tuple[str, str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, str(status))
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self._durations.get(key)
+            if histogram is None:
+                histogram = self._durations[key] = Histogram()
+            histogram.observe(seconds)
+
+    def durations(self) -> Dict[Tuple[str, str, str], Histogram]:
+        with self._lock:
+            return {key: histogram.copy() for key, histogram in self._durations.items()}
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering) feeding request_metrics."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request_metrics.started()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template (not the raw path) keeps the label set bounded, e.g. /v1/verify-profile/{user_id}
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_metrics.finished(scope["method"], route, status, time.perf_counter() - start)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse recording the JSON encoding of the body as the "serialize" stage."""
+
+    def render(self, content: Any) -> bytes:
+        with stage_timings.time("serialize"):
+            return super().render(content)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name: str, series: Iterable[Tuple[Dict[str, str], Histogram]]) -> List[str]:
+    lines = []
+    for labels, histogram in series:
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    from app.services.chromadb_service import chromadb_service
+    from app.services.enrollment_sessions import enrollment_sessions
+    from app.services.facial_analysis import scheduler_queue_depth
+    from app.services.inference_executor import queue_depth
+    from app.services.model_cascade import model_cascade
+    from app.services.result_cache import result_cache
+
+    lines: List[str] = []
+    lines.append("# HELP face_stage_duration_seconds Duration of each face pipeline stage.")
+    lines.append("# TYPE face_stage_duration_seconds histogram")
+    lines.extend(_histogram_lines(
+        "face_stage_duration_seconds",
+        (({"stage": stage}, histogram) for stage, histogram in sorted(stage_timings.histograms().items())),
+    ))
+    lines.append("# HELP http_request_duration_seconds Duration of HTTP requests by route and status.")
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    lines.extend(_histogram_lines(
+        "http_request_duration_seconds",
+        (({"method": method, "route": route, "status": status}, histogram)
+         for (method, route, status), histogram in sorted(request_metrics.durations().items())),
+    ))
+    _metric(lines, "http_requests_in_flight", "gauge", "HTTP requests currently being handled.", [({}, request_metrics.in_flight)])
+    _metric(lines, "inference_executor_queue_depth", "gauge", "Model tasks waiting for an inference executor worker.", [({}, queue_depth())])
+    _metric(lines, "inference_scheduler_queue_depth", "gauge", "Images waiting for the micro-batching scheduler.", [({}, scheduler_queue_depth())])
+
+    cache = result_cache.stats()
+    kinds = cache["kinds"]
+    _metric(lines, "result_cache_entries", "gauge", "Entries in the in-process result cache.", [({}, cache["entries"])])
+    _metric(lines, "result_cache_hits_total", "counter", "Result cache hits by result kind.", [({"kind": k}, v["hits"]) for k, v in kinds.items()])
+    _metric(lines, "result_cache_misses_total", "counter", "Result cache misses by result kind.", [({"kind": k}, v["misses"]) for k, v in kinds.items()])
+    _metric(lines, "result_cache_hit_ratio", "gauge", "Result cache hit rate by result kind.", [({"kind": k}, v["hit_rate"]) for k, v in kinds.items()])
+
+    _metric(lines, "gallery_embeddings", "gauge", "Embeddings in the in-memory search gallery.", [({}, len(chromadb_service.gallery))])
+    _metric(lines, "enrollment_sessions_active", "gauge", "Live server-side enrollment sessions.", [({}, len(enrollment_sessions))])
+    _metric(lines, "cascade_decisions_total", "counter", "Verification probes accepted or rejected by the light pack, or escalated to buffalo_l.",
+            [({"decision": decision}, count) for decision, count in model_cascade.decisions().items()])
+    _metric(lines, "light_gallery_embeddings", "gauge", "Embeddings in the verification cascade's light gallery.", [({}, len(model_cascade.light.gallery))])
+    return "\n".join(lines) + "\n"
+
+
+# Singleton instance for use across the app
+request_metrics = RequestMetrics()
@@ -0,0 +1,143 @@
+"""
+Tiered verification: a light InsightFace pack rejects clear non-matches, buffalo_l decides everything else.
+
+With CASCADE_ENABLED the verification routes embed the probe with the light pack (CASCADE_LIGHT_PACK)
+and search a light gallery: a second collection (CASCADE_LIGHT_COLLECTION) holding a light-pack
+embedding for each enrolled embedding, under the same id and metadata. Every enrollment path writes
+both, embedding the face found by buffalo_l with the light recognizer. The best light score decides:
+
+- below CASCADE_REJECT_SIMILARITY (and verify_embeddings' threshold): rejected from the light pack
+- otherwise: escalated to buffalo_l and the main gallery, which makes every match decision
+
+The light pack never accepts: a false accept is the costly error in access control, so only buffalo_l
+may grant a match. A rejection only stands when the light gallery covers every profile that could have
+matched (all of them for a 1:N search, the claimed user's for 1:1); otherwise the probe escalates, so
+profiles enrolled before the cascade was enabled are still found. Light scores are on the light model's
+own scale, so measure the bound's false-reject rate on labelled pairs (app.cascade_eval) before raising it.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+from app.config import settings
+from app.services.chromadb_service import ChromaDBService, chromadb_service
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+REJECT, ESCALATE = "reject", "escalate"
+# verify_embeddings matches unit vectors closer than euclidean distance 1.0, i.e. cosine similarity above 0.5
+MATCH_SIMILARITY = 0.5
+
+
+def cascade_decision(score: float, reject: Optional[float] = None) -> str:
+    """reject or escalate for a light-pack cosine score; the reject bound never crosses the match threshold."""
+    reject = settings.CASCADE_REJECT_SIMILARITY if reject is None else reject
+    return REJECT if score < min(reject, MATCH_SIMILARITY) else ESCALATE
+
+
+class ModelCascade:
+    """Screens light-pack search results for clear rejections and keeps the light gallery in step with the main one."""
+
+    def __init__(self, heavy, light) -> None:
+        self.heavy = heavy
+        self.light = light
+        self._decisions = {REJECT: 0, ESCALATE: 0}
+        self._coverage_state = None
+        self._covered = False
+        self._lock = threading.Lock()
+
+    def record(self, decision: str) -> str:
+        """Count a decision (also for probes escalated before screening) and return it."""
+        with self._lock:
+            self._decisions[decision] += 1
+        return decision
+
+    def decisions(self) -> Dict[str, int]:
+        """Probes rejected and escalated so far in this process."""
+        with self._lock:
+            return dict(self._decisions)
+
+    def covers_gallery(self) -> bool:
+        """True when every profile of the main gallery has a light template (recomputed only when a gallery changes)."""
+        heavy, light = self.heavy.ensure_gallery(), self.light.ensure_gallery()
+        state = (heavy.state, light.state)
+        with self._lock:
+            if state == self._coverage_state:
+                return self._covered
+        covered = heavy.profile_keys() <= light.profile_keys()
+        with self._lock:
+            self._coverage_state, self._covered = state, covered
+        return covered
+
+    def _screen(self, hits: Optional[List[Dict[str, Any]]], covered) -> str:
+        if not hits:
+            return self.record(REJECT if covered() else ESCALATE)
+        decision = cascade_decision(hits[0]["score"])
+        if decision == REJECT and not covered():
+            decision = ESCALATE
+        return self.record(decision)
+
+    def screen(self, hits: Optional[List[Dict[str, Any]]]) -> str:
+        """Decision for light 1:N search hits (best first)."""
+        return self._screen(hits, self.covers_gallery)
+
+    def screen_user(self, hits: Optional[List[Dict[str, Any]]], user_id: str) -> str:
+        """Decision for light 1:1 hits of a claimed user; escalates when the user has no light templates."""
+        if hits is None:
+            return self.record(ESCALATE)
+        covered = lambda: self.heavy.ensure_gallery().profile_keys(user_id) <= self.light.ensure_gallery().profile_keys(user_id)
+        return self._screen(hits, covered)
+
+    def store(self, ids: Sequence[str], embeddings: Sequence[Optional[List[float]]], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """
+        Add light templates next to the main ones (same ids and metadata). Missing embeddings are skipped and
+        failures only logged: a profile without a light template is still verified, through escalation.
+        """
+        entries = [(i, e, m) for i, e, m in zip(ids, embeddings, metadatas) if e is not None]
+        if not entries:
+            return
+        try:
+            self.light.add_embeddings([i for i, _, _ in entries], [e for _, e, _ in entries], [m for _, _, m in entries])
+        except Exception as e:
+            logger.error(f"Failed to store light templates for {len(entries)} embeddings: {e}")
+
+    def delete_ids(self, ids: List[str]) -> None:
+        self._mirror(lambda: self.light.delete_ids(ids))
+
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        self._mirror(lambda: self.light.delete_where(where))
+
+    def clear(self) -> None:
+        self._mirror(self.light.clear)
+
+    def _mirror(self, operation) -> None:
+        try:
+            operation()
+        except Exception as e:
+            # A stale light template only raises light scores, which escalates the probe (see _screen)
+            logger.error(f"Failed to mirror a deletion to the light gallery: {e}")
+
+
+def light_embeddings(images: Sequence[Any], faces: Sequence[Dict[str, Any]]) -> List[Optional[List[float]]]:
+    """Light-pack embeddings of faces detected by buffalo_l (full-resolution bbox/kps); None where it fails."""
+    from insightface.app.common import Face
+    from app.services.facial_analysis import embed_detected_face_light
+    embeddings = []
+    for image, face in zip(images, faces):
+        try:
+            embeddings.append(embed_detected_face_light(image, Face(face)))
+        except Exception as e:
+            logger.error(f"Light embedding failed: {e}")
+            embeddings.append(None)
+    return embeddings
+
+
+def load_light_gallery() -> None:
+    """Load the light pack and the light gallery (a model lifecycle component when CASCADE_ENABLED)."""
+    from app.services.facial_analysis import load_light_models
+    load_light_models(warm_up=True)
+    model_cascade.light.connect()
+    model_cascade.light.ensure_gallery()
+
+
+# Singleton instance for use across the app
+model_cascade = ModelCascade(chromadb_service, ChromaDBService(settings.CASCADE_LIGHT_COLLECTION))
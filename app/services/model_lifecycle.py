@@ -0,0 +1,136 @@
+"""
+Startup lifecycle of the heavy components: the InsightFace sessions, the anti-spoofing model and ChromaDB.
+
+Importing the app loads nothing. At startup the three components are loaded and warmed up in parallel on
+background threads, so the process answers liveness checks (/health) right away, while /ready reports
+per-component progress and returns 503 until every component is ready; a load balancer or Kubernetes
+readiness probe therefore routes no traffic to a worker whose models are still cold. A component that
+fails to load keeps the worker not ready.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.config import settings
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+def _load_insightface() -> None:
+    from app.services.facial_analysis import load_face_models
+    load_face_models(warm_up=True)
+
+
+def _load_light_gallery() -> None:
+    from app.services.model_cascade import load_light_gallery
+    load_light_gallery()
+
+
+def _load_chromadb() -> None:
+    from app.services.chromadb_service import chromadb_service
+    chromadb_service.connect()
+    # Fill the in-memory search gallery now rather than on the first verification
+    chromadb_service.ensure_gallery()
+
+
+class ModelLifecycle:
+    """Loads components in parallel and tracks their state (pending, loading, ready or failed) and load time."""
+
+    def __init__(self) -> None:
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Add a component whose loader runs (once) when the lifecycle starts."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._status[name] = {"state": PENDING}
+
+    def _run(self, name: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            self._status[name] = {"state": LOADING}
+        started = time.monotonic()
+        try:
+            loader()
+        except Exception as e:
+            logger.error(f"Failed to load {name}: {e}")
+            with self._lock:
+                self._status[name] = {"state": FAILED, "seconds": time.monotonic() - started, "error": str(e)}
+            return
+        seconds = time.monotonic() - started
+        logger.info(f"{name} loaded and warmed up in {seconds:.1f}s")
+        with self._lock:
+            self._status[name] = {"state": READY, "seconds": seconds}
+
+    def start(self, background: bool = True) -> None:
+        """Load every registered component in parallel; returns at once when background, else once all are done."""
+        with self._lock:
+            if self._started_at is not None:
+                return
+            self._started_at = time.monotonic()
+            loaders = dict(self._loaders)
+
+        def run_all() -> None:
+            with ThreadPoolExecutor(max_workers=max(1, len(loaders)), thread_name_prefix="model-load") as pool:
+                for name, loader in loaders.items():
+                    pool.submit(self._run, name, loader)
+            logger.info(f"Startup loading finished in {time.monotonic() - self._started_at:.1f}s: {self.status()['components']}")
+            self._done.set()
+
+        if background:
+            threading.Thread(target=run_all, name="model-lifecycle", daemon=True).start()
+        else:
+            run_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading has finished (successfully or not); False on timeout."""
+        return self._done.wait(timeout)
+
+    @property
+    def loading(self) -> bool:
+        """True between start and the end of loading."""
+        return self._started_at is not None and not self._done.is_set()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return bool(self._status) and all(status["state"] == READY for status in self._status.values())
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            components = {name: dict(status) for name, status in self._status.items()}
+        return {
+            "ready": bool(components) and all(status["state"] == READY for status in components.values()),
+            "uptime_seconds": time.monotonic() - self._started_at if self._started_at is not None else 0.0,
+            "components": components,
+        }
+
+
+def create_lifecycle(app) -> ModelLifecycle:
+    """
+    Lifecycle loading InsightFace, ChromaDB and the spoof model (stored on app.state.spoof_model) for `app`,
+    plus the light pack and its gallery when the verification cascade is enabled.
+    """
+    from app.services.spoof_model import load_spoof_model, warm_up_spoof_model
+
+    def load_spoof() -> None:
+        spoof_model = load_spoof_model()
+        if spoof_model is None:
+            raise RuntimeError("anti-spoofing model could not be loaded")
+        # Warm-up: run the spoof models once on in-memory inputs
+        warm_up_spoof_model(spoof_model)
+        app.state.spoof_model = spoof_model
+
+    lifecycle = ModelLifecycle()
+    lifecycle.register("insightface", _load_insightface)
+    lifecycle.register("spoof_model", load_spoof)
+    lifecycle.register("chromadb", _load_chromadb)
+    if settings.CASCADE_ENABLED:
+        lifecycle.register("cascade", _load_light_gallery)
+    return lifecycle
@@ -0,0 +1,219 @@
+"""
+ONNX Runtime session construction for the InsightFace model packs.
+
+insightface's FaceAnalysis only forwards providers to onnxruntime, so this module builds the
+model pack itself with explicit SessionOptions: thread budget per worker process, graph optimization
+level, execution mode and memory arena settings, optionally tuned per model file by app.ort_autotune.
+With MODEL_PRECISION=int8 the models quantized by app.quantize_models replace their FP32 files.
+"""
+import functools
+import glob
+import json
+import os
+import os.path as osp
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils import ensure_available
+from app.config import settings
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+DEFAULT_PROVIDERS = ["CPUExecutionProvider"]
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+# Session settings a tuning file may set per model, and the environment variable that overrides each
+TUNABLE_SETTINGS = {
+    "intra_op_threads": "ORT_INTRA_OP_THREADS",
+    "inter_op_threads": "ORT_INTER_OP_THREADS",
+    "graph_optimization": "ORT_GRAPH_OPTIMIZATION",
+    "execution_mode": "ORT_EXECUTION_MODE",
+}
+PRECISIONS = ("fp32", "int8")
+# Written by app.quantize_models next to the quantized files: per model file, its task and input normalization
+QUANTIZATION_MANIFEST = "quantization.json"
+
+
+@functools.lru_cache(maxsize=None)
+def load_tuning(path: str) -> Dict[str, Dict[str, Any]]:
+    """Per-model session settings ({model file name: settings}) from an autotuner file; empty if it cannot be read."""
+    try:
+        with open(path) as f:
+            return json.load(f).get("models", {})
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Ignoring ONNX Runtime tuning file {path}: {e}")
+        return {}
+
+
+def session_config(model_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Session settings for a model: the ORT_* settings, with the tuning file's values for this model file
+    replacing those whose environment variable is not set explicitly.
+    """
+    config = {
+        "intra_op_threads": settings.ORT_INTRA_OP_THREADS,
+        "inter_op_threads": settings.ORT_INTER_OP_THREADS,
+        "graph_optimization": settings.ORT_GRAPH_OPTIMIZATION,
+        "execution_mode": settings.ORT_EXECUTION_MODE,
+        "cpu_mem_arena": settings.ORT_CPU_MEM_ARENA,
+        "mem_pattern": settings.ORT_MEM_PATTERN,
+    }
+    if model_file and settings.ORT_TUNING_FILE:
+        tuned = load_tuning(settings.ORT_TUNING_FILE).get(osp.basename(model_file), {})
+        for key, env_var in TUNABLE_SETTINGS.items():
+            if key in tuned and env_var not in os.environ:
+                config[key] = tuned[key]
+    return config
+
+
+def build_session_options(config: Dict[str, Any]) -> onnxruntime.SessionOptions:
+    """SessionOptions from a session_config dict (0 threads keeps the onnxruntime default)."""
+    options = onnxruntime.SessionOptions()
+    if config.get("intra_op_threads", 0) > 0:
+        options.intra_op_num_threads = int(config["intra_op_threads"])
+    if config.get("inter_op_threads", 0) > 0:
+        options.inter_op_num_threads = int(config["inter_op_threads"])
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[config.get("graph_optimization", "all")]
+    options.execution_mode = EXECUTION_MODES[config.get("execution_mode", "sequential")]
+    options.enable_cpu_mem_arena = bool(config.get("cpu_mem_arena", True))
+    options.enable_mem_pattern = bool(config.get("mem_pattern", True))
+    return options
+
+
+def session_options(model_file: Optional[str] = None) -> onnxruntime.SessionOptions:
+    """SessionOptions carrying the configured (and, for a model file, tuned) session settings."""
+    return build_session_options(session_config(model_file))
+
+
+def int8_model_dir(model_dir: str) -> str:
+    """Directory of the quantized models for a pack directory: INT8_MODEL_DIR, else <pack directory>_int8."""
+    if settings.INT8_MODEL_DIR:
+        return osp.expanduser(settings.INT8_MODEL_DIR)
+    return osp.normpath(model_dir) + "_int8"
+
+
+def load_quantization_manifest(int8_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Quantized models ({model file name: task and input normalization}) in int8_dir; empty if there are none."""
+    try:
+        with open(osp.join(int8_dir, QUANTIZATION_MANIFEST)) as f:
+            return json.load(f).get("models", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def resolve_model_file(onnx_file: str, int8_dir: str, manifest: Dict[str, Dict[str, Any]]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """The quantized file replacing onnx_file and its manifest entry, or (onnx_file, None) when it has none."""
+    name = osp.basename(onnx_file)
+    quantized_file = osp.join(int8_dir, name)
+    if name in manifest and osp.exists(quantized_file):
+        return quantized_file, manifest[name]
+    return onnx_file, None
+
+
+def build_face_analysis(
+    name: str = "buffalo_l",
+    root: str = "~/.insightface",
+    allowed_modules: Optional[Iterable[str]] = None,
+    providers: Optional[List[str]] = None,
+    precision: Optional[str] = None,
+) -> FaceAnalysis:
+    """
+    Load an InsightFace model pack like FaceAnalysis.__init__, but with our SessionOptions on every session.
+    precision (default MODEL_PRECISION) "int8" loads the quantized file of each model that has one.
+    """
+    precision = (precision or settings.MODEL_PRECISION).lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown model precision {precision!r}; expected one of {PRECISIONS}")
+    onnxruntime.set_default_logger_severity(3)
+    allowed = set(allowed_modules) if allowed_modules is not None else None
+    face_analysis = FaceAnalysis.__new__(FaceAnalysis)
+    face_analysis.models = {}
+    face_analysis.model_dir = ensure_available("models", name, root=root)
+    int8_dir, manifest = None, {}
+    if precision == "int8":
+        int8_dir = int8_model_dir(face_analysis.model_dir)
+        manifest = load_quantization_manifest(int8_dir)
+        if not manifest:
+            logger.warning(f"MODEL_PRECISION=int8 but no quantized models in {int8_dir}; run `python -m app.quantize_models`. Using FP32")
+    quantized_tasks = []
+    for onnx_file in sorted(glob.glob(osp.join(face_analysis.model_dir, "*.onnx"))):
+        model_file, quantized = resolve_model_file(onnx_file, int8_dir, manifest) if manifest else (onnx_file, None)
+        model = ModelRouter(model_file).get_model(sess_options=session_options(model_file), providers=providers or DEFAULT_PROVIDERS)
+        if model is None:
+            logger.warning(f"Model not recognized: {model_file}")
+        elif allowed is not None and model.taskname not in allowed:
+            logger.info(f"Model ignored: {onnx_file} ({model.taskname})")
+        elif model.taskname in face_analysis.models:
+            logger.info(f"Duplicated model task type, ignored: {onnx_file} ({model.taskname})")
+        else:
+            if quantized is not None:
+                # insightface infers the input normalization from the first graph nodes, which quantization replaces
+                model.input_mean = quantized["input_mean"]
+                model.input_std = quantized["input_std"]
+                quantized_tasks.append(model.taskname)
+            face_analysis.models[model.taskname] = model
+    assert "detection" in face_analysis.models, f"No detection model found in {face_analysis.model_dir}"
+    face_analysis.det_model = face_analysis.models["detection"]
+    logger.info(f"Loaded InsightFace pack '{name}' with tasks {list(face_analysis.models)} (INT8: {quantized_tasks or 'none'})")
+    if quantized_tasks:
+        logger.warning("INT8 models are experimental: serve them only with a quantize_models evaluation report from this hardware")
+    return face_analysis
+
+
+class SizedDetector:
+    """Detection model wrapper running at its own input size, so analyzers sharing one session can differ in det_size."""
+
+    def __init__(self, det_model, input_size: Tuple[int, int]) -> None:
+        self.det_model = det_model
+        self.input_size = tuple(input_size)
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        return self.det_model.detect(img, input_size=input_size or self.input_size, max_num=max_num, metric=metric)
+
+    def __getattr__(self, name):
+        return getattr(self.det_model, name)
+
+
+def subset_face_analysis(source: FaceAnalysis, tasks: Iterable[str], det_size: Optional[Tuple[int, int]] = None) -> FaceAnalysis:
+    """
+    A FaceAnalysis running only `tasks`, sharing the already-loaded sessions of `source` (no extra memory).
+    det_size, when given, overrides the detector input size for this analyzer only.
+    """
+    subset = FaceAnalysis.__new__(FaceAnalysis)
+    subset.model_dir = source.model_dir
+    subset.models = {task: model for task, model in source.models.items() if task in set(tasks)}
+    assert "detection" in subset.models, "A face analysis subset needs the detection model"
+    if det_size is not None:
+        subset.models["detection"] = SizedDetector(subset.models["detection"], det_size)
+    subset.det_model = subset.models["detection"]
+    if hasattr(source, "det_size"):
+        subset.det_thresh = source.det_thresh
+        subset.det_size = tuple(det_size) if det_size is not None else source.det_size
+    return subset
+
+
+def warm_up_face_analysis(analyzer: FaceAnalysis, det_sizes: Iterable[Tuple[int, int]]) -> None:
+    """
+    Run every session once on blank inputs so the first request does not pay for memory arena growth and
+    kernel selection: detection at each configured input size, the per-face heads at their fixed input size.
+    """
+    sizes = list(dict.fromkeys(tuple(size) for size in det_sizes))
+    for width, height in sizes:
+        analyzer.det_model.detect(np.zeros((height, width, 3), dtype=np.uint8), input_size=(width, height))
+    for task, model in analyzer.models.items():
+        if task == "detection":
+            continue
+        width, height = model.input_size
+        model.session.run(model.output_names, {model.input_name: np.zeros((1, 3, height, width), dtype=np.float32)})
+    logger.info(f"Warmed up InsightFace sessions {list(analyzer.models)} at detector sizes {sizes}")
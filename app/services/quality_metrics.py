@@ -0,0 +1,86 @@
+"""
+Face-region image quality metrics for enrollment QC.
+
+Only the detected face matters, so the metrics are computed on the face box (with a margin), resized to
+a fixed square before the grayscale conversion: the cost per frame no longer depends on the camera
+resolution, and a blurry face is not hidden by a sharp background. One histogram gives brightness,
+contrast and clipping; a single Laplacian gives sharpness. The scores are returned as numbers so the
+thresholds (QC_* settings) can be tuned on real captures.
+"""
+import cv2
+import numpy as np
+from typing import Dict, Optional, Sequence, Union
+from app.config import settings
+from app.services.image_decoding import DecodedImage
+
+ROI_MARGIN = 1.2  # face box is enlarged by this factor around its center
+DARK_LEVEL = 16  # pixels at or below are counted as clipped shadows
+BRIGHT_LEVEL = 239  # pixels at or above are counted as clipped highlights
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+def face_roi_gray(
+    image: Union[DecodedImage, np.ndarray],
+    bbox: Optional[Sequence[float]] = None,
+    size: Optional[int] = None,
+    margin: float = ROI_MARGIN,
+) -> np.ndarray:
+    """
+    Grayscale size x size crop of the face region. bbox is in full-resolution pixels (as returned by the
+    detectors) and is mapped onto the reduced decode of a DecodedImage; without a bbox the whole frame is used.
+    """
+    size = size or settings.QC_ROI_SIZE
+    rgb = image.rgb if isinstance(image, DecodedImage) else image
+    if bbox is not None:
+        scale = image.scale if isinstance(image, DecodedImage) else 1.0
+        x1, y1, x2, y2 = (float(v) / scale for v in bbox[:4])
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half = max(x2 - x1, y2 - y1) * margin / 2
+        height, width = rgb.shape[:2]
+        left, top = max(0, int(cx - half)), max(0, int(cy - half))
+        right, bottom = min(width, int(np.ceil(cx + half))), min(height, int(np.ceil(cy + half)))
+        if right > left and bottom > top:
+            rgb = rgb[top:bottom, left:right]
+    # Shrinking uses area averaging; a face smaller than the ROI is upsampled and rightly scores as less sharp
+    interpolation = cv2.INTER_AREA if min(rgb.shape[:2]) >= size else cv2.INTER_LINEAR
+    roi = cv2.resize(rgb, (size, size), interpolation=interpolation)
+    return cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+
+
+def quality_metrics(gray: np.ndarray) -> Dict[str, float]:
+    """
+    Quality scores of a grayscale image:
+    sharpness (Laplacian variance), brightness (mean level), contrast (standard deviation of levels),
+    and dark_clipped / bright_clipped (fractions of pixels at the ends of the range).
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = max(hist.sum(), 1.0)
+    mean = float(hist @ _LEVELS / total)
+    variance = float(hist @ (_LEVELS - mean) ** 2 / total)
+    # 8-bit input, so a float32 Laplacian is exact enough and half the memory traffic of float64
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    return {
+        "sharpness": float(std[0, 0] ** 2),
+        "brightness": mean,
+        "contrast": variance ** 0.5,
+        "dark_clipped": float(hist[: DARK_LEVEL + 1].sum() / total),
+        "bright_clipped": float(hist[BRIGHT_LEVEL:].sum() / total),
+    }
+
+
+def face_quality(image: Union[DecodedImage, np.ndarray], bbox: Optional[Sequence[float]] = None) -> Dict[str, float]:
+    """quality_metrics of the face region (see face_roi_gray)."""
+    return quality_metrics(face_roi_gray(image, bbox))
+
+
+def quality_failure(metrics: Dict[str, float]) -> Optional[str]:
+    """QC rejection reason for a set of metrics ("blurry", "bad_light" or "low_contrast"), or None when they pass."""
+    if metrics["sharpness"] < settings.QC_BLUR_MIN:
+        return "blurry"
+    if not settings.QC_BRIGHTNESS_MIN < metrics["brightness"] < settings.QC_BRIGHTNESS_MAX:
+        return "bad_light"
+    if metrics["dark_clipped"] + metrics["bright_clipped"] > settings.QC_CLIPPED_MAX:
+        return "bad_light"
+    if metrics["contrast"] < settings.QC_CONTRAST_MIN:
+        return "low_contrast"
+    return None
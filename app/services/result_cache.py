@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for per-image model results (face analysis, anti-spoofing verdict).
+
+Keys are blake2b digests of the uploaded bytes, so a retried or resent upload is answered without
+decoding or running any model. The in-process tier is an LRU bounded by entry count with a TTL;
+an optional disk tier (RESULT_CACHE_DIR, one JSON file per entry) is shared by every worker process.
+Every DISK_SWEEP_EVERY writes, a process sweeps the disk tier: files past the TTL are removed whether
+or not they are read again, then the oldest files until at most disk_max_entries remain.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.logging_config import setup_logging
+
+logger = setup_logging()
+
+# Disk writes between sweeps of the disk tier, per process
+DISK_SWEEP_EVERY = 64
+
+
+def content_key(contents: bytes) -> str:
+    """Fast 128-bit content hash of the upload bytes."""
+    return hashlib.blake2b(contents, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU/TTL cache of JSON-serializable results, keyed by (content key, kind)."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, disk_dir: Optional[str] = None, disk_max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self._disk_writes = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _count(self, counter: Dict[str, int], kind: str) -> None:
+        counter[kind] = counter.get(kind, 0) + 1
+
+    def _disk_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.{kind}.json")
+
+    def get(self, key: str, kind: str) -> Optional[Any]:
+        """Cached result or None, as a deep copy that the caller may edit (nested lists and dicts included)."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((key, kind))
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end((key, kind))
+                self._count(self.hits, kind)
+                return _copy(entry[1])
+            if entry is not None:
+                del self._entries[(key, kind)]
+        value = self._disk_get(key, kind)
+        with self._lock:
+            if value is None:
+                self._count(self.misses, kind)
+                return None
+            self._count(self.hits, kind)
+            self._store(key, kind, value, now)
+        return _copy(value)
+
+    def put(self, key: str, kind: str, value: Any) -> None:
+        """Store a deep copy of a result (the caller may keep editing its own) in memory and, when configured, on disk."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store(key, kind, _copy(value), time.monotonic())
+        self._disk_put(key, kind, value)
+
+    def _store(self, key: str, kind: str, value: Any, stored_at: float) -> None:
+        self._entries[(key, kind)] = (stored_at, value)
+        self._entries.move_to_end((key, kind))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str, kind: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key, kind)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, kind: str, value: Any) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key, kind)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp, path)  # atomic, so other workers never read a partial file
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write result cache entry {key}.{kind}: {e}")
+        with self._lock:
+            self._disk_writes += 1
+            sweep = self._disk_writes % DISK_SWEEP_EVERY == 1
+        if sweep:
+            self.sweep_disk()
+
+    def _disk_files(self) -> List[Tuple[float, str]]:
+        """(mtime, path) of every file in the disk tier's key-prefix directories (not e.g. enroll_sessions)."""
+        files = []
+        for prefix in os.scandir(self.disk_dir):
+            if not (prefix.is_dir() and len(prefix.name) == 2 and all(c in "0123456789abcdef" for c in prefix.name)):
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue  # removed by another worker meanwhile
+        return files
+
+    def sweep_disk(self) -> int:
+        """Remove expired disk entries (and stale temp files), then the oldest beyond disk_max_entries; returns the count removed."""
+        if not self.disk_dir:
+            return 0
+        try:
+            files = sorted(self._disk_files())
+        except OSError as e:
+            logger.warning(f"Failed to list the result cache directory: {e}")
+            return 0
+        cutoff = time.time() - self.ttl
+        expired = [path for mtime, path in files if mtime < cutoff]
+        live = [path for mtime, path in files if mtime >= cutoff]
+        doomed = expired + live[:max(0, len(live) - self.disk_max_entries)]
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Result cache sweep removed {removed} disk entries ({len(expired)} expired)")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and per-kind hit/miss counters and hit rates."""
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_tier": bool(self.disk_dir),
+                "kinds": {
+                    kind: {
+                        "hits": self.hits.get(kind, 0),
+                        "misses": self.misses.get(kind, 0),
+                        "hit_rate": self.hits.get(kind, 0) / max(1, self.hits.get(kind, 0) + self.misses.get(kind, 0)),
+                    }
+                    for kind in kinds
+                },
+            }
+
+
+def _copy(value: Any) -> Any:
+    """Deep copy of a JSON-like value (dicts and lists are copied, scalars are immutable)."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+# Singleton instance for use across the app
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_SIZE,
+    ttl_seconds=settings.RESULT_CACHE_TTL,
+    disk_dir=settings.RESULT_CACHE_DIR,
+    disk_max_entries=settings.RESULT_CACHE_DISK_MAX_ENTRIES,
+)
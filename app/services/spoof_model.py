@@ -1,14 +1,43 @@
 """
 Singleton lazy loader for DeepFaceAntiSpoofing model for use across the app.
 """
-from deepface_antispoofing import DeepFaceAntiSpoofing
 from app.services.logging_config import setup_logging
+from app.config import settings
 from fastapi import Request, HTTPException
+from app.services.image_decoding import DecodedImage
+from app.services.stage_timing import timed
+from datetime import datetime
+from typing import Any, Mapping, Optional, Union
+import numpy as np
+import cv2
+
+# Spoof crops keep context around the face (screen borders, moire, paper edges): the square crop side
+# is SPOOF_CROP_MARGIN times the longest side of the detected box
+SPOOF_CROP_MARGIN = 1.6
+SPOOF_CROP_SIZE = 128
+# What the spoof model classifies: the whole full-resolution frame (as DeepFaceAntiSpoofing does) or the aligned face crop
+SPOOF_INPUTS = ("frame", "crop")
 
 logger = setup_logging()
 
+def configure_tensorflow_threads() -> None:
+    """Apply the per-worker TensorFlow thread budget; must run before the first model is loaded."""
+    if not (settings.TF_INTRA_OP_THREADS or settings.TF_INTER_OP_THREADS):
+        return
+    try:
+        import tensorflow as tf
+        if settings.TF_INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(settings.TF_INTRA_OP_THREADS)
+        if settings.TF_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(settings.TF_INTER_OP_THREADS)
+    except (ImportError, RuntimeError) as e:
+        logger.warning(f"Could not set TensorFlow thread budget: {e}")
+
 def load_spoof_model():
+    configure_tensorflow_threads()
     try:
+        # Imported here: it pulls in TensorFlow, which only the loader needs
+        from deepface_antispoofing import DeepFaceAntiSpoofing
         _spoof_model = DeepFaceAntiSpoofing()
         logger.info("DeepFaceAntiSpoofing model initialized successfully.")
         assert _spoof_model.age_gender_model_path.exists(), f"Missing {_spoof_model.age_gender_model_path}"
@@ -26,8 +55,101 @@ def get_spoof_model(request: Request):
     Dependency which returns the pre-loaded model from app.state
     """
     model = getattr(request.app.state, "spoof_model", None)
+    lifecycle = getattr(request.app.state, "lifecycle", None)
+    if model is None and lifecycle is not None and lifecycle.loading:
+        logger.warning("Anti-spoofing model requested while models are still loading.")
+        raise HTTPException(status_code=503, detail="Models are still loading", headers={"Retry-After": "5"})
     if model is None:
         logger.error("Anti-spoofing model not loaded in app state.")
         raise HTTPException(status_code=500, detail="Anti-spoofing model not loaded")
     logger.info("Returning anti-spoofing model from app state. Model type: {}".format(type(model)))
-    return model
\ No newline at end of file
+    return model
+
+def _predict(model, batch: np.ndarray):
+    """Call a Keras model directly; avoids the per-call overhead of model.predict for single images."""
+    outputs = model(batch, training=False)
+    if isinstance(outputs, (list, tuple)):
+        return [np.asarray(o) for o in outputs]
+    return np.asarray(outputs)
+
+def _prepare(image: np.ndarray, size: int, channels: str) -> np.ndarray:
+    """Resize to the model input size and convert to the normalized BGR batch the models were trained on."""
+    small = cv2.resize(image, (size, size))
+    if channels == "RGB":
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2BGR)
+    return np.expand_dims(small.astype(np.float32) / 255.0, axis=0)
+
+@timed("spoof")
+def analyze_spoof(spoof_model, image: np.ndarray, channels: str = "RGB", detect_face: bool = True) -> dict:
+    """
+    Run anti-spoofing and age/gender analysis on an already-decoded image or face crop.
+    Mirrors DeepFaceAntiSpoofing.analyze_image without writing the upload to disk or decoding it again.
+    Pass detect_face=False for a face crop to skip the Haar cascade face check.
+    """
+    if image is None or image.ndim != 3:
+        return {"error": "Failed to load image"}
+    if detect_face:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if channels == "RGB" else cv2.COLOR_BGR2GRAY)
+        detected = spoof_model.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        if len(detected) == 0:
+            return {"error": "No face detected"}
+        if len(detected) > 1:
+            return {"error": "Multiple faces detected"}
+    try:
+        age_pred, gender_pred = _predict(spoof_model.age_gender_model, _prepare(image, 96, channels))
+        age = int(np.argmax(age_pred[0]))
+        gender_probs = gender_pred[0]
+        dominant_gender = "Male" if gender_probs[0] > gender_probs[1] else "Female"
+
+        spoof_pred = _predict(spoof_model.anti_spoofing_model, _prepare(image, 128, channels))
+        spoof_prob = float(spoof_pred[0][0])
+        return {
+            "age": age,
+            "gender": {"Male": float(gender_probs[0]), "Female": float(gender_probs[1])},
+            "dominant_gender": dominant_gender,
+            "spoof": {"Fake": 1.0 - spoof_prob, "Real": spoof_prob},
+            "dominant_spoof": "Real" if spoof_prob > 0.5 else "Fake",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+def spoof_face_crop(image: Union[DecodedImage, np.ndarray], face: Mapping[str, Any], size: int = SPOOF_CROP_SIZE, margin: float = SPOOF_CROP_MARGIN) -> np.ndarray:
+    """
+    Square, roll-aligned RGB crop around an InsightFace detection (bbox and kps in full-resolution
+    pixels), rotated so the eyes are level. Taken from the decoded pixels, which may be a reduced-scale decode.
+    """
+    rgb = image.rgb if isinstance(image, DecodedImage) else image
+    scale = image.scale if isinstance(image, DecodedImage) else 1.0
+    bbox = np.asarray(face["bbox"], dtype=np.float32) / scale
+    center = ((bbox[0] + bbox[2]) / 2.0, (bbox[1] + bbox[3]) / 2.0)
+    side = max(bbox[2] - bbox[0], bbox[3] - bbox[1], 1.0) * margin
+    angle = 0.0
+    kps = face.get("kps")
+    if kps is not None:
+        left_eye, right_eye = np.asarray(kps, dtype=np.float32)[:2] / scale
+        angle = float(np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0])))
+    matrix = cv2.getRotationMatrix2D((float(center[0]), float(center[1])), angle, size / side)
+    matrix[:, 2] += (size / 2.0 - center[0], size / 2.0 - center[1])
+    return cv2.warpAffine(rgb, matrix, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+def analyze_spoof_face(spoof_model, image: Union[DecodedImage, np.ndarray], face: Mapping[str, Any], spoof_input: Optional[str] = None) -> dict:
+    """
+    Anti-spoofing for an already-detected face, on the input selected by SPOOF_INPUT. "frame" (the default)
+    classifies the full-resolution frame with the Haar cascade face check, as before face crops existed;
+    "crop" classifies the aligned crop of the detected face and skips the second detection.
+    The crop is experimental until app.spoof_eval shows it classifies real and spoof samples as well as the frame.
+    """
+    if (spoof_input or settings.SPOOF_INPUT) == "crop":
+        return analyze_spoof(spoof_model, spoof_face_crop(image, face), channels="RGB", detect_face=False)
+    rgb = image.full_rgb if isinstance(image, DecodedImage) else image
+    return analyze_spoof(spoof_model, rgb, channels="RGB")
+
+def spoof_cache_kind() -> str:
+    """Result cache kind of analyze_spoof_face verdicts, so frame and crop verdicts are never mixed."""
+    return "spoof_crop" if settings.SPOOF_INPUT == "crop" else "spoof"
+
+def warm_up_spoof_model(spoof_model) -> None:
+    """Run both Keras models once on blank inputs so the first request does not pay graph setup."""
+    _predict(spoof_model.age_gender_model, np.zeros((1, 96, 96, 3), dtype=np.float32))
+    _predict(spoof_model.anti_spoofing_model, np.zeros((1, 128, 128, 3), dtype=np.float32))
@@ -0,0 +1,132 @@
+"""
+Per-stage wall-clock timings of the face pipeline (decode, detect, embed, spoof, search, store, serialize).
+
+Pipeline code wraps each stage in `stage_timings.time(name)` (or decorates it with `timed(name)`); the
+recorder keeps a bounded window of recent durations per stage, which the benchmark harness summarizes
+into percentiles, and a cumulative histogram per stage exported by /metrics. Timings are per process:
+with INFERENCE_EXECUTOR=process the model stages run in the pool's workers and are not seen by the server process.
+"""
+import bisect
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+# "analyze" is detection and recognition together, for plain arrays analyzed by FaceAnalysis.get
+STAGES = ("decode", "detect", "embed", "analyze", "spoof", "search", "store", "serialize")
+# Histogram bucket upper bounds in seconds, from sub-millisecond gallery searches to multi-second batches
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative distribution of observed values over fixed buckets, with their sum and count. Not thread-safe on its own."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) pairs, ending with (inf, count)."""
+        pairs, running = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+    def copy(self) -> "Histogram":
+        other = Histogram(self.buckets)
+        other.bucket_counts, other.sum, other.count = list(self.bucket_counts), self.sum, self.count
+        return other
+
+
+class StageTimings:
+    """Thread-safe recorder of recent stage durations (seconds), at most max_samples per stage."""
+
+    def __init__(self, max_samples: int = 10000) -> None:
+        self.max_samples = max_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.max_samples)
+                self._histograms[stage] = Histogram()
+            samples.append(seconds)
+            self._histograms[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Record the duration of the with-block under `stage`, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def samples(self) -> Dict[str, List[float]]:
+        """Copy of the recorded durations per stage."""
+        with self._lock:
+            return {stage: list(samples) for stage, samples in self._samples.items()}
+
+    def counts(self) -> Dict[str, int]:
+        """Total observations per stage, including those no longer in the sample window."""
+        with self._lock:
+            return {stage: histogram.count for stage, histogram in self._histograms.items()}
+
+    def histograms(self) -> Dict[str, Histogram]:
+        """Copy of the cumulative histogram per stage."""
+        with self._lock:
+            return {stage: histogram.copy() for stage, histogram in self._histograms.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._histograms.clear()
+
+
+def timed(stage: str) -> Callable:
+    """Decorator recording every call of the function under `stage`."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timings.time(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * q // 100))  # ceil(n * q / 100)
+    return sorted_values[int(min(rank, len(sorted_values))) - 1]
+
+
+def summarize(durations: Iterable[float]) -> Dict[str, float]:
+    """count, mean and p50/p95/p99/max of durations, in milliseconds."""
+    values = sorted(durations)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": 1000 * sum(values) / len(values),
+        "p50_ms": 1000 * percentile(values, 50),
+        "p95_ms": 1000 * percentile(values, 95),
+        "p99_ms": 1000 * percentile(values, 99),
+        "max_ms": 1000 * values[-1],
+    }
+
+
+# Singleton instance for use across the app
+stage_timings = StageTimings()
@@ -0,0 +1,147 @@
+"""
+Evaluation of the anti-spoofing input paths on labelled real and spoof samples.
+
+Usage:
+    python -m app.spoof_eval --real images/pad/real --spoof images/pad/spoof
+    python -m app.spoof_eval --real images/pad/real --spoof images/pad/print,images/pad/replay --report spoof_report.json
+
+Every image is decoded the way the routes decode uploads and its face is detected with the serving
+InsightFace pack. The spoof model then classifies it once per SPOOF_INPUT: "frame" (the full-resolution
+frame with the Haar cascade face check) and "crop" (the aligned crop of the detected face). For each input
+the report gives accuracy, APCER (spoof samples accepted as real), BPCER (real samples rejected), errors
+and latency, plus how often the two inputs reach the same verdict. An error or a missing face counts as a
+rejection, as it does in the routes. SPOOF_INPUT=crop should only be enabled once this report shows it
+classifies at least as well as the frame on representative samples.
+"""
+import argparse
+import json
+import os.path as osp
+import statistics
+import sys
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LABELS = ("real", "spoof")
+
+
+def load_samples(directories: Dict[str, Iterable[str]]) -> List[Tuple[str, str, Any]]:
+    """(path, label, DecodedImage) for the images under each label's directories; unreadable files are skipped."""
+    from app.bulk_enroll import iter_directory
+    from app.services.image_decoding import DecodedImage
+    samples = []
+    for label, roots in directories.items():
+        for root in roots:
+            for item in iter_directory(root):
+                try:
+                    with open(item.path, "rb") as f:
+                        samples.append((osp.relpath(item.path), label, DecodedImage.from_bytes(f.read())))
+                except (OSError, ValueError):
+                    continue
+    return samples
+
+
+def summarize(labels: Dict[str, str], verdicts: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """Accuracy, APCER and BPCER of the verdicts ("Real", "Fake" or None for an error) against the labels."""
+    real = [path for path, label in labels.items() if label == "real"]
+    spoof = [path for path, label in labels.items() if label == "spoof"]
+    accepted = {path for path, verdict in verdicts.items() if verdict == "Real"}
+    false_accepts = sum(path in accepted for path in spoof)
+    false_rejects = sum(path not in accepted for path in real)
+    total = len(real) + len(spoof)
+    return {
+        "samples": {"real": len(real), "spoof": len(spoof)},
+        "errors": sum(verdicts.get(path) is None for path in labels),
+        "accuracy": round(1 - (false_accepts + false_rejects) / total, 4) if total else None,
+        "apcer": round(false_accepts / len(spoof), 4) if spoof else None,
+        "bpcer": round(false_rejects / len(real), 4) if real else None,
+    }
+
+
+def agreement(a: Dict[str, Optional[str]], b: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """How often two inputs reach the same verdict, and the samples where they differ."""
+    common = sorted(set(a) & set(b))
+    differing = [path for path in common if a[path] != b[path]]
+    return {"rate": round(1 - len(differing) / len(common), 4) if common else None, "differing": differing}
+
+
+def classify(spoof_model, samples: List[Tuple[str, str, Any]], faces: Dict[str, Optional[dict]], spoof_input: str) -> Tuple[Dict[str, Optional[str]], List[float]]:
+    """Verdict per sample with one input path, and the latency of each spoof call in ms."""
+    from app.services.spoof_model import analyze_spoof_face
+    verdicts, latencies = {}, []
+    for path, _, image in samples:
+        face = faces.get(path)
+        if face is None:
+            verdicts[path] = None
+            continue
+        started = time.perf_counter()
+        result = analyze_spoof_face(spoof_model, image, face, spoof_input=spoof_input)
+        latencies.append(1000 * (time.perf_counter() - started))
+        verdicts[path] = result.get("dominant_spoof")
+    return verdicts, latencies
+
+
+def evaluate(spoof_model, samples: List[Tuple[str, str, Any]], faces: Dict[str, Optional[dict]]) -> Dict[str, Any]:
+    """Per-input metrics and verdicts for the samples, given the detected face of each (None when none was found)."""
+    from app.services.spoof_model import SPOOF_INPUTS
+    labels = {path: label for path, label, _ in samples}
+    report: Dict[str, Any] = {
+        "created_at": datetime.now(UTC).isoformat(),
+        "no_face": sorted(path for path in labels if faces.get(path) is None),
+        "inputs": {},
+    }
+    verdicts = {}
+    for spoof_input in SPOOF_INPUTS:
+        verdicts[spoof_input], latencies = classify(spoof_model, samples, faces, spoof_input)
+        report["inputs"][spoof_input] = {
+            **summarize(labels, verdicts[spoof_input]),
+            "latency_ms": {"mean": round(statistics.fmean(latencies), 2), "max": round(max(latencies), 2)} if latencies else None,
+            "verdicts": verdicts[spoof_input],
+        }
+    report["agreement"] = agreement(*(verdicts[spoof_input] for spoof_input in SPOOF_INPUTS))
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'input':<8}{'accuracy':>10}{'APCER':>8}{'BPCER':>8}{'errors':>8}{'mean ms':>10}"]
+    for spoof_input, metrics in report["inputs"].items():
+        latency = metrics["latency_ms"]["mean"] if metrics["latency_ms"] else float("nan")
+        lines.append(f"{spoof_input:<8}{metrics['accuracy']:>10}{metrics['apcer']!s:>8}{metrics['bpcer']!s:>8}{metrics['errors']:>8}{latency:>10.2f}")
+    lines.append(f"Verdict agreement: {report['agreement']['rate']} ({len(report['agreement']['differing'])} differing); no face: {len(report['no_face'])}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the frame and face-crop anti-spoofing inputs on real and spoof samples.")
+    parser.add_argument("--real", required=True, help="Comma-separated directories of bona fide (live) face images.")
+    parser.add_argument("--spoof", required=True, help="Comma-separated directories of presentation attacks (prints, screens, masks).")
+    parser.add_argument("--report", default="spoof_report.json", help="Where to save the evaluation report.")
+    args = parser.parse_args(argv)
+
+    from app.services.facial_analysis import analyze_face
+    from app.services.spoof_model import load_spoof_model
+    log = lambda line: print(line, file=sys.stderr)
+
+    samples = load_samples({"real": args.real.split(","), "spoof": args.spoof.split(",")})
+    if not {label for _, label, _ in samples} >= set(LABELS):
+        log(f"Need both real ({args.real}) and spoof ({args.spoof}) samples")
+        return 1
+    spoof_model = load_spoof_model()
+    if spoof_model is None:
+        log("Spoof model could not be loaded")
+        return 1
+    faces = {}
+    for path, _, image in samples:
+        result = analyze_face(image)
+        faces[path] = result.get("face") if "error" not in result else None
+    log(f"Evaluating {len(samples)} samples ({sum(face is None for face in faces.values())} without a single face)")
+    report = evaluate(spoof_model, samples, faces)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(format_report(report))
+    log(f"Saved to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import asyncio
+import httpx
+from fastapi import FastAPI, File, UploadFile
+from app.benchmark import Scenario, build_scenarios, compare, run_scenario
+from app.services.stage_timing import StageTimings, percentile, stage_timings, summarize
+
+def test_percentiles_and_summary():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([0.5], 95) == 0.5
+    summary = summarize([0.001, 0.003, 0.002])
+    assert summary["count"] == 3 and summary["p50_ms"] == 2.0 and summary["max_ms"] == 3.0
+    assert summarize([]) == {"count": 0}
+
+def test_stage_timings_record_also_on_error():
+    timings = StageTimings(max_samples=2)
+    for _ in range(3):
+        with timings.time("detect"):
+            pass
+    try:
+        with timings.time("embed"):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert len(timings.samples()["detect"]) == 2
+    assert timings.counts() == {"detect": 3, "embed": 1}
+
+def test_run_scenario_in_process():
+    app = FastAPI()
+
+    @app.post("/echo/{user_id}")
+    async def echo(user_id: str, file: UploadFile = File(...)):
+        with stage_timings.time("decode"):
+            size = len(await file.read())
+        return {"user_id": user_id, "size": size}
+
+    scenario = Scenario("echo", "POST", "/echo/{user_id}", [
+        {"files": [("file", ("a.jpg", b"abc", "image/jpeg"))], "path": {"user_id": "u1"}},
+        {"files": [("file", ("b.jpg", b"abcd", "image/jpeg"))], "path": {"user_id": "u2"}},
+    ])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await run_scenario(client, scenario, iterations=3, concurrency=2)
+
+    result = asyncio.run(run())
+    assert result["status_counts"] == {"200": 6}
+    assert result["latency"]["count"] == 6
+    assert result["stages"]["decode"]["count"] == 6
+    assert result["throughput_rps"] > 0
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"scenarios": {"verify_profile": {
+        "latency": {"p50_ms": 100.0, "p95_ms": 200.0}, "throughput_rps": 10.0,
+        "stages": {"detect": {"p50_ms": 50.0, "p95_ms": 60.0}},
+    }}}
+    current = {"scenarios": {"verify_profile": {
+        "latency": {"p50_ms": 105.0, "p95_ms": 260.0}, "throughput_rps": 8.0,
+        "stages": {"detect": {"p50_ms": 70.0, "p95_ms": 61.0}},
+    }}}
+    regressions = compare(current, baseline, tolerance=0.1)
+    assert regressions == [
+        "verify_profile p95_ms: 200.0 -> 260.0",
+        "verify_profile throughput_rps: 10.00 -> 8.00",
+        "verify_profile [detect] p50_ms: 50.0 -> 70.0",
+    ]
+    assert compare(current, baseline, tolerance=0.5) == []
+
+def test_build_scenarios_covers_endpoints():
+    train = {f"{i}.jpeg": b"x" for i in range(1, 6)}
+    scenarios = {s.name: s for s in build_scenarios(train, {"11.jpeg": b"y"}, {})}
+    assert set(scenarios) == {"create_profile", "verify_profile", "verify_claimed", "verify_batch", "enroll_qc", "create_profile_5poses"}
+    assert scenarios["create_profile"].requests[0]["data"]["user_id"] == "bench-1"
+    assert len(scenarios["verify_batch"].requests[0]["files"]) == 1
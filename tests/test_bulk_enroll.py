@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+from app.bulk_enroll import Checkpoint, EnrollItem, embedding_id, enroll, iter_directory, iter_manifest
+
+def _write_image(path, value=128):
+    cv2.imwrite(str(path), np.full((32, 32, 3), value, dtype=np.uint8))
+
+class FakeService:
+    def __init__(self):
+        self.added = []
+    def add_embeddings(self, ids, embeddings, metadatas, batch_size=1000):
+        self.added.extend(zip(ids, metadatas))
+
+def fake_analyze(images):
+    return [{"embedding": [0.1] * 512, "gender": "M"} if image.rgb.mean() > 10 else {"error": "No face detected."} for image in images]
+
+def test_iter_directory_labels(tmp_path):
+    _write_image(tmp_path / "1.jpeg")
+    (tmp_path / "alice").mkdir()
+    _write_image(tmp_path / "alice" / "a.png")
+    (tmp_path / "notes.txt").write_text("x")
+    items = list(iter_directory(str(tmp_path)))
+    assert [item.user_id for item in items] == ["1", "alice"]
+
+def test_iter_manifest(tmp_path):
+    manifest = tmp_path / "people.csv"
+    manifest.write_text("path,user_id,name\nimgs/1.jpg,u1,Ann\n/abs/2.jpg,u2,\n")
+    items = list(iter_manifest(str(manifest)))
+    assert items[0] == EnrollItem(path=str(tmp_path / "imgs" / "1.jpg"), user_id="u1", name="Ann")
+    assert items[1] == EnrollItem(path="/abs/2.jpg", user_id="u2", name=None)
+
+def test_enroll_and_resume(tmp_path):
+    _write_image(tmp_path / "1.jpeg")
+    _write_image(tmp_path / "2.jpeg", value=0)
+    (tmp_path / "3.jpeg").write_bytes(b"not an image")
+    checkpoint_path = str(tmp_path / "enroll.ckpt")
+    service = FakeService()
+    counts = enroll(iter_directory(str(tmp_path)), service, analyze=fake_analyze, batch_size=2, workers=2, checkpoint=Checkpoint(checkpoint_path))
+    assert counts["enrolled"] == 1 and counts["no_face"] == 1 and counts["invalid_image"] == 1
+    assert service.added[0][0] == embedding_id(EnrollItem(path=str(tmp_path / "1.jpeg")))
+    assert service.added[0][1]["user_id"] == "1"
+    # A second run resumes from the checkpoint and writes nothing
+    service = FakeService()
+    counts = enroll(iter_directory(str(tmp_path)), service, analyze=fake_analyze, checkpoint=Checkpoint(checkpoint_path))
+    assert counts["skipped"] == 3 and service.added == []
+
+def test_enroll_fills_the_cascade_light_gallery(tmp_path, monkeypatch):
+    from app.services import model_cascade
+    _write_image(tmp_path / "1.jpeg")
+
+    class FakeCascade:
+        def __init__(self):
+            self.stored = []
+        def store(self, ids, embeddings, metadatas):
+            self.stored.extend(zip(ids, embeddings))
+
+    monkeypatch.setattr(model_cascade, "light_embeddings", lambda images, faces: [[0.2] * 512 for _ in images])
+    analyze = lambda images: [{"embedding": [0.1] * 512, "gender": "M", "face": {"bbox": [0, 0, 8, 8], "kps": [[2, 2]] * 5}} for _ in images]
+    cascade = FakeCascade()
+    service = FakeService()
+    enroll(iter_directory(str(tmp_path)), service, analyze=analyze, cascade=cascade)
+    assert [stored_id for stored_id, _ in cascade.stored] == [service.added[0][0]]
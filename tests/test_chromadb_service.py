@@ -1,3 +1,4 @@
+import uuid
 import pytest
 from app.services.chromadb_service import ChromaDBService
 
@@ -28,3 +29,115 @@ def test_query_embedding_error():
     service.collection = FakeCollection()
     with pytest.raises(Exception):
         service.query_embedding([0.1]*512)
+
+def test_add_embeddings_in_chunks():
+    service = ChromaDBService(collection_name="test_collection")
+    calls = []
+    class FakeCollection:
+        def add(self, ids, embeddings, metadatas, **kwargs): calls.append(list(ids))
+    service.collection = FakeCollection()
+    ids = [f"id{i}" for i in range(5)]
+    service.add_embeddings(ids, [[0.1]*512]*5, [{"foo": "bar"}]*5, batch_size=2)
+    assert calls == [["id0", "id1"], ["id2", "id3"], ["id4"]]
+
+def test_get_page_and_iter_pages():
+    import numpy as np
+    service = ChromaDBService(collection_name="test_collection")
+    class FakeCollection:
+        ids = [f"id{i}" for i in range(5)]
+        def get(self, limit, offset, include, **kwargs):
+            ids = self.ids[offset:offset + limit]
+            page = {"ids": ids, "metadatas": [{"i": i} for i in range(len(ids))], "documents": None}
+            if "embeddings" in include:
+                page["embeddings"] = np.ones((len(ids), 4), dtype=np.float32)
+            return page
+        def count(self): return len(self.ids)
+    service.collection = FakeCollection()
+    page = service.get_page(limit=2, offset=4, include_embeddings=False)
+    assert page["ids"] == ["id4"] and page["total"] == 5 and "embeddings" not in page
+    assert service.get_page(limit=2, include_embeddings=True)["embeddings"] == [[1.0] * 4] * 2
+    pages = list(service.iter_pages(batch_size=2))
+    assert [len(p["ids"]) for p in pages] == [2, 2, 1]
+    assert pages[0]["embeddings"].shape == (2, 4)
+
+def test_delete_where_in_chunks():
+    service = ChromaDBService(collection_name="test_collection")
+    class FakeCollection:
+        ids = [f"id{i}" for i in range(5)]
+        deletes = []
+        def get(self, where, limit, include, **kwargs): return {"ids": self.ids[:limit]}
+        def delete(self, ids):
+            self.deletes.append(list(ids))
+            self.ids = [i for i in self.ids if i not in ids]
+    service.collection = FakeCollection()
+    assert service.delete_where({"user_id": "u1"}, batch_size=2) == 5
+    assert service.collection.deletes == [["id0", "id1"], ["id2", "id3"], ["id4"]]
+
+def _unit(index: int) -> list:
+    vector = [0.0] * 512
+    vector[index] = 1.0
+    return vector
+
+def _shared_services(monkeypatch):
+    """Two services on one ChromaDB backend, standing in for two worker processes."""
+    import chromadb
+    from app.services import chromadb_service as module
+    monkeypatch.setattr(module.settings, "GALLERY_SYNC_INTERVAL", 1e-9)
+    client = chromadb.EphemeralClient()
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    services = []
+    for _ in range(2):
+        service = ChromaDBService(collection_name=name)
+        service.shared = True
+        service.client = client
+        service.collection = client.get_or_create_collection(name)
+        services.append(service)
+    return services
+
+def test_gallery_reloads_after_delete_and_add_elsewhere(monkeypatch):
+    first, second = _shared_services(monkeypatch)
+    first.add_embeddings(["a", "b"], [_unit(0), _unit(1)], [{"n": 1}, {"n": 2}])
+    assert len(second.ensure_gallery()) == 2
+    first.delete_ids(["a"])
+    first.add_embedding("c", _unit(2), {"n": 3})
+    # Same count as before, but the version marker changed
+    assert {hit["id"] for hit in second.search(_unit(2), n_results=5)} == {"b", "c"}
+    assert len(first.ensure_gallery()) == 2
+
+def test_writes_follow_a_reset_in_another_process(monkeypatch):
+    first, second = _shared_services(monkeypatch)
+    first.add_embedding("a", _unit(0), {"n": 1})
+    second.ensure_gallery()
+    first.clear()
+    second.add_embedding("b", _unit(1), {"n": 2})
+    assert first.collection.count() == 1
+    assert [hit["id"] for hit in first.search(_unit(1), n_results=5)] == ["b"]
+    assert [hit["id"] for hit in second.search(_unit(1), n_results=5)] == ["b"]
+
+def test_delete_ids_counts_only_existing_embeddings(monkeypatch):
+    first, _ = _shared_services(monkeypatch)
+    first.add_embeddings(["a", "b"], [_unit(0), _unit(1)], [{"n": 1}, {"n": 2}])
+    assert first.delete_ids(["a", "missing"]) == 1
+    assert first.delete_ids(["missing"]) == 0
+    assert first.collection.count() == 1
+
+def test_deletes_follow_a_reset_in_another_process(monkeypatch):
+    first, second = _shared_services(monkeypatch)
+    first.add_embeddings(["a", "b"], [_unit(0), _unit(1)], [{"n": 1}, {"n": 1}])
+    second.ensure_gallery()
+    first.clear()
+    first.add_embedding("c", _unit(2), {"n": 1})
+    # second still holds the dropped collection's handle
+    assert second.delete_where({"n": 1}) == 1
+    assert first.collection.count() == 0
+
+def test_embedded_store_writes_no_version_marker():
+    import chromadb
+    service = ChromaDBService(collection_name=f"test_{uuid.uuid4().hex[:8]}")
+    assert not service.shared
+    service.client = chromadb.EphemeralClient()
+    service.collection = service.client.get_or_create_collection(service.collection_name)
+    calls = []
+    service.collection.modify = lambda **kwargs: calls.append(kwargs)
+    service.add_embeddings(["a"], [_unit(0)], [{"n": 1}])
+    assert calls == []
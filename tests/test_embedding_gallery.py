@@ -0,0 +1,109 @@
+import numpy as np
+from app.services.embedding_gallery import EmbeddingGallery, l2_distance, l2_normalize
+
+def _random(n, dim=512, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+def test_search_matches_brute_force_cosine():
+    vectors = _random(200)
+    gallery = EmbeddingGallery(initial_capacity=16)
+    gallery.add([f"id{i}" for i in range(200)], vectors, [{"i": i} for i in range(200)])
+    probe = vectors[17] * 3.0 + 0.01
+    hits = gallery.search(probe, k=5)
+    expected = np.argsort(-(l2_normalize(vectors) @ l2_normalize(probe)))[:5]
+    assert [hit["id"] for hit in hits] == [f"id{i}" for i in expected]
+    assert hits[0]["id"] == "id17"
+    assert hits[0]["metadata"] == {"i": 17}
+    assert np.isclose(np.linalg.norm(hits[0]["embedding"]), 1.0)
+    assert hits[0]["score"] >= hits[-1]["score"]
+
+def test_remove_and_upsert():
+    vectors = _random(4)
+    gallery = EmbeddingGallery()
+    gallery.add(["a", "b", "c", "d"], vectors)
+    assert gallery.remove(["b", "missing"]) == 1
+    assert len(gallery) == 3
+    assert "b" not in gallery
+    assert gallery.search(vectors[3], k=1)[0]["id"] == "d"
+    gallery.add(["a"], vectors[1:2], [{"updated": True}])
+    assert len(gallery) == 3
+    hit = gallery.search(vectors[1], k=1)[0]
+    assert hit["id"] == "a" and hit["metadata"] == {"updated": True}
+    gallery.clear()
+    assert gallery.search(vectors[0], k=1) == []
+
+def test_search_many_and_k_larger_than_gallery():
+    vectors = _random(3)
+    gallery = EmbeddingGallery()
+    gallery.add(["a", "b", "c"], vectors)
+    results = gallery.search_many(vectors, k=10)
+    assert [hits[0]["id"] for hits in results] == ["a", "b", "c"]
+    assert all(len(hits) == 3 for hits in results)
+
+def test_load_from_collection_pages():
+    vectors = _random(5)
+    class FakeCollection:
+        def get(self, limit, offset, include):
+            ids = [f"id{i}" for i in range(5)][offset:offset + limit]
+            return {"ids": ids, "embeddings": vectors[offset:offset + limit], "metadatas": [{} for _ in ids]}
+    gallery = EmbeddingGallery()
+    gallery.load_from_collection(FakeCollection(), batch_size=2)
+    assert gallery.loaded
+    assert len(gallery) == 5
+    assert gallery.search(vectors[4], k=1)[0]["id"] == "id4"
+
+def test_search_profiles_collapses_pose_vectors():
+    vectors = _random(16, seed=3)
+    gallery = EmbeddingGallery()
+    # Three five-vector profiles plus one legacy single-vector profile
+    ids = [f"p{p}:{pose}" for p in range(3) for pose in range(5)] + ["legacy"]
+    metadatas = [{"profile_id": f"p{p}", "pose": pose} for p in range(3) for pose in range(5)] + [{}]
+    gallery.add(ids, vectors, metadatas)
+    hits = gallery.search_profiles(vectors[7], k=3)
+    assert hits[0]["id"] == "p1"
+    assert hits[0]["metadata"]["pose"] == 2
+    assert np.isclose(hits[0]["score"], 1.0, atol=1e-5)
+    assert len({hit["id"] for hit in hits}) == 3
+    scores = l2_normalize(vectors) @ l2_normalize(vectors[7])
+    mean_hit = gallery.search_profiles(vectors[7], k=1, fusion="mean")[0]
+    assert np.isclose(mean_hit["score"], scores[5:10].mean(), atol=1e-5)
+    assert gallery.search_profiles(vectors[15], k=1)[0]["id"] == "legacy"
+    gallery.remove(["p1:2"])
+    assert gallery.search_profiles(vectors[7], k=1)[0]["score"] < 0.99
+
+def test_compact_releases_spare_rows():
+    vectors = _random(3000)
+    gallery = EmbeddingGallery(initial_capacity=16)
+    gallery.add([f"id{i}" for i in range(3000)], vectors)
+    gallery.remove([f"id{i}" for i in range(2500)])
+    assert gallery.compact(min_capacity=16) > 0
+    assert gallery._matrix.shape[0] == 500
+    assert gallery.search(vectors[2999], k=1)[0]["id"] == "id2999"
+
+def test_search_user_only_scores_claimed_user():
+    vectors = _random(8, seed=5)
+    gallery = EmbeddingGallery()
+    ids = [f"p{p}:{pose}" for p in range(2) for pose in range(3)] + ["single", "other"]
+    metadatas = [{"profile_id": f"p{p}", "user_id": "alice" if p == 0 else "bob"} for p in range(2) for _ in range(3)]
+    metadatas += [{"user_id": "alice"}, {"user_id": "carol"}]
+    gallery.add(ids, vectors, metadatas)
+    hits = gallery.search_user(vectors[3], "bob")
+    assert [hit["id"] for hit in hits] == ["p1"]
+    assert np.isclose(hits[0]["score"], 1.0, atol=1e-5)
+    alice = gallery.search_user(vectors[6], "alice")
+    assert [hit["id"] for hit in alice] == ["single", "p0"]
+    assert gallery.search_user(vectors[0], "nobody") is None
+    gallery.remove(["other"])
+    assert gallery.search_user(vectors[7], "carol") is None
+
+def test_hits_report_chroma_l2_distance_to_the_raw_vector():
+    vectors = _random(3) * np.array([[1.0], [5.0], [20.0]], dtype=np.float32)
+    gallery = EmbeddingGallery()
+    gallery.add(["a", "b", "c"], vectors)
+    probe = vectors[1] * 0.7 + _random(1, seed=1)[0]
+    for hits in (gallery.search(probe, k=3), gallery.search_profiles(probe, k=3)):
+        for hit in hits:
+            raw = vectors[["a", "b", "c"].index(hit["id"])]
+            assert np.isclose(l2_distance(probe, hit), np.sum((probe - raw) ** 2), rtol=1e-4)
+    gallery.remove(["a"])
+    assert np.isclose(gallery.search(vectors[2], k=1)[0]["norm"], np.linalg.norm(vectors[2]), rtol=1e-5)
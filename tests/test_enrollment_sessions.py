@@ -0,0 +1,70 @@
+import os
+import time
+from app.services.enrollment_sessions import SESSION_FILE, DiskEnrollmentSessionStore, EnrollmentSessionStore, PoseCapture
+
+def _capture(value: float = 1.0) -> PoseCapture:
+    return PoseCapture(embedding=[value] * 4, pose=[0.0, 0.0, 0.0], quality={"det_score": 0.9})
+
+def test_create_get_and_capture():
+    store = EnrollmentSessionStore()
+    session = store.create()
+    assert store.get(session.session_id) is session
+    assert store.add_capture(session.session_id, "frontal", _capture()) is session
+    assert store.add_capture(session.session_id, "left", _capture(2.0)).summary(store.ttl)["captured"] == ["frontal", "left"]
+    assert store.get("missing") is None
+    assert store.add_capture("missing", "frontal", _capture()) is None
+
+def test_sessions_expire_after_inactivity(monkeypatch):
+    store = EnrollmentSessionStore(ttl_seconds=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    session = store.create()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 8)
+    assert store.get(session.session_id) is session  # refreshes the expiry
+    monkeypatch.setattr(time, "monotonic", lambda: now + 16)
+    assert store.get(session.session_id) is session
+    monkeypatch.setattr(time, "monotonic", lambda: now + 27)
+    assert store.get(session.session_id) is None
+    assert len(store) == 0
+
+def test_store_evicts_least_recently_used():
+    store = EnrollmentSessionStore(max_sessions=2)
+    first, second = store.create(), store.create()
+    store.get(first.session_id)
+    third = store.create()
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is first and store.get(third.session_id) is third
+
+def test_pop_and_restore():
+    store = EnrollmentSessionStore()
+    session = store.create()
+    store.add_capture(session.session_id, "frontal", _capture())
+    assert store.pop(session.session_id) is session
+    assert store.pop(session.session_id) is None
+    store.restore(session)
+    assert store.get(session.session_id).captures["frontal"].embedding == [1.0] * 4
+
+def test_disk_store_is_shared_between_instances(tmp_path):
+    first, second = DiskEnrollmentSessionStore(str(tmp_path)), DiskEnrollmentSessionStore(str(tmp_path))
+    session = first.create()
+    assert second.add_capture(session.session_id, "frontal", _capture()) is not None
+    assert first.get(session.session_id).captures["frontal"].embedding == [1.0] * 4
+    assert len(second) == 1
+    taken = second.pop(session.session_id)
+    assert taken.captures["frontal"].quality == {"det_score": 0.9}
+    assert first.pop(session.session_id) is None and first.get(session.session_id) is None
+    first.restore(taken)
+    assert second.get(session.session_id).captures["frontal"].pose == [0.0, 0.0, 0.0]
+    assert first.get("../etc") is None and first.pop("../etc") is None
+
+def test_disk_store_expiry_and_eviction(tmp_path, monkeypatch):
+    store = DiskEnrollmentSessionStore(str(tmp_path), ttl_seconds=10, max_sessions=2)
+    old, kept = store.create(), store.create()
+    stale = os.path.join(str(tmp_path), old.session_id, SESSION_FILE)
+    os.utime(stale, (time.time() - 5, time.time() - 5))
+    newest = store.create()  # full: evicts the least recently active session
+    assert store.get(old.session_id) is None
+    assert store.get(kept.session_id) is not None and store.get(newest.session_id) is not None
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert store.get(kept.session_id) is None and len(store) == 0
@@ -1,5 +1,5 @@
 import numpy as np
-from app.services.facial_analysis import analyze_face, verify_embeddings
+from app.services.facial_analysis import analyze_face, analyze_faces, verify_embeddings, verify_similarity
 from PIL import Image
 import pytest
 
@@ -18,6 +18,18 @@ def test_verify_embeddings_no_match():
     assert bool(result["match"]) is False
     assert result["message"] == "No match"
 
+def test_verify_similarity_agrees_with_verify_embeddings():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        a, b = rng.normal(size=512), rng.normal(size=512)
+        b = a + rng.uniform(0.2, 2.0) * b
+        similarity = float(np.dot(a, b) / np.linalg.norm(a) / np.linalg.norm(b))
+        expected = verify_embeddings(a, b)
+        result = verify_similarity(similarity)
+        assert result["match"] == expected["match"] and np.isclose(result["distance"], expected["distance"], atol=1e-6)
+    # A fused (mean) score below the threshold is no match, whatever the best single vector scored
+    assert verify_similarity(0.45)["match"] is False and verify_similarity(0.55)["match"] is True
+
 def test_analyze_face_no_face(monkeypatch):
     # Patch the model to return no faces
     class FakeFaceApp:
@@ -33,6 +45,8 @@ def test_analyze_face_male_branch(monkeypatch):
     class FakeFace:
         embedding = type('emb', (), {'tolist': lambda self: [0.1]*512})()
         sex = 'M'
+        bbox = np.zeros(4, dtype=np.float32)
+        kps = np.zeros((5, 2), dtype=np.float32)
     class FakeFaceApp:
         def get(self, img): return [FakeFace()]
     monkeypatch.setattr("app.services.facial_analysis.face_app", FakeFaceApp())
@@ -46,6 +60,8 @@ def test_analyze_face_female_branch(monkeypatch):
     class FakeFace:
         embedding = type('emb', (), {'tolist': lambda self: [0.1]*512})()
         sex = 'F'
+        bbox = np.zeros(4, dtype=np.float32)
+        kps = np.zeros((5, 2), dtype=np.float32)
     class FakeFaceApp:
         def get(self, img): return [FakeFace()]
     monkeypatch.setattr("app.services.facial_analysis.face_app", FakeFaceApp())
@@ -53,3 +69,15 @@ def test_analyze_face_female_branch(monkeypatch):
     result = analyze_face(img)
     assert result["gender"] == 'F'
     assert len(result["embedding"]) == 512
+
+def test_analyze_faces_runs_the_given_pack(monkeypatch):
+    # Both cascade tiers share analyze_faces; only the pack differs
+    light_app = object()
+    seen = []
+    def fake_batch(app, arrays):
+        seen.append(app)
+        return [[] for _ in arrays[:-1]] + [RuntimeError("boom")]
+    monkeypatch.setattr("app.services.facial_analysis.analyze_batch", fake_batch)
+    images = [np.zeros((32, 32, 3), dtype=np.uint8)] * 2
+    assert analyze_faces(images, lambda: light_app) == [{"error": "No face detected."}, {"error": "Face analysis failed."}]
+    assert seen == [light_app]
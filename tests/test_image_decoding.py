@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+import pytest
+from app.services.image_decoding import DecodedImage, decode_image_bytes, frame_from_raw_bytes, jpeg_reduction, parse_frame_shape
+
+def test_decode_image_bytes_png_roundtrip():
+    rgb = np.random.randint(0, 255, (32, 48, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".png", rgb[..., ::-1])
+    assert ok
+    decoded = decode_image_bytes(buf.tobytes())
+    assert decoded.shape == (32, 48, 3)
+    assert np.array_equal(decoded, rgb)
+
+def test_decode_image_bytes_invalid():
+    with pytest.raises(ValueError):
+        decode_image_bytes(b"This is not an image.")
+    with pytest.raises(ValueError):
+        decode_image_bytes(b"")
+
+def test_parse_frame_shape():
+    assert parse_frame_shape("480,640,3") == (480, 640, 3)
+    assert parse_frame_shape("480x640") == (480, 640, 3)
+    with pytest.raises(ValueError):
+        parse_frame_shape("abc")
+    with pytest.raises(ValueError):
+        parse_frame_shape("0,640,3")
+
+def test_frame_from_raw_bytes_is_zero_copy():
+    rgb = np.random.randint(0, 255, (4, 5, 3), dtype=np.uint8)
+    raw = rgb.tobytes()
+    frame = frame_from_raw_bytes(raw, (4, 5, 3))
+    assert np.array_equal(frame, rgb)
+    assert not frame.flags.owndata
+
+def test_frame_from_raw_bytes_wrong_size():
+    with pytest.raises(ValueError):
+        frame_from_raw_bytes(b"\x00" * 10, (4, 5, 3))
+    with pytest.raises(ValueError):
+        frame_from_raw_bytes(b"\x00" * 20, (4, 5, 1))
+
+def test_decoded_image_caches_derived_views():
+    rgb = np.random.randint(0, 255, (40, 80, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".png", rgb[..., ::-1])
+    image = DecodedImage.from_bytes(buf.tobytes())
+    assert image.rgb.flags.c_contiguous
+    assert (image.height, image.width) == (40, 80)
+    assert image.gray is image.gray
+    assert np.array_equal(image.gray, cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
+    assert np.array_equal(image.mirrored.rgb, rgb[:, ::-1, :])
+    assert image.mirrored.rgb.flags.c_contiguous
+    small = image.downscaled(20)
+    assert small.shape == (10, 20, 3)
+    assert image.downscaled(20) is small
+    assert image.downscaled(100) is image.rgb
+
+def test_decoded_image_rejects_non_rgb():
+    with pytest.raises(ValueError):
+        DecodedImage(np.zeros((4, 4), dtype=np.uint8))
+
+def test_large_jpeg_decoded_at_reduced_scale():
+    rgb = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    rgb[:, 2000:] = 200
+    ok, buf = cv2.imencode(".jpg", rgb)
+    contents = buf.tobytes()
+    assert jpeg_reduction(contents, 800) == 4
+    assert jpeg_reduction(contents, 0) == 1
+    image = DecodedImage.from_bytes(contents, min_side=800)
+    assert image.reduced and image.scale == 4.0
+    assert image.rgb.shape == (750, 1000, 3)
+    assert image.full_rgb.shape == (3000, 4000, 3)
+    assert image.mirrored.full_rgb[0, 0, 0] > 150
+    small = DecodedImage.from_bytes(cv2.imencode(".jpg", rgb[:600, :700])[1].tobytes(), min_side=800)
+    assert not small.reduced and small.full_rgb is small.rgb
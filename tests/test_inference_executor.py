@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.services import inference_executor
+from app.services.inference_executor import get_inference_executor, run_inference, run_in_model_thread, shutdown_executors
+
+def _thread_name(x):
+    return threading.current_thread().name, x * 2
+
+def test_run_inference_uses_thread_pool(monkeypatch):
+    monkeypatch.setattr(inference_executor.settings, "INFERENCE_EXECUTOR", "thread")
+    monkeypatch.setattr(inference_executor.settings, "INFERENCE_WORKERS", 2)
+    shutdown_executors()
+    name, value = asyncio.run(run_inference(_thread_name, 21))
+    assert value == 42
+    assert name.startswith("inference")
+    assert isinstance(get_inference_executor(), ThreadPoolExecutor)
+    shutdown_executors()
+
+def test_run_in_model_thread_keeps_loop_free(monkeypatch):
+    monkeypatch.setattr(inference_executor.settings, "INFERENCE_EXECUTOR", "thread")
+    shutdown_executors()
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def main():
+        task = asyncio.ensure_future(run_in_model_thread(blocking))
+        # The loop keeps running while the model work blocks its worker thread.
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        release.set()
+        return await task
+
+    assert asyncio.run(main()) == "done"
+    shutdown_executors()
@@ -0,0 +1,139 @@
+import threading
+import numpy as np
+import pytest
+from insightface.utils.face_align import arcface_dst
+from app.services.inference_scheduler import MicroBatchScheduler, _Request, analyze_batch
+
+class FakeDetModel:
+    def detect(self, img, max_num=0, metric="default"):
+        if img.mean() == 0:
+            return np.zeros((0, 5), dtype=np.float32), None
+        bboxes = np.array([[10, 10, 100, 100, 0.9]], dtype=np.float32)
+        return bboxes, arcface_dst[None].copy()
+
+class FakeRecModel:
+    input_size = (112, 112)
+    input_shape = ["None", 3, 112, 112]
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_feat(self, imgs):
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+        with self.lock:
+            self.calls.append(len(imgs))
+        return np.stack([np.full(512, img.mean(), dtype=np.float32) for img in imgs])
+
+class FakeGenderAge:
+    def get(self, img, face):
+        face.gender = 1
+        face.age = 30
+
+class FakeAnalyzer:
+    def __init__(self):
+        self.det_model = FakeDetModel()
+        self.models = {"detection": self.det_model, "recognition": FakeRecModel(), "genderage": FakeGenderAge()}
+
+def test_scheduler_single_request():
+    analyzer = FakeAnalyzer()
+    scheduler = MicroBatchScheduler(analyzer, max_batch_size=4, max_wait_ms=5)
+    faces = scheduler.get(np.full((128, 128, 3), 50, dtype=np.uint8))
+    scheduler.shutdown()
+    assert len(faces) == 1
+    assert faces[0].embedding.shape == (512,)
+    assert faces[0].sex == "M"
+
+def test_scheduler_no_face():
+    scheduler = MicroBatchScheduler(FakeAnalyzer())
+    assert scheduler.get(np.zeros((64, 64, 3), dtype=np.uint8)) == []
+    scheduler.shutdown()
+
+def test_scheduler_batches_queued_requests():
+    analyzer = FakeAnalyzer()
+    scheduler = MicroBatchScheduler(analyzer, max_batch_size=8, max_wait_ms=50)
+    # Queue everything before the worker starts so it is picked up as one batch.
+    imgs = [np.full((128, 128, 3), 10 * (i + 1), dtype=np.uint8) for i in range(5)]
+    requests = [_Request(img=img) for img in imgs]
+    for request in requests:
+        scheduler._queue.put(request)
+    scheduler._ensure_started()
+    results = [request.future.result(timeout=5) for request in requests]
+    scheduler.shutdown()
+    assert analyzer.models["recognition"].calls == [5]
+    # Each request gets the embedding computed from its own image.
+    means = [faces[0].embedding[0] for faces in results]
+    assert means == sorted(means)
+
+def test_scheduler_propagates_errors():
+    analyzer = FakeAnalyzer()
+    def broken_detect(*args, **kwargs):
+        raise RuntimeError("detector failed")
+    analyzer.det_model.detect = broken_detect
+    scheduler = MicroBatchScheduler(analyzer)
+    with pytest.raises(RuntimeError):
+        scheduler.get(np.full((64, 64, 3), 50, dtype=np.uint8))
+    scheduler.shutdown()
+
+def test_analyze_batch_isolates_failures():
+    analyzer = FakeAnalyzer()
+    detect = analyzer.det_model.detect
+    def flaky_detect(img, max_num=0, metric="default"):
+        if img.mean() == 99:
+            raise RuntimeError("detector failed")
+        return detect(img, max_num=max_num, metric=metric)
+    analyzer.det_model.detect = flaky_detect
+    imgs = [np.full((128, 128, 3), value, dtype=np.uint8) for value in (20, 99, 0, 40)]
+    results = analyze_batch(analyzer, imgs)
+    assert analyzer.models["recognition"].calls == [2]
+    assert len(results[0]) == 1 and isinstance(results[1], RuntimeError)
+    assert results[2] == [] and len(results[3]) == 1
+
+class ReducedImage:
+    """Stand-in for a reduced-scale DecodedImage that records full-resolution access."""
+    def __init__(self, rgb, scale):
+        self.rgb, self.scale, self.full_reads = rgb, scale, 0
+    @property
+    def full_rgb(self):
+        self.full_reads += 1
+        return np.full((self.rgb.shape[0] * int(self.scale), self.rgb.shape[1] * int(self.scale), 3), 77, dtype=np.uint8)
+
+def test_analyze_batch_aligns_small_faces_from_full_resolution():
+    analyzer = FakeAnalyzer()
+    analyzer.det_model.detect = lambda img, max_num=0, metric="default": (
+        np.array([[10, 10, 60, 60, 0.9]], dtype=np.float32), arcface_dst[None] * 0.5)
+    image = ReducedImage(np.full((128, 128, 3), 20, dtype=np.uint8), 4.0)
+    faces = analyze_batch(analyzer, [image])[0]
+    assert image.full_reads == 1
+    assert faces[0].embedding[0] > 20  # crop came from the full-resolution pixels
+    assert np.allclose(faces[0].bbox, [40, 40, 240, 240])
+    # A face already large in the reduced image is aligned from the reduced pixels
+    analyzer.det_model.detect = FakeDetModel().detect
+    image = ReducedImage(np.full((128, 128, 3), 20, dtype=np.uint8), 4.0)
+    analyze_batch(analyzer, [image])
+    assert image.full_reads == 0
+
+def test_async_requests_fill_batches_beyond_the_executor_size(monkeypatch):
+    import asyncio
+    from app.services import facial_analysis
+    analyzer = FakeAnalyzer()
+    release = threading.Event()
+    detect = analyzer.det_model.detect
+    analyzer.det_model.detect = lambda *args, **kwargs: release.wait(5) and detect(*args, **kwargs)
+    scheduler = MicroBatchScheduler(analyzer, max_batch_size=8, max_wait_ms=5)
+    monkeypatch.setattr(facial_analysis, "_scheduler", scheduler)
+    monkeypatch.setattr(facial_analysis.settings, "INFERENCE_BATCHING", True)
+    monkeypatch.setattr(facial_analysis.settings, "INFERENCE_WORKERS", 1)
+
+    async def run():
+        tasks = [asyncio.ensure_future(facial_analysis.analyze_face_async(np.full((128, 128, 3), 10 * (i + 1), dtype=np.uint8))) for i in range(8)]
+        await asyncio.sleep(0)  # every request is submitted without waiting for an executor thread
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run())
+    scheduler.shutdown()
+    assert all("embedding" in result for result in results)
+    calls = analyzer.models["recognition"].calls
+    assert sum(calls) == 8 and max(calls) >= 7
@@ -0,0 +1,52 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.services.metrics import MetricsMiddleware, RequestMetrics, TimedJSONResponse, _histogram_lines, _metric, request_metrics
+from app.services.stage_timing import Histogram, stage_timings
+
+def test_histogram_is_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.01, 2), (0.1, 3), (float("inf"), 4)]
+    assert histogram.count == 4 and abs(histogram.sum - 3.065) < 1e-9
+
+def test_text_format():
+    histogram = Histogram(buckets=(0.5,))
+    histogram.observe(0.25)
+    lines = _histogram_lines("face_stage_duration_seconds", [({"stage": "detect"}, histogram)])
+    assert lines == [
+        'face_stage_duration_seconds_bucket{stage="detect",le="0.5"} 1',
+        'face_stage_duration_seconds_bucket{stage="detect",le="+Inf"} 1',
+        'face_stage_duration_seconds_sum{stage="detect"} 0.25',
+        'face_stage_duration_seconds_count{stage="detect"} 1',
+    ]
+    out = []
+    _metric(out, "result_cache_hit_ratio", "gauge", "Hit rate.", [({"kind": 'a"b'}, 0.5)])
+    assert out[-1] == 'result_cache_hit_ratio{kind="a\\"b"} 0.5'
+
+def test_request_metrics_in_flight():
+    metrics = RequestMetrics()
+    metrics.started()
+    assert metrics.in_flight == 1
+    metrics.finished("GET", "/health", 200, 0.002)
+    assert metrics.in_flight == 0
+    assert metrics.durations()[("GET", "/health", "200")].count == 1
+
+def test_middleware_labels_by_route_template_and_times_serialization():
+    app = FastAPI(default_response_class=TimedJSONResponse)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: str):
+        return {"item_id": item_id}
+
+    serialized = stage_timings.counts().get("serialize", 0)
+    client = TestClient(app)
+    assert client.get("/items/1").json() == {"item_id": "1"}
+    client.get("/items/2")
+    client.get("/missing")
+    durations = request_metrics.durations()
+    assert durations[("GET", "/items/{item_id}", "200")].count >= 2
+    assert ("GET", "unmatched", "404") in durations
+    assert request_metrics.in_flight == 0
+    assert stage_timings.counts()["serialize"] >= serialized + 2
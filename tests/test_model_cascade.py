@@ -0,0 +1,69 @@
+import numpy as np
+from app.services.embedding_gallery import EmbeddingGallery
+from app.services.model_cascade import ESCALATE, REJECT, ModelCascade, cascade_decision
+
+class FakeService:
+    def __init__(self):
+        self.gallery = EmbeddingGallery(dim=4)
+    def ensure_gallery(self):
+        return self.gallery
+    def add_embeddings(self, ids, embeddings, metadatas, batch_size=1000):
+        self.gallery.add(ids, embeddings, metadatas)
+    def delete_ids(self, ids, batch_size=1000):
+        return self.gallery.remove(ids)
+
+def _cascade():
+    heavy, light = FakeService(), FakeService()
+    for service in (heavy, light):
+        service.add_embeddings(["a", "b"], np.eye(4)[:2], [{"user_id": "u1"}, {"user_id": "u2"}])
+    return ModelCascade(heavy, light)
+
+def test_light_pack_only_rejects():
+    assert cascade_decision(0.3, reject=0.35) == REJECT
+    assert cascade_decision(0.5, reject=0.35) == ESCALATE
+    # Even a near-certain light match is confirmed by buffalo_l
+    assert cascade_decision(0.99, reject=0.35) == ESCALATE
+    # A bound above verify_embeddings' threshold (cosine 0.5) is clamped to it
+    assert cascade_decision(0.55, reject=0.7) == ESCALATE
+    assert cascade_decision(0.49, reject=0.7) == REJECT
+
+def test_screen_rejects_only_when_safe():
+    cascade = _cascade()
+    hit = lambda key, score: [{"id": key, "score": score}]
+    assert cascade.screen(hit("a", 0.9)) == ESCALATE
+    assert cascade.screen(hit("a", 0.1)) == REJECT
+    assert cascade.screen(hit("a", 0.5)) == ESCALATE
+    # A main-gallery profile without a light template could be the real match: no light rejection
+    cascade.heavy.add_embeddings(["c"], np.eye(4)[2:3], [{"user_id": "u3"}])
+    assert not cascade.covers_gallery()
+    assert cascade.screen(hit("b", 0.1)) == ESCALATE
+    assert cascade.screen([]) == ESCALATE
+    cascade.store(["c", "d"], [np.eye(4)[2].tolist(), None], [{"user_id": "u3"}, {"user_id": "u4"}])
+    assert "c" in cascade.light.gallery and "d" not in cascade.light.gallery
+    assert cascade.covers_gallery()
+    assert cascade.screen(hit("b", 0.1)) == REJECT
+    assert cascade.decisions() == {REJECT: 2, ESCALATE: 4}
+
+def test_screen_user_checks_the_claimed_users_templates():
+    cascade = _cascade()
+    assert cascade.screen_user(None, "u9") == ESCALATE
+    assert cascade.screen_user([{"id": "a", "score": 0.2}], "u1") == REJECT
+    # u1 gets a second profile in the main gallery only
+    cascade.heavy.add_embeddings(["a2"], np.eye(4)[3:4], [{"user_id": "u1"}])
+    assert cascade.heavy.gallery.profile_keys("u1") == {"a", "a2"}
+    assert cascade.screen_user([{"id": "a", "score": 0.2}], "u1") == ESCALATE
+    assert cascade.screen_user([{"id": "a", "score": 0.95}], "u1") == ESCALATE
+
+def test_bound_report_counts_genuine_rejections():
+    from app.cascade_eval import bound_report, format_report
+    pairs = [
+        {"genuine": True, "light": 0.3, "heavy": 0.7},
+        {"genuine": True, "light": 0.6, "heavy": 0.8},
+        {"genuine": False, "light": 0.1, "heavy": 0.2},
+        {"genuine": False, "light": 0.45, "heavy": 0.55},
+    ]
+    report = bound_report(pairs, [0.25, 0.35])
+    assert report["heavy"] == {"false_accept_rate": 0.5, "false_reject_rate": 0.0}
+    assert report["bounds"]["0.25"] == {"light_reject_rate": 0.25, "false_reject_rate": 0.0, "overturned_heavy_matches": 0}
+    assert report["bounds"]["0.35"] == {"light_reject_rate": 0.5, "false_reject_rate": 0.5, "overturned_heavy_matches": 1}
+    assert "0.35" in format_report(report)
@@ -0,0 +1,46 @@
+import threading
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers.health import router as health_router
+from app.services.model_lifecycle import FAILED, READY, ModelLifecycle
+
+def test_components_load_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    lifecycle = ModelLifecycle()
+    # Each loader waits for the other, so this only finishes when both run at the same time
+    lifecycle.register("a", barrier.wait)
+    lifecycle.register("b", barrier.wait)
+    assert not lifecycle.ready and not lifecycle.loading
+    lifecycle.start()
+    assert lifecycle.wait(timeout=10)
+    status = lifecycle.status()
+    assert status["ready"] and lifecycle.ready and not lifecycle.loading
+    assert {c["state"] for c in status["components"].values()} == {READY}
+
+def test_failed_component_keeps_not_ready():
+    def broken():
+        raise RuntimeError("missing weights")
+    lifecycle = ModelLifecycle()
+    lifecycle.register("ok", lambda: None)
+    lifecycle.register("broken", broken)
+    lifecycle.start(background=False)
+    status = lifecycle.status()
+    assert not status["ready"]
+    assert status["components"]["broken"]["state"] == FAILED
+    assert status["components"]["broken"]["error"] == "missing weights"
+
+def test_ready_endpoint_reports_progress():
+    release = threading.Event()
+    app = FastAPI()
+    app.include_router(health_router)
+    app.state.lifecycle = ModelLifecycle()
+    app.state.lifecycle.register("insightface", release.wait)
+    app.state.lifecycle.start()
+    client = TestClient(app)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["data"]["components"]["insightface"]["state"] in ("pending", "loading")
+    assert client.get("/health").status_code == 200
+    release.set()
+    app.state.lifecycle.wait(timeout=10)
+    assert client.get("/ready").status_code == 200
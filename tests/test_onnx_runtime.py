@@ -0,0 +1,101 @@
+import numpy as np
+from insightface.app import FaceAnalysis
+from app.services.onnx_runtime import subset_face_analysis
+
+class FakeDetModel:
+    def detect(self, img, max_num=0, metric="default"):
+        return np.array([[10, 10, 100, 100, 0.9]], dtype=np.float32), np.zeros((1, 5, 2), dtype=np.float32)
+
+class FakeHead:
+    def __init__(self, taskname):
+        self.taskname = taskname
+        self.calls = 0
+    def get(self, img, face):
+        self.calls += 1
+        if self.taskname == "landmark_3d_68":
+            face.pose = np.array([5.0, -3.0, 0.0])
+
+def test_subset_shares_models_and_skips_other_tasks():
+    source = FaceAnalysis.__new__(FaceAnalysis)
+    source.model_dir = "/models"
+    source.det_model = FakeDetModel()
+    heads = {task: FakeHead(task) for task in ("landmark_3d_68", "genderage", "recognition")}
+    source.models = {"detection": source.det_model, **heads}
+    qc = subset_face_analysis(source, ("detection", "landmark_3d_68"))
+    assert qc.det_model is source.det_model
+    faces = qc.get(np.zeros((128, 128, 3), dtype=np.uint8))
+    assert list(faces[0].pose[:2]) == [5.0, -3.0]
+    assert heads["landmark_3d_68"].calls == 1
+    assert heads["genderage"].calls == 0 and heads["recognition"].calls == 0
+
+def test_warm_up_runs_every_session_at_configured_sizes():
+    from app.services.onnx_runtime import warm_up_face_analysis
+
+    class RecordingDetector:
+        def __init__(self):
+            self.sizes = []
+        def detect(self, img, input_size=None, max_num=0, metric="default"):
+            self.sizes.append((input_size, img.shape))
+
+    class FakeSession:
+        def __init__(self):
+            self.shapes = []
+        def run(self, output_names, feeds):
+            self.shapes.extend(value.shape for value in feeds.values())
+
+    class FakeRecognition:
+        input_size = (112, 112)
+        input_name = "input.1"
+        output_names = ["683"]
+        session = FakeSession()
+
+    analyzer = FaceAnalysis.__new__(FaceAnalysis)
+    analyzer.det_model = RecordingDetector()
+    analyzer.models = {"detection": analyzer.det_model, "recognition": FakeRecognition()}
+    warm_up_face_analysis(analyzer, [(640, 640), (320, 240), (640, 640)])
+    assert analyzer.det_model.sizes == [((640, 640), (640, 640, 3)), ((320, 240), (240, 320, 3))]
+    assert FakeRecognition.session.shapes == [(1, 3, 112, 112)]
+
+def test_session_config_applies_tuning_file_unless_env_set(tmp_path, monkeypatch):
+    import json
+    from app.config import settings
+    from app.services import onnx_runtime
+    tuning = tmp_path / "ort_tuning.json"
+    tuning.write_text(json.dumps({"models": {"det_10g.onnx": {"intra_op_threads": 8, "graph_optimization": "extended", "median_ms": 12.0}}}))
+    monkeypatch.setattr(settings, "ORT_TUNING_FILE", str(tuning))
+    monkeypatch.delenv("ORT_INTRA_OP_THREADS", raising=False)
+    monkeypatch.delenv("ORT_GRAPH_OPTIMIZATION", raising=False)
+    onnx_runtime.load_tuning.cache_clear()
+    config = onnx_runtime.session_config("/models/buffalo_l/det_10g.onnx")
+    assert config["intra_op_threads"] == 8 and config["graph_optimization"] == "extended"
+    assert onnx_runtime.session_config("/models/buffalo_l/w600k_r50.onnx")["intra_op_threads"] == settings.ORT_INTRA_OP_THREADS
+    monkeypatch.setenv("ORT_INTRA_OP_THREADS", "2")
+    assert onnx_runtime.session_config("/models/buffalo_l/det_10g.onnx")["intra_op_threads"] == settings.ORT_INTRA_OP_THREADS
+    options = onnx_runtime.build_session_options(config)
+    assert options.intra_op_num_threads == 8
+    assert options.graph_optimization_level == onnx_runtime.GRAPH_OPTIMIZATION_LEVELS["extended"]
+    onnx_runtime.load_tuning.cache_clear()
+
+def test_int8_files_replace_fp32_only_when_listed_in_manifest(tmp_path, monkeypatch):
+    import json
+    from app.config import settings
+    from app.services import onnx_runtime
+    monkeypatch.setattr(settings, "INT8_MODEL_DIR", "")
+    pack_dir = tmp_path / "buffalo_l"
+    assert onnx_runtime.int8_model_dir(str(pack_dir) + "/") == str(tmp_path / "buffalo_l_int8")
+    int8_dir = tmp_path / "buffalo_l_int8"
+    int8_dir.mkdir()
+    assert onnx_runtime.load_quantization_manifest(str(int8_dir)) == {}
+    (int8_dir / "det_10g.onnx").write_bytes(b"")
+    (int8_dir / onnx_runtime.QUANTIZATION_MANIFEST).write_text(json.dumps({"models": {
+        "det_10g.onnx": {"task": "detection", "input_mean": 127.5, "input_std": 128.0},
+        "w600k_r50.onnx": {"task": "recognition", "input_mean": 127.5, "input_std": 127.5},
+    }}))
+    manifest = onnx_runtime.load_quantization_manifest(str(int8_dir))
+    path, entry = onnx_runtime.resolve_model_file(str(pack_dir / "det_10g.onnx"), str(int8_dir), manifest)
+    assert path == str(int8_dir / "det_10g.onnx") and entry["input_std"] == 128.0
+    # Listed but missing on disk, or not quantized at all: the FP32 file stays
+    for name in ("w600k_r50.onnx", "2d106det.onnx"):
+        assert onnx_runtime.resolve_model_file(str(pack_dir / name), str(int8_dir), manifest) == (str(pack_dir / name), None)
+    monkeypatch.setattr(settings, "INT8_MODEL_DIR", str(tmp_path / "custom"))
+    assert onnx_runtime.int8_model_dir(str(pack_dir)) == str(tmp_path / "custom")
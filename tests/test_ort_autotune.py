@@ -0,0 +1,37 @@
+import onnx
+from onnx import TensorProto, helper
+from app.ort_autotune import candidate_grid, pick_best, thread_candidates, tune
+
+def _model(path):
+    # Per-face head shaped like the InsightFace ones: dynamic batch, fixed 3x8x8 input
+    x = helper.make_tensor_value_info("x", TensorProto.FLOAT, ["N", 3, 8, 8])
+    y = helper.make_tensor_value_info("y", TensorProto.FLOAT, ["N", 3, 8, 8])
+    graph = helper.make_graph([helper.make_node("Relu", ["x"], ["y"])], "head", [x], [y])
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), path)
+
+def test_thread_candidates_respect_worker_budget():
+    assert thread_candidates(32) == [1, 2, 4, 8, 16, 32]
+    assert thread_candidates(32, workers=4) == [1, 2, 4, 8]
+    assert thread_candidates(12, workers=2) == [1, 2, 4, 6]
+    assert thread_candidates(1, workers=8) == [1]
+
+def test_grid_and_best_pick():
+    grid = candidate_grid([1, 4], ["all"], ["sequential", "parallel"])
+    assert len(grid) == 4
+    assert {c["inter_op_threads"] for c in grid if c["execution_mode"] == "parallel"} == {2}
+    trials = [
+        {"config": {"intra_op_threads": 8, "inter_op_threads": 1}, "median_ms": 10.0},
+        {"config": {"intra_op_threads": 4, "inter_op_threads": 1}, "median_ms": 10.1},
+        {"config": {"intra_op_threads": 1, "inter_op_threads": 1}, "median_ms": 30.0},
+        {"config": {"intra_op_threads": 2, "inter_op_threads": 1}, "error": "failed"},
+    ]
+    assert pick_best(trials)["config"]["intra_op_threads"] == 4  # within 2% of the fastest, fewer threads
+    assert pick_best([{"config": {}, "error": "x"}]) is None
+
+def test_tune_times_real_sessions(tmp_path):
+    path = str(tmp_path / "head.onnx")
+    _model(path)
+    result = tune([path], candidate_grid([1, 2], ["extended"], ["sequential"]), (64, 64), batch=2, runs=3, log=lambda line: None)
+    assert set(result["models"]) == {"head.onnx"}
+    assert len(result["trials"]["head.onnx"]) == 2
+    assert all("median_ms" in trial for trial in result["trials"]["head.onnx"])
@@ -0,0 +1,55 @@
+import zipfile
+from io import BytesIO
+from app.routers import profile_verify_batch
+from app.routers.profile_verify_batch import _archive_images, _error_result, _read_entry
+
+def _archive(entries) -> zipfile.ZipFile:
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, contents in entries:
+            zf.writestr(name, contents)
+    return zipfile.ZipFile(BytesIO(buf.getvalue()))
+
+def test_archive_lists_image_entries_only():
+    zf = _archive([("a.jpg", b"1"), ("notes.txt", b"2"), ("dir/B.PNG", b"3"), ("dir/", b"")])
+    assert [info.filename for info in _archive_images(zf)] == ["a.jpg", "dir/B.PNG"]
+
+def test_oversized_entries_are_not_decompressed(monkeypatch):
+    monkeypatch.setattr(profile_verify_batch, "MAX_SIZE", 1024)
+    zf = _archive([("small.jpg", b"x" * 1024), ("bomb.jpg", b"\0" * 1_000_000)])
+    small, bomb = zf.infolist()
+    assert _read_entry(zf, small) == b"x" * 1024
+    monkeypatch.setattr(zf, "open", lambda *args: (_ for _ in ()).throw(AssertionError("decompressed")))
+    assert _read_entry(zf, bomb) is None
+
+def test_error_rows_carry_the_model_tier():
+    row = _error_result(3, "a.jpg", 415, "Unsupported file type.")
+    assert row["model_tier"] == "heavy" and row["failure_reason"] == "invalid_image"
+
+def test_oversized_entries_have_their_own_failure_reason():
+    row = _error_result(0, "big.jpg", 413, "File too large. Max 10MB allowed.")
+    assert row["failure_reason"] == "file_too_large" and row["error"]["code"] == 413
+    assert _error_result(1, "x.jpg", 422, "No face detected.")["failure_reason"] == "face_analysis_error"
+
+def test_archive_over_the_total_limit_is_refused_before_reading(monkeypatch):
+    import asyncio
+    import pytest
+    from fastapi import HTTPException
+    monkeypatch.setattr(profile_verify_batch, "MAX_SIZE", 100)
+    monkeypatch.setattr(profile_verify_batch.settings, "VERIFY_BATCH_MAX_FILES", 2)
+    class FakeUpload:
+        def __init__(self, data, size):
+            self.data, self.size, self.reads = data, size, []
+        async def read(self, size=-1):
+            self.reads.append(size)
+            return self.data[:size]
+    declared = FakeUpload(b"x" * 201, 201)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(profile_verify_batch._read_archive(declared))
+    assert e.value.status_code == 413 and declared.reads == []
+    # Without a declared size, reading stops one byte past the limit
+    streamed = FakeUpload(b"x" * 10_000, None)
+    with pytest.raises(HTTPException):
+        asyncio.run(profile_verify_batch._read_archive(streamed))
+    assert streamed.reads == [201]
+    assert asyncio.run(profile_verify_batch._read_archive(FakeUpload(b"x" * 200, 200))) == b"x" * 200
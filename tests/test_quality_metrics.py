@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+from app.services.image_decoding import DecodedImage
+from app.services.quality_metrics import face_quality, face_roi_gray, quality_failure, quality_metrics
+
+def _checkerboard(size: int = 192, cell: int = 8) -> np.ndarray:
+    board = ((np.indices((size, size)) // cell).sum(axis=0) % 2 * 160 + 40).astype(np.uint8)
+    return np.repeat(board[..., None], 3, axis=2)
+
+def test_metrics_from_histogram_match_numpy():
+    gray = np.random.default_rng(0).integers(0, 256, (64, 64), dtype=np.uint8)
+    metrics = quality_metrics(gray)
+    assert np.isclose(metrics["brightness"], gray.mean())
+    assert np.isclose(metrics["contrast"], gray.std())
+    assert np.isclose(metrics["dark_clipped"], (gray <= 16).mean())
+    assert np.isclose(metrics["bright_clipped"], (gray >= 239).mean())
+    assert np.isclose(metrics["sharpness"], cv2.Laplacian(gray, cv2.CV_64F).var(), rtol=1e-4)
+
+def test_blur_lowers_sharpness():
+    sharp = _checkerboard()
+    blurred = cv2.GaussianBlur(sharp, (0, 0), 4)
+    assert face_quality(sharp)["sharpness"] > face_quality(blurred)["sharpness"]
+    assert quality_failure(face_quality(sharp)) is None
+    assert quality_failure(face_quality(blurred)) == "blurry"
+
+def test_lighting_failures():
+    assert quality_failure(face_quality(np.full((64, 64, 3), 10, np.uint8))) in ("blurry", "bad_light")
+    assert quality_failure({"sharpness": 500.0, "brightness": 30.0, "contrast": 40.0, "dark_clipped": 0.0, "bright_clipped": 0.0}) == "bad_light"
+    assert quality_failure({"sharpness": 500.0, "brightness": 120.0, "contrast": 40.0, "dark_clipped": 0.2, "bright_clipped": 0.2}) == "bad_light"
+    assert quality_failure({"sharpness": 500.0, "brightness": 120.0, "contrast": 2.0, "dark_clipped": 0.0, "bright_clipped": 0.0}) == "low_contrast"
+
+def test_roi_uses_face_box_in_full_resolution_coordinates():
+    rgb = np.zeros((200, 200, 3), np.uint8)
+    rgb[50:100, 50:100] = 200  # the "face", at half the full-resolution coordinates
+    image = DecodedImage(rgb, scale=2.0)
+    roi = face_roi_gray(image, [100, 100, 200, 200], size=32, margin=1.0)
+    assert roi.shape == (32, 32)
+    assert roi.min() > 150
+    assert face_roi_gray(rgb, size=32).shape == (32, 32)
@@ -0,0 +1,89 @@
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from app.quantize_models import (
+    BlobCalibrationReader,
+    calibration_blobs,
+    decision_agreement,
+    iou,
+    pair_decisions,
+    quantize_model,
+    value_summary,
+)
+
+def _conv_model(path):
+    # Small fully convolutional model with a dynamic batch, like the per-face heads
+    rng = np.random.default_rng(0)
+    weight = numpy_helper.from_array(rng.normal(size=(4, 3, 3, 3)).astype(np.float32), "w")
+    x = helper.make_tensor_value_info("x", TensorProto.FLOAT, ["N", 3, 16, 16])
+    y = helper.make_tensor_value_info("y", TensorProto.FLOAT, ["N", 4, 14, 14])
+    nodes = [helper.make_node("Conv", ["x", "w"], ["c"]), helper.make_node("Relu", ["c"], ["y"])]
+    graph = helper.make_graph(nodes, "head", [x], [y], initializer=[weight])
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), path)
+
+def test_reader_serves_blobs_then_none_and_honours_ranges():
+    blobs = [np.full((1, 3, 2, 2), i, dtype=np.float32) for i in range(3)]
+    reader = BlobCalibrationReader("x", blobs)
+    assert len(reader) == 3
+    assert [reader.get_next()["x"][0, 0, 0, 0] for _ in range(3)] == [0, 1, 2]
+    assert reader.get_next() is None
+    reader.set_range(1, 10)
+    assert reader.get_next()["x"][0, 0, 0, 0] == 1
+    reader.rewind()
+    assert reader.get_next()["x"][0, 0, 0, 0] == 0
+
+def test_calibration_blobs_letterbox_augmented_images():
+    class FakeDet:
+        input_mean, input_std = 127.5, 128.0
+    class FakeAnalyzer:
+        det_model = FakeDet()
+    image = np.full((40, 80, 3), 255, dtype=np.uint8)
+    blobs = calibration_blobs(FakeAnalyzer(), "detection", [image], (64, 64), max_samples=3)
+    assert len(blobs) == 3  # original, mirror and darker copy; capped by max_samples
+    assert blobs[0].shape == (1, 3, 64, 64)
+    # Letterboxed at the top: the image fills 32 rows, the padding normalizes to -mean / std
+    assert np.allclose(blobs[0][0, :, :32], 127.5 / 128.0) and np.allclose(blobs[0][0, :, 32:], -127.5 / 128.0)
+
+def test_static_quantization_stays_close_to_fp32(tmp_path):
+    import onnxruntime
+    source, target = str(tmp_path / "head.onnx"), str(tmp_path / "head_int8.onnx")
+    _conv_model(source)
+    rng = np.random.default_rng(1)
+    blobs = [rng.uniform(-1, 1, size=(1, 3, 16, 16)).astype(np.float32) for _ in range(8)]
+    quantize_model(source, target, "static", BlobCalibrationReader("x", blobs))
+    quantized = onnx.load(target)
+    assert any(node.op_type == "QuantizeLinear" for node in quantized.graph.node)
+    fp32 = onnxruntime.InferenceSession(source, providers=["CPUExecutionProvider"])
+    int8 = onnxruntime.InferenceSession(target, providers=["CPUExecutionProvider"])
+    expected, actual = fp32.run(None, {"x": blobs[0]})[0], int8.run(None, {"x": blobs[0]})[0]
+    cos = float(np.dot(expected.ravel(), actual.ravel()) / (np.linalg.norm(expected) * np.linalg.norm(actual)))
+    assert cos > 0.99
+
+def test_pair_decisions_and_agreement():
+    base = np.eye(4, 8, dtype=np.float32)
+    fp32 = {"a": base[0], "b": base[0] + 0.1 * base[1], "c": base[2]}
+    int8 = {"a": base[0], "b": base[0] + 3.0 * base[1], "c": base[2]}
+    reference = pair_decisions(fp32)
+    assert reference == {("a", "b"): True, ("a", "c"): False, ("b", "c"): False}
+    agreement = decision_agreement(reference, pair_decisions(int8))
+    assert agreement["pairs"] == 3 and agreement["flipped"] == ["a vs b: match -> no match"]
+    assert abs(agreement["agreement"] - 2 / 3) < 1e-9
+    cross = pair_decisions(fp32, int8)
+    assert len(cross) == 9 and cross[("a", "a")] and not cross[("b", "b")]
+
+def test_iou_and_summary():
+    assert iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert abs(iou([0, 0, 10, 10], [5, 0, 15, 10]) - 50 / 150) < 1e-9
+    assert iou([0, 0, 1, 1], [2, 2, 3, 3]) == 0.0
+    assert value_summary([]) == {"count": 0}
+    assert value_summary([1.0, 3.0]) == {"count": 2, "mean": 2.0, "min": 1.0, "max": 3.0}
+
+def test_pack_available_reports_a_missing_pack(monkeypatch):
+    import insightface.utils
+    from app.quantize_models import pack_available
+    def offline(*args, **kwargs):
+        raise OSError("Name or service not known")
+    monkeypatch.setattr(insightface.utils, "ensure_available", offline)
+    messages = []
+    assert not pack_available("buffalo_l", "/nowhere", messages.append)
+    assert "could not be downloaded" in messages[0]
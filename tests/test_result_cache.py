@@ -0,0 +1,121 @@
+import io
+import os
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.services.result_cache import ResultCache, content_key
+
+def test_content_key_is_stable():
+    assert content_key(b"frame") == content_key(b"frame")
+    assert content_key(b"frame") != content_key(b"frame2")
+    assert len(content_key(b"")) == 32
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "face", {"embedding": [1.0]})
+    cache.put("b", "face", {"embedding": [2.0]})
+    assert cache.get("a", "face") == {"embedding": [1.0]}
+    cache.put("c", "face", {"embedding": [3.0]})  # evicts "b", the least recently used
+    assert cache.get("b", "face") is None
+    assert cache.get("c", "face") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["kinds"]["face"]["hits"] == 2 and stats["kinds"]["face"]["misses"] == 1
+
+def test_returned_dicts_are_copies():
+    cache = ResultCache()
+    cache.put("a", "face", {"embedding": [1.0], "face": {"bbox": [0, 0, 1, 1]}})
+    cache.get("a", "face").pop("face")
+    assert "face" in cache.get("a", "face")
+
+def test_ttl_expiry(monkeypatch):
+    cache = ResultCache(ttl_seconds=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put("a", "spoof", {"dominant_spoof": "Real"})
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a", "spoof") is None
+
+def test_disk_tier_shared_between_instances(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put("abcd", "spoof", {"dominant_spoof": "Real"})
+    other = ResultCache(disk_dir=str(tmp_path))
+    assert other.get("abcd", "spoof") == {"dominant_spoof": "Real"}
+    assert not [f for f in os.listdir(tmp_path / "ab") if f.endswith(".tmp")]
+
+def test_nested_values_are_not_shared_with_callers():
+    cache = ResultCache()
+    result = {"embedding": [1.0, 2.0], "face": {"bbox": [0, 0, 1, 1]}}
+    cache.put("a", "face", result)
+    result["embedding"][0] = 9.0
+    cache.get("a", "face")["face"]["bbox"].append(5)
+    assert cache.get("a", "face") == {"embedding": [1.0, 2.0], "face": {"bbox": [0, 0, 1, 1]}}
+
+def test_disk_sweep_removes_expired_and_oldest_files(tmp_path):
+    cache = ResultCache(ttl_seconds=60, disk_dir=str(tmp_path), disk_max_entries=2)
+    for key in ("aa01", "bb02", "cc03", "dd04"):
+        cache.put(key, "face", {"key": key})
+    # Written long ago and never read again
+    stale = os.path.join(tmp_path, "aa", "aa01.face.json")
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+    os.utime(os.path.join(tmp_path, "bb", "bb02.face.json"), (time.time() - 30, time.time() - 30))
+    sessions = tmp_path / "enroll_sessions"
+    sessions.mkdir()
+    (sessions / "session.json").write_text("{}")
+    os.utime(sessions / "session.json", (time.time() - 120, time.time() - 120))
+    assert cache.sweep_disk() == 2
+    remaining = sorted(f for d in ("aa", "bb", "cc", "dd") for f in os.listdir(tmp_path / d))
+    assert remaining == ["cc03.face.json", "dd04.face.json"]
+    assert (sessions / "session.json").exists()
+
+def test_disk_tier_is_swept_while_writing(tmp_path, monkeypatch):
+    from app.services import result_cache
+    monkeypatch.setattr(result_cache, "DISK_SWEEP_EVERY", 2)
+    cache = ResultCache(disk_dir=str(tmp_path), disk_max_entries=1)
+    for i in range(4):
+        cache.put(f"{i:02x}ff", "face", {"i": i})
+    files = [f for d in os.listdir(tmp_path) for f in os.listdir(tmp_path / d)]
+    assert len(files) <= 2
+
+def test_disabled_cache():
+    cache = ResultCache(max_entries=0)
+    cache.put("a", "face", {"x": 1})
+    assert cache.get("a", "face") is None
+
+def test_put_keeps_its_own_copy():
+    cache = ResultCache()
+    result = {"embedding": [1.0], "face": {"bbox": [0, 0, 1, 1]}}
+    cache.put("a", "face", result)
+    result.pop("face")
+    assert "face" in cache.get("a", "face")
+
+def test_create_profile_retry_is_served_from_the_cache(monkeypatch):
+    from app.routers import profile_create
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    analyses = []
+    async def analyze_face_async(img):
+        analyses.append(img)
+        return {"embedding": [1.0, 0.0], "gender": "female", "face": {"bbox": [0, 0, 1, 1]}}
+
+    monkeypatch.setattr(profile_create, "result_cache", ResultCache())
+    monkeypatch.setattr(profile_create, "run_in_model_thread", run_inline)
+    monkeypatch.setattr(profile_create, "analyze_face_async", analyze_face_async)
+    monkeypatch.setattr(profile_create, "analyze_spoof_face", lambda model, image, face: {"dominant_spoof": "Real", "age": 30})
+    monkeypatch.setattr(profile_create.chromadb_service, "add_embedding", lambda *args: None)
+    monkeypatch.setattr(profile_create.settings, "CASCADE_ENABLED", False)
+    app = FastAPI()
+    app.include_router(profile_create.router)
+    app.state.spoof_model = object()
+    client = TestClient(app)
+
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32)).save(buf, format="JPEG")
+    upload = {"file": ("face.jpg", buf.getvalue(), "image/jpeg")}
+    first, second = client.post("/v1/create-profile", files=upload), client.post("/v1/create-profile", files=upload)
+    assert first.status_code == second.status_code == 200
+    assert "face" not in second.json()["data"]
+    assert len(analyses) == 1
+    assert "face" in profile_create.result_cache.get(content_key(buf.getvalue()), "face")
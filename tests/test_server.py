@@ -0,0 +1,31 @@
+import os
+from app import server
+
+def test_thread_budget_splits_cores(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 32)
+    assert server.thread_budget(1) == 32
+    assert server.thread_budget(4) == 8
+    assert server.thread_budget(64) == 1
+    assert server.thread_budget(0) == 32
+
+def test_apply_thread_budget_respects_explicit_env(monkeypatch):
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ORT_INTRA_OP_THREADS",
+                "ORT_INTER_OP_THREADS", "TF_INTRA_OP_THREADS", "TF_INTER_OP_THREADS"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("TF_INTRA_OP_THREADS", "3")
+    server.apply_thread_budget(2)
+    assert os.environ["OMP_NUM_THREADS"] == "2"
+    assert os.environ["ORT_INTRA_OP_THREADS"] == "2"
+    assert os.environ["ORT_INTER_OP_THREADS"] == "1"
+    assert os.environ["TF_INTRA_OP_THREADS"] == "3"
+
+def test_run_hands_the_workers_to_uvicorn(monkeypatch):
+    import sys
+    import types
+    calls = []
+    monkeypatch.setitem(sys.modules, "uvicorn", types.SimpleNamespace(run=lambda app, **kwargs: calls.append((app, kwargs))))
+    monkeypatch.setattr(server, "apply_thread_budget", lambda threads: None)
+    monkeypatch.setenv("WORKERS", "1")
+    server.run(3, "127.0.0.1", 8123)
+    assert calls == [("app.main:app", {"host": "127.0.0.1", "port": 8123, "workers": 3})]
+    assert os.environ["WORKERS"] == "3"
@@ -0,0 +1,23 @@
+import numpy as np
+from app.spoof_eval import agreement, evaluate, format_report, summarize
+from tests.test_spoof_model import FakeSpoofModel
+
+def test_summarize_counts_errors_as_rejections():
+    labels = {"r1": "real", "r2": "real", "s1": "spoof", "s2": "spoof"}
+    metrics = summarize(labels, {"r1": "Real", "r2": None, "s1": "Fake", "s2": "Real"})
+    assert metrics == {"samples": {"real": 2, "spoof": 2}, "errors": 1, "accuracy": 0.5, "apcer": 0.5, "bpcer": 0.5}
+
+def test_agreement_lists_differing_samples():
+    assert agreement({"a": "Real", "b": "Fake"}, {"a": "Real", "b": "Real"}) == {"rate": 0.5, "differing": ["b"]}
+
+def test_evaluate_compares_frame_and_crop():
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    samples = [("real.jpg", "real", image), ("spoof.jpg", "spoof", image), ("empty.jpg", "real", image)]
+    face = {"bbox": [10, 10, 50, 50], "kps": None}
+    # The cascade finds no face, so only the crop (which skips it) reaches the classifier
+    report = evaluate(FakeSpoofModel(n_faces=0), samples, {"real.jpg": face, "spoof.jpg": face, "empty.jpg": None})
+    assert report["no_face"] == ["empty.jpg"]
+    assert report["inputs"]["frame"]["errors"] == 3 and report["inputs"]["frame"]["bpcer"] == 1.0
+    assert report["inputs"]["crop"]["apcer"] == 1.0 and report["inputs"]["crop"]["bpcer"] == 0.5
+    assert report["agreement"]["differing"] == ["real.jpg", "spoof.jpg"]
+    assert "frame" in format_report(report)
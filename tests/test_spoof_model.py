@@ -0,0 +1,82 @@
+import numpy as np
+from app.config import settings
+from app.services import spoof_model
+from app.services.spoof_model import analyze_spoof, analyze_spoof_face, spoof_cache_kind, spoof_face_crop, warm_up_spoof_model
+from app.services.image_decoding import DecodedImage
+
+class FakeCascade:
+    def __init__(self, n_faces=1):
+        self.n_faces = n_faces
+    def detectMultiScale(self, gray, **kwargs):
+        return [(0, 0, 30, 30)] * self.n_faces
+
+class FakeSpoofModel:
+    def __init__(self, n_faces=1, real_prob=0.9):
+        self.face_cascade = FakeCascade(n_faces)
+        self.inputs = []
+        def age_gender(batch, training=False):
+            self.inputs.append(batch.shape)
+            age = np.zeros((1, 100), dtype=np.float32)
+            age[0, 42] = 1.0
+            return [age, np.array([[0.8, 0.2]], dtype=np.float32)]
+        def anti_spoofing(batch, training=False):
+            self.inputs.append(batch.shape)
+            return np.array([[real_prob]], dtype=np.float32)
+        self.age_gender_model = age_gender
+        self.anti_spoofing_model = anti_spoofing
+
+def test_analyze_spoof_real():
+    model = FakeSpoofModel()
+    result = analyze_spoof(model, np.zeros((240, 320, 3), dtype=np.uint8))
+    assert result["dominant_spoof"] == "Real"
+    assert result["dominant_gender"] == "Male"
+    assert result["age"] == 42
+    assert model.inputs == [(1, 96, 96, 3), (1, 128, 128, 3)]
+
+def test_analyze_spoof_fake():
+    result = analyze_spoof(FakeSpoofModel(real_prob=0.1), np.zeros((64, 64, 3), dtype=np.uint8), channels="BGR")
+    assert result["dominant_spoof"] == "Fake"
+
+def test_analyze_spoof_face_checks():
+    assert analyze_spoof(FakeSpoofModel(n_faces=0), np.zeros((64, 64, 3), dtype=np.uint8)) == {"error": "No face detected"}
+    assert analyze_spoof(FakeSpoofModel(n_faces=2), np.zeros((64, 64, 3), dtype=np.uint8)) == {"error": "Multiple faces detected"}
+    # Face crops skip the cascade check
+    assert analyze_spoof(FakeSpoofModel(n_faces=0), np.zeros((64, 64, 3), dtype=np.uint8), detect_face=False)["dominant_spoof"] == "Real"
+
+def test_warm_up_spoof_model():
+    model = FakeSpoofModel()
+    warm_up_spoof_model(model)
+    assert model.inputs == [(1, 96, 96, 3), (1, 128, 128, 3)]
+
+def test_spoof_face_crop_is_centered_and_level():
+    image = np.zeros((400, 400, 3), dtype=np.uint8)
+    image[150:250, 150:250] = 255  # the "face"
+    face = {"bbox": [150, 150, 250, 250], "kps": [[175, 180], [225, 180], [200, 200], [180, 225], [220, 225]]}
+    crop = spoof_face_crop(image, face, size=128, margin=2.0)
+    assert crop.shape == (128, 128, 3)
+    assert crop[64, 64, 0] == 255 and crop[5, 5, 0] == 0
+    assert abs(int((crop[..., 0] > 127).sum()) - 64 * 64) < 300
+    # Coordinates are full-resolution; a reduced decode is cropped at its own scale
+    reduced = DecodedImage(np.ascontiguousarray(image[::2, ::2]), scale=2.0)
+    full_res_face = {"bbox": [150, 150, 250, 250], "kps": None}
+    assert spoof_face_crop(reduced, full_res_face, size=128, margin=2.0)[64, 64, 0] == 255
+
+def test_analyze_spoof_face_skips_cascade():
+    model = FakeSpoofModel(n_faces=0)
+    face = {"bbox": [10, 10, 50, 50], "kps": [[20, 25], [40, 25], [30, 35], [22, 42], [38, 42]]}
+    result = analyze_spoof_face(model, np.zeros((64, 64, 3), dtype=np.uint8), face, spoof_input="crop")
+    assert result["dominant_spoof"] == "Real"
+
+def test_analyze_spoof_face_defaults_to_the_full_resolution_frame(monkeypatch):
+    monkeypatch.setattr(settings, "SPOOF_INPUT", "frame")
+    full = np.zeros((400, 400, 3), dtype=np.uint8)
+    image = DecodedImage(np.ascontiguousarray(full[::2, ::2]), scale=2.0, load_full=lambda: full)
+    face = {"bbox": [100, 100, 300, 300], "kps": None}
+    seen = []
+    monkeypatch.setattr(spoof_model, "analyze_spoof", lambda model, rgb, channels="RGB", detect_face=True: seen.append((rgb.shape, detect_face)) or {})
+    analyze_spoof_face(FakeSpoofModel(), image, face)
+    analyze_spoof_face(FakeSpoofModel(), image, face, spoof_input="crop")
+    assert seen == [((400, 400, 3), True), ((128, 128, 3), False)]
+    assert spoof_cache_kind() == "spoof"
+    monkeypatch.setattr(settings, "SPOOF_INPUT", "crop")
+    assert spoof_cache_kind() == "spoof_crop"
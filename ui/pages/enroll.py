@@ -47,6 +47,14 @@ with st.form(key="enroll_metadata_form", clear_on_submit=False):
 if "enroll_name" not in st.session_state or not st.session_state["enroll_name"].strip():
     st.stop()
 
+# --- Server-side enrollment session: QC results are kept there, so frames are uploaded only once ---
+if "enroll_session_id" not in st.session_state:
+    r = requests.post("http://localhost:8000/enroll/sessions")
+    if not r.ok:
+        st.error(f"Could not start an enrollment session: {r.text}")
+        st.stop()
+    st.session_state["enroll_session_id"] = r.json()["session_id"]
+
 # --- Guided pose capture and QC using st.camera_input ---
 for pose in POSES:
     if not isinstance(st.session_state.pose_buckets[pose], np.ndarray):
@@ -70,7 +78,18 @@ for pose in POSES:
             img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
             rgb = img[:, :, ::-1]
             # QC call for this pose (pose check is handled by backend, but user is guided only)
-            res = requests.post(f"http://localhost:8000/enroll/qc/{pose}", files={"frame": (f"{pose}.jpg", cv2.imencode(".jpg", rgb[..., ::-1])[1].tobytes(), "image/jpeg")}).json()
+            r = requests.post(
+                f"http://localhost:8000/enroll/qc/{pose}",
+                params={"session_id": st.session_state["enroll_session_id"]},
+                files={"frame": (f"{pose}.jpg", cv2.imencode(".jpg", rgb[..., ::-1])[1].tobytes(), "image/jpeg")},
+            )
+            if r.status_code == 404:
+                # Session expired: start over with a new one
+                st.warning("Enrollment session expired, please capture the poses again.")
+                del st.session_state["enroll_session_id"]
+                st.session_state.pose_buckets = {p: False for p in POSES}
+                st.rerun()
+            res = r.json()
             if res.get("ok"):
                 st.session_state.pose_buckets[pose] = rgb
                 st.success(f"{pose.capitalize()} accepted!")
@@ -81,24 +100,31 @@ for pose in POSES:
 
 # --- Enroll once all five accepted ---
 if all(isinstance(st.session_state.pose_buckets[p], np.ndarray) for p in POSES):
-    frames_dict = {p: st.session_state.pose_buckets[p].tolist() for p in POSES}
+    # The embeddings were computed during QC; finalizing the session only stores them
     try:
         r = requests.post(
-            "http://localhost:8000/v1/profile-create-5poses",
-            json={
-                "frames": frames_dict,
+            f"http://localhost:8000/v1/profile-create-5poses/session/{st.session_state['enroll_session_id']}",
+            data={
                 "name": st.session_state["enroll_name"],
                 # Optionally add user_id, extra here if desired
             }
         )
         if r.ok:
+            del st.session_state["enroll_session_id"]
             st.success("Profile created successfully! Redirecting to landing page...")
             time.sleep(5)
             st.switch_page("landing.py")
-        else:
+        elif r.status_code != 404:
             st.error(f"Enroll failed: {r.text}")
     except Exception as e:
+        r = None
         st.error(f"Failed to enroll: {e}")
+    if r is not None and r.status_code == 404:
+        # Session expired: retrying it can only fail again, so start over with a new one
+        st.warning("Enrollment session expired, please capture the poses again.")
+        del st.session_state["enroll_session_id"]
+        st.session_state.pose_buckets = {p: False for p in POSES}
+        st.rerun()
 
 # --- Pose-wheel colouring ---
 segments = ''.join([